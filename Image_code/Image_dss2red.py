@@ -4,6 +4,13 @@ from astropy.coordinates import SkyCoord, Angle
 from astropy import units as u
 import os
 from tqdm import tqdm
+try:
+    from stage_metrics import span
+except ImportError:  # stage_metrics.py sits at the repository root, run untimed without it
+    from contextlib import nullcontext
+    from types import SimpleNamespace
+    def span(stage, **labels):
+        return nullcontext(SimpleNamespace(count=lambda items=1, **counters: None))
 
 # Configuration
 FOV = 0.12 * u.deg
@@ -12,15 +19,17 @@ HEIGHT_PX = 768
 OUTPUT_DIR = "dss2_agn_red"
 CSV_PATH = r"C:\Users\tosee\Downloads\123\data\master_optical_agncan.csv"
 
-# Setup output directory
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+def fetch_images(csv_path=CSV_PATH, output_dir=OUTPUT_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    df = pd.read_csv(csv_path)
 
-def fetch_images():
-    df = pd.read_csv(CSV_PATH)
+    with span("fetch_images", survey="CDS/P/DSS2/red") as metrics:
+        _fetch_rows(df, metrics, output_dir)
 
+def _fetch_rows(df, metrics, output_dir):
     for _, row in tqdm(df.iterrows(), total=len(df)):
         sn_name = row['sn_name']
-        output_path = os.path.join(OUTPUT_DIR, f"{sn_name}.fits")
+        output_path = os.path.join(output_dir, f"{sn_name}.fits")
 
 
         position = SkyCoord(ra=row['ra_deg'], dec=row['dec_deg'], unit='deg')
@@ -37,8 +46,10 @@ def fetch_images():
                 format="fits"
             )
             result.writeto(output_path, overwrite=True)
+            metrics.count(1, bytes_written=os.path.getsize(output_path))
             tqdm.write(f"Downloaded {sn_name} successfully.")
         except Exception as e:
+            metrics.count(0, failed=1)
             tqdm.write(f"Failed {sn_name}: {str(e)}")
 
 if __name__ == "__main__":
@@ -12,17 +12,15 @@ HEIGHT_PX = 768
 OUTPUT_DIR = "sdss_agn_r"
 CSV_PATH = r"C:\Users\tosee\Downloads\123\data\Final_agn_data_with_oid.csv"
 
-# Setup output directory
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-def fetch_images():
-    df = pd.read_csv(CSV_PATH)
+def fetch_images(csv_path=CSV_PATH, output_dir=OUTPUT_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    df = pd.read_csv(csv_path)
     df['discovery_date'] = pd.to_datetime(df['discovery_date'], errors='coerce')
     df = df[df['discovery_date'] < pd.to_datetime("2010-01-01")] 
 
     for _, row in tqdm(df.iterrows(), total=len(df)):
         sn_name = row['sn_name']
-        output_path = os.path.join(OUTPUT_DIR, f"{sn_name}.fits")
+        output_path = os.path.join(output_dir, f"{sn_name}.fits")
 
         # Skip if file already exists
         if os.path.exists(output_path):
@@ -13,11 +13,9 @@ OUTPUT_DIR = r"C:\Users\tosee\Downloads\123\testing_triplets\xray_agn_data"
 CSV_PATH = r"C:\Users\tosee\Downloads\123\testing_triplets\Test_xray_agn.csv"
 OBS_ID_COL = 'obs_id' 
 
-# Setup output directory
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-def fetch_images():
-    df = pd.read_csv(CSV_PATH)
+def fetch_images(csv_path=CSV_PATH, output_dir=OUTPUT_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    df = pd.read_csv(csv_path)
 
     # Check if the observation ID column exists
     if OBS_ID_COL not in df.columns:
@@ -26,7 +24,7 @@ def fetch_images():
 
     for index, row in tqdm(df.iterrows(), total=len(df)):
         obs_id = str(row[OBS_ID_COL]) 
-        output_path = os.path.join(OUTPUT_DIR, f"{obs_id}.fits")
+        output_path = os.path.join(output_dir, f"{obs_id}.fits")
 
         # Skip if file already exists
         if os.path.exists(output_path):
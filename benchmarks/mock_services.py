@@ -0,0 +1,125 @@
+import io
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import urllib.request
+from urllib.parse import urlencode
+import numpy as np
+from astropy import units as u
+from astropy.io import fits
+from astropy.table import Table
+from scipy.spatial import cKDTree
+from synthetic_data import star_field, cutout_header
+
+# Configuration
+LATENCY_SECONDS = 0.05     # per request, roughly a round trip to CDS / IRSA
+
+def _unit_vectors(ra_deg, dec_deg):
+    ra, dec = np.radians(ra_deg), np.radians(dec_deg)
+    return np.column_stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)])
+
+class MockServices:
+    """
+    Local stand-ins for the remote services the pipeline calls:
+
+    - /hips2fits?hips=&ra=&dec=&width=&height=&fov=  returns a synthetic FITS cutout
+      (seeded by position, so repeated requests return the same image) like hips2fits.
+    - /irsa/cone?ra=&dec=&radius=  returns the rows of `catalog` (with ra / dec columns,
+      see synthetic_data.ztf_objects) within `radius` degrees as CSV, like an IRSA cone
+      search. MockIrsa wraps it in astroquery's Irsa interface.
+
+    Every request waits `latency` seconds first, so fetch stages can be benchmarked for
+    concurrency rather than raw server speed.
+    """
+
+    def __init__(self, catalog=None, latency=LATENCY_SECONDS, host="127.0.0.1", port=0):
+        self.catalog = catalog
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.tree = cKDTree(_unit_vectors(catalog["ra"], catalog["dec"])) if catalog is not None else None
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                with services.lock:
+                    services.requests += 1
+                time.sleep(services.latency)
+                try:
+                    if url.path == "/hips2fits":
+                        body, content_type = services.cutout(query), "application/fits"
+                    elif url.path == "/irsa/cone":
+                        body, content_type = services.cone(query), "text/csv"
+                    else:
+                        self.send_error(404)
+                        return
+                except (KeyError, ValueError) as e:
+                    self.send_error(400, str(e))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def cutout(self, query):
+        ra, dec = float(query["ra"]), float(query["dec"])
+        shape = (int(query.get("height", 256)), int(query.get("width", 256)))
+        rng = np.random.default_rng(int(abs(ra * 1e5)) * 1000003 + int(abs(dec * 1e5)))
+        image, _ = star_field(rng, shape)
+        buffer = io.BytesIO()
+        fits.PrimaryHDU(image, header=cutout_header(ra, dec, shape, float(query.get("fov", 0.12)))).writeto(buffer)
+        return buffer.getvalue()
+
+    def cone(self, query):
+        if self.tree is None:
+            return b""
+        ra, dec, radius = float(query["ra"]), float(query["dec"]), float(query["radius"])
+        chord = 2 * np.sin(np.radians(radius) / 2)
+        rows = self.tree.query_ball_point(_unit_vectors([ra], [dec])[0], chord)
+        return self.catalog.iloc[sorted(rows)].to_csv(index=False).encode()
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logging.info(f"Mock services on {self.url}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class MockIrsa:
+    """Stand-in for astroquery's Irsa whose query_region is a cone search on MockServices."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def query_region(self, coordinates, catalog=None, radius="30 arcsec", columns=None):
+        query = {"ra": coordinates.ra.deg, "dec": coordinates.dec.deg, "radius": u.Quantity(radius).to_value(u.deg)}
+        with urllib.request.urlopen(f"{self.url}/irsa/cone?{urlencode(query)}") as response:
+            body = response.read()
+        if not body.strip():
+            return Table()
+        table = Table.read(body.decode(), format="ascii.csv")
+        if columns:
+            table = table[[c.strip() for c in columns.split(",")]]
+        return table
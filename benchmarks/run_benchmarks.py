@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+import importlib.util
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from astropy.coordinates import SkyCoord
+from astropy import units as u
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in (ROOT, os.path.join(ROOT, "extra_normalisation"), os.path.join(ROOT, "data_normalisation_code")):
+    sys.path.insert(0, folder)
+
+import stage_metrics
+from synthetic_data import (xray_table, optical_table, ztf_objects, with_duplicates, cutout_pairs, write_cutouts)
+from mock_services import MockServices, MockIrsa
+from check_image_quality import evaluate_triplet_stack
+from resize_images import resize_batch
+from build_triplets import make_triplets
+from fits_quality_scan import scan_fits_files
+from master_file_deduplicate import deduplicate_by_completeness
+from Get_extra_info import enrich_catalog
+
+# Configuration
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+RESULTS_FILE = os.path.join(BENCHMARK_DIR, "results", "latest.json")
+METRICS_FILE = os.path.join(BENCHMARK_DIR, "results", "benchmark_metrics.jsonl")
+SCALES = {
+    "small": {"optical": 1000, "xray": 2000, "cutouts": 16, "enrich": 32},
+    "medium": {"optical": 10000, "xray": 20000, "cutouts": 64, "enrich": 128},
+    "large": {"optical": 100000, "xray": 200000, "cutouts": 256, "enrich": 512},
+}
+ROWWISE_PARSE_LIMIT = 500     # rows parsed one SkyCoord at a time, as tns_degree.py does
+FETCH_WORKERS = 8
+ENRICH_RATE = 1000            # queries per second, high enough that the token bucket does not set the time
+REPEATS = 3
+REGRESSION_THRESHOLD = 0.25   # flag stages more than 25% slower than the baseline
+MIN_FLAG_SECONDS = 0.1        # stages faster than this are too noisy to flag
+SEED = 1234
+
+def _load_script(name, filename):
+    """Import a pipeline script whose filename is not a valid module name (e.g. Re-crossmatch.py)."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, "data_normalisation_code", filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _fetch(url, path):
+    with urllib.request.urlopen(url) as response, open(path, "wb") as f:
+        f.write(response.read())
+    return os.path.getsize(path)
+
+def run_scale(scale, sizes, workdir):
+    """Generate one scale of synthetic data and time every stage on it."""
+    rng = np.random.default_rng(SEED)
+    xray = xray_table(rng, sizes["xray"])
+    optical = optical_table(rng, sizes["optical"], xray)
+    optical_csv, xray_csv = os.path.join(workdir, "optical.csv"), os.path.join(workdir, "xray.csv")
+    optical.to_csv(optical_csv, index=False)
+    xray.to_csv(xray_csv, index=False)
+    science, reference = cutout_pairs(rng, sizes["cutouts"])
+    results = []
+
+    def stage(name, func):
+        # Best of REPEATS runs, the fastest run is the least disturbed by the rest of the machine
+        records = []
+        for _ in range(REPEATS):
+            with stage_metrics.span(f"bench_{name}", scale=scale) as metrics:
+                items = func()
+                metrics.count(items)
+            records.append(stage_metrics.METRICS.totals[f"bench_{name}"]["last"])
+        record = min(records, key=lambda r: r["seconds"])
+        results.append({"scale": scale, "stage": name, "items": items, "seconds": record["seconds"],
+                        "items_per_second": record["items_per_second"], "peak_rss_mb": record["peak_rss_mb"]})
+        logging.info(f"{scale:>6} {name:<26} {items:>8} items {record['seconds']:8.3f}s "
+                     f"{record['items_per_second'] or 0:12.1f} items/s")
+
+    def parse_rowwise():
+        rows = optical.head(ROWWISE_PARSE_LIMIT)
+        for ra, dec in zip(rows["RA"], rows["DEC"]):
+            coord = SkyCoord(f"{ra} {dec}", unit=(u.hourangle, u.deg))
+            coord.ra.deg, coord.dec.deg
+        return len(rows)
+
+    def parse_vectorised():
+        coords = SkyCoord(optical["RA"].to_numpy(), optical["DEC"].to_numpy(), unit=(u.hourangle, u.deg))
+        coords.ra.deg, coords.dec.deg
+        return len(optical)
+
+    recrossmatch = _load_script("recrossmatch", "Re-crossmatch.py")
+
+    def crossmatch():
+        recrossmatch.optimal_crossmatch(optical_csv, xray_csv, 45)
+        return len(optical)
+
+    cutout_positions = list(zip(optical["ra_deg"][:sizes["cutouts"]], optical["dec_deg"][:sizes["cutouts"]]))
+    cutout_names = optical["sn_name"][:sizes["cutouts"]].tolist()
+    fetch_dir = os.path.join(workdir, "fetched")
+    os.makedirs(fetch_dir, exist_ok=True)
+
+    def fetch():
+        with MockServices() as services, ThreadPoolExecutor(FETCH_WORKERS) as executor:
+            urls = [f"{services.url}/hips2fits?hips=CDS/P/DSS2/red&ra={ra}&dec={dec}&width=256&height=256&fov=0.12"
+                    for ra, dec in cutout_positions]
+            paths = [os.path.join(fetch_dir, f"{name}.fits") for name in cutout_names]
+            list(executor.map(_fetch, urls, paths))
+        return len(urls)
+
+    enrich_csv = os.path.join(workdir, "enrich.csv")
+    optical.head(sizes["enrich"]).to_csv(enrich_csv, index=False)
+    ztf = ztf_objects(rng, optical.head(sizes["enrich"]))
+
+    def enrich():
+        # Get_extra_info.enrich_catalog against the mock IRSA cone search, from an empty checkpoint
+        checkpoint = os.path.join(workdir, "enrich.checkpoint")
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        with MockServices(ztf) as services:
+            result = enrich_catalog(enrich_csv, os.path.join(workdir, "enriched.csv"), checkpoint,
+                                    FETCH_WORKERS, ENRICH_RATE, irsa_factory=lambda: MockIrsa(services.url))
+        return len(result)
+
+    cutout_dir = os.path.join(workdir, "cutouts")
+    cutout_paths = write_cutouts(cutout_dir, cutout_names, science, cutout_positions)
+    triplets = np.stack([science, reference, np.abs(science - reference)], axis=1)
+
+    stage("parse_coordinates_rowwise", parse_rowwise)
+    stage("parse_coordinates", parse_vectorised)
+    stage("crossmatch", crossmatch)
+    stage("dedup", lambda: len(deduplicate_by_completeness(with_duplicates(rng, optical), ["ra_deg", "dec_deg"])))
+    stage("fetch_cutouts", fetch)
+    stage("enrich", enrich)
+    stage("scan_fits", lambda: len(scan_fits_files(cutout_paths, max_workers=1)))
+    stage("qa", lambda: len(evaluate_triplet_stack(triplets, cutout_names)))
+    stage("resize", lambda: len(resize_batch(triplets, (128, 128))))
+    stage("build_triplets", lambda: len(make_triplets(science, reference)))
+    stage("build_triplets_psf", lambda: len(make_triplets(science, reference, psf_match=True)))
+    return results
+
+def compare_to_baseline(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Mark results whose throughput dropped more than `threshold` below the baseline."""
+    table = pd.DataFrame(results)
+    table["baseline_items_per_second"] = [baseline.get(f"{r['scale']}/{r['stage']}") for r in results]
+    table["ratio"] = table["items_per_second"] / table["baseline_items_per_second"]
+    table["regression"] = (table["ratio"] < 1 - threshold) & (table["seconds"] >= MIN_FLAG_SECONDS)
+    return table
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Run the synthetic pipeline benchmarks")
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=list(SCALES))
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    stage_metrics.METRICS.path = METRICS_FILE
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in args.scales:
+            scale_dir = os.path.join(workdir, scale)
+            os.makedirs(scale_dir)
+            results.extend(run_scale(scale, SCALES[scale], scale_dir))
+
+    with open(RESULTS_FILE, "w") as f:
+        json.dump({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+    table = compare_to_baseline(results, baseline)
+    print(table[["scale", "stage", "items", "seconds", "items_per_second", "ratio", "regression"]].to_string(index=False))
+    if table["regression"].any():
+        logging.warning(f"Regressions: {', '.join(table.loc[table['regression'], 'scale'] + '/' + table.loc[table['regression'], 'stage'])}")
+
+    if args.update_baseline:
+        baseline.update({f"{r['scale']}/{r['stage']}": r["items_per_second"] for r in results})
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        logging.info(f"Baseline updated in {BASELINE_FILE}")
@@ -0,0 +1,165 @@
+import os
+import string
+import numpy as np
+import pandas as pd
+from astropy.io import fits
+from astropy.wcs import WCS
+
+# Configuration
+XMM_FIELD_RADIUS_DEG = 0.25        # EPIC field of view radius
+SOURCES_PER_FIELD = 60             # typical 4XMM detections per pointing
+MATCH_FRACTION = 0.3               # optical transients with an X-ray counterpart
+MATCH_SCATTER_ARCSEC = 2.0         # positional scatter between counterparts
+CUTOUT_SHAPE = (256, 256)
+CUTOUT_FOV_DEG = 0.12
+
+def random_sky(rng, n):
+    """Positions uniform on the sphere, (ra_deg, dec_deg)."""
+    ra = rng.uniform(0, 360, n)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    return ra, dec
+
+def offset_positions(rng, ra, dec, sigma_arcsec):
+    """Scatter positions by a 2-D Gaussian of `sigma_arcsec` per axis."""
+    d_dec = rng.normal(0, sigma_arcsec / 3600, len(ra))
+    d_ra = rng.normal(0, sigma_arcsec / 3600, len(ra)) / np.maximum(np.cos(np.radians(dec)), 1e-6)
+    return (ra + d_ra) % 360, np.clip(dec + d_dec, -90, 90)
+
+def sexagesimal(ra_deg, dec_deg):
+    """TNS-style 'hh:mm:ss.sss' and '+dd:mm:ss.ss' strings."""
+    ra_h = ra_deg / 15
+    h = np.floor(ra_h)
+    m = np.floor((ra_h - h) * 60)
+    s = ((ra_h - h) * 60 - m) * 60
+    sign = np.where(dec_deg < 0, "-", "+")
+    adec = np.abs(dec_deg)
+    d = np.floor(adec)
+    dm = np.floor((adec - d) * 60)
+    ds = ((adec - d) * 60 - dm) * 60
+    ra_str = [f"{int(a):02d}:{int(b):02d}:{c:06.3f}" for a, b, c in zip(h, m, s)]
+    dec_str = [f"{sg}{int(a):02d}:{int(b):02d}:{c:05.2f}" for sg, a, b, c in zip(sign, d, dm, ds)]
+    return ra_str, dec_str
+
+def transient_names(rng, n):
+    """Unique TNS-like designations such as 2019abcd."""
+    letters = np.array(list(string.ascii_lowercase))
+    years = rng.integers(2016, 2025, n)
+    codes = letters[rng.integers(0, 26, (n, 4))]
+    names = pd.Series([f"{y}{''.join(c)}" for y, c in zip(years, codes)])
+    dup = names.duplicated()
+    names[dup] = [f"{name}{i}" for i, name in zip(np.flatnonzero(dup), names[dup])]
+    return names.tolist()
+
+def xray_table(rng, n):
+    """
+    4XMM/Chandra-like detections: sources clustered in pointings of
+    XMM_FIELD_RADIUS_DEG, about SOURCES_PER_FIELD each, as in the real catalogs.
+    """
+    n_fields = max(1, n // SOURCES_PER_FIELD)
+    field_ra, field_dec = random_sky(rng, n_fields)
+    field = rng.integers(0, n_fields, n)
+    radius = XMM_FIELD_RADIUS_DEG * np.sqrt(rng.uniform(0, 1, n))
+    angle = rng.uniform(0, 2 * np.pi, n)
+    dec = np.clip(field_dec[field] + radius * np.sin(angle), -90, 90)
+    ra = (field_ra[field] + radius * np.cos(angle) / np.maximum(np.cos(np.radians(dec)), 1e-6)) % 360
+    ra_str, dec_str = sexagesimal(ra, dec)
+    return pd.DataFrame({
+        "obs_id": (100000000 + field * 10 + rng.integers(0, 10, n)).astype(np.int64),
+        "ra_deg": ra, "dec_deg": dec, "RA": ra_str, "Dec": dec_str,
+        "flux": 10 ** rng.normal(-14, 0.7, n),
+    })
+
+def optical_table(rng, n, xray=None, match_fraction=MATCH_FRACTION):
+    """
+    TNS/OSC-like transients: a `match_fraction` share placed within
+    MATCH_SCATTER_ARCSEC of an X-ray source, the rest uniform on the sky.
+    """
+    ra, dec = random_sky(rng, n)
+    if xray is not None and len(xray):
+        matched = rng.uniform(0, 1, n) < match_fraction
+        source = rng.integers(0, len(xray), matched.sum())
+        ra[matched], dec[matched] = offset_positions(
+            rng, xray["ra_deg"].to_numpy()[source], xray["dec_deg"].to_numpy()[source], MATCH_SCATTER_ARCSEC)
+    ra_str, dec_str = sexagesimal(ra, dec)
+    return pd.DataFrame({
+        "sn_name": transient_names(rng, n),
+        "RA": ra_str, "DEC": dec_str, "ra_deg": ra, "dec_deg": dec,
+        "discovery_date": pd.Timestamp("2016-01-01") + pd.to_timedelta(rng.integers(0, 3000, n), unit="D"),
+        "type": rng.choice(["SN Ia", "SN II", "SN Ibc", "AGN", "TDE"], n, p=[0.5, 0.25, 0.1, 0.1, 0.05]),
+    })
+
+def ztf_objects(rng, optical, match_fraction=0.7):
+    """
+    ZTF object-catalog rows (the ztf_objects columns Get_extra_info.py queries), one
+    within MATCH_SCATTER_ARCSEC of a `match_fraction` share of the optical positions.
+    """
+    matched = rng.uniform(0, 1, len(optical)) < match_fraction
+    n = int(matched.sum())
+    ra, dec = offset_positions(rng, optical["ra_deg"].to_numpy()[matched], optical["dec_deg"].to_numpy()[matched],
+                               MATCH_SCATTER_ARCSEC)
+    mean = rng.uniform(16, 21, n)
+    return pd.DataFrame({
+        "oid": 600000000000000 + np.arange(n), "ra": ra, "dec": dec,
+        "minmag": mean - rng.uniform(0, 1, n), "meanmag": mean, "maxmag": mean + rng.uniform(0, 1, n),
+        "nobs": rng.integers(5, 500, n), "fid": rng.integers(1, 4, n), "lineartrend": rng.normal(0, 1e-3, n),
+        "chisq": rng.gamma(2, 1, n), "stetsonj": rng.normal(0, 1, n), "stetsonk": rng.uniform(0.6, 0.9, n),
+    })
+
+def with_duplicates(rng, table, fraction=0.05):
+    """Append copies of a `fraction` of rows with some columns blanked, for dedup benchmarks."""
+    extra = table.sample(frac=fraction, random_state=int(rng.integers(2 ** 31))).copy()
+    blank = [c for c in extra.columns if c not in ("ra_deg", "dec_deg")]
+    for column in blank[:2]:
+        extra[column] = None
+    return pd.concat([table, extra], ignore_index=True)
+
+def cutout_header(ra, dec, shape=CUTOUT_SHAPE, fov_deg=CUTOUT_FOV_DEG):
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+    wcs.wcs.crval = [ra, dec]
+    wcs.wcs.crpix = [shape[1] / 2 + 0.5, shape[0] / 2 + 0.5]
+    wcs.wcs.cdelt = [-fov_deg / shape[1], fov_deg / shape[1]]
+    return wcs.to_header()
+
+def star_field(rng, shape=CUTOUT_SHAPE, n_stars=40, psf_sigma=1.5, background=100.0, noise=5.0,
+               stars=None, transient_flux=0.0):
+    """
+    Sky cutout: flat background, Gaussian noise and Gaussian-PSF stars. Pass the same
+    `stars` (x, y, flux rows) to get a second epoch of one field, `transient_flux` adds a
+    source at the centre.
+    """
+    if stars is None:
+        stars = rng.uniform([0, 0, 500], [shape[1], shape[0], 20000], (n_stars, 3))
+    if transient_flux:
+        stars = np.vstack([stars, [(shape[1] - 1) / 2, (shape[0] - 1) / 2, transient_flux]])
+    yy, xx = np.mgrid[:shape[0], :shape[1]]
+    image = np.full(shape, background, dtype=np.float32)
+    norm = 2 * np.pi * psf_sigma ** 2
+    for x0, y0, flux in stars:
+        x1, x2 = int(max(x0 - 5 * psf_sigma, 0)), int(min(x0 + 5 * psf_sigma + 1, shape[1]))
+        y1, y2 = int(max(y0 - 5 * psf_sigma, 0)), int(min(y0 + 5 * psf_sigma + 1, shape[0]))
+        r2 = (xx[y1:y2, x1:x2] - x0) ** 2 + (yy[y1:y2, x1:x2] - y0) ** 2
+        image[y1:y2, x1:x2] += flux * np.exp(-r2 / (2 * psf_sigma ** 2)) / norm
+    return image + rng.normal(0, noise, shape).astype(np.float32), stars
+
+def cutout_pairs(rng, n, shape=CUTOUT_SHAPE):
+    """
+    (science, reference) stacks of n fields: the reference has a sharper PSF, the
+    science epoch a broader PSF and, for half the fields, a transient at the centre.
+    """
+    science = np.empty((n,) + tuple(shape), dtype=np.float32)
+    reference = np.empty_like(science)
+    for i in range(n):
+        reference[i], stars = star_field(rng, shape, psf_sigma=1.5)
+        science[i], _ = star_field(rng, shape, psf_sigma=2.2, stars=stars, transient_flux=5000.0 * (i % 2))
+    return science, reference
+
+def write_cutouts(folder, names, images, positions):
+    """Write one FITS cutout per name with a TAN WCS centred on its position."""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for name, image, (ra, dec) in zip(names, images, positions):
+        path = os.path.join(folder, f"{name}.fits")
+        fits.PrimaryHDU(image, header=cutout_header(ra, dec, image.shape)).writeto(path, overwrite=True)
+        paths.append(path)
+    return paths
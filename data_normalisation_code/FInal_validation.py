@@ -2,15 +2,9 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import logging
+import json
 import os
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler('validation.log'), logging.StreamHandler()]
-)
-
 # File paths
 PATHS = {
     'crossmatch': r"C:\Users\tosee\Downloads\123\data\Final_match.csv",
@@ -21,108 +15,139 @@ PATHS = {
     'output_plots': r"C:\Users\tosee\Downloads\123\data\validation_plots2"
 }
 
+# Validation settings
+MAX_SEPARATION_ARCSEC = 45.0       # crossmatch tolerance used by Re-crossmatch.py
+SEPARATION_TOLERANCE_ARCSEC = 0.1  # stored vs recomputed separation
+SAMPLE_ROWS = 20                   # failing rows written per check
+
+# Load each table once, the crossmatch table only with the columns the checks use
+def load_tables(paths=PATHS):
+    crossmatch = pd.read_csv(paths['crossmatch'], usecols=lambda c: c in ('optical_row', 'xray_row', 'separation_arcsec'))
+    optical = pd.read_csv(paths['optical'])
+    xray = pd.read_csv(paths['xray'])
+    return crossmatch, optical, xray
+
+# Angular separation in arcsec between coordinate arrays (haversine, NaN where a coordinate is missing)
+def angular_separation_arcsec(ra1, dec1, ra2, dec2):
+    ra1, dec1, ra2, dec2 = (np.radians(np.asarray(v, dtype=float)) for v in (ra1, dec1, ra2, dec2))
+    h = np.sin((dec2 - dec1) / 2) ** 2 + np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2) ** 2
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(h, 0, 1)))) * 3600
+
+# Run every check as a boolean mask over the table it applies to
+def run_checks(crossmatch, optical, xray, max_separation=MAX_SEPARATION_ARCSEC,
+               separation_tolerance=SEPARATION_TOLERANCE_ARCSEC):
+    optical_row = crossmatch['optical_row'].to_numpy()
+    xray_row = crossmatch['xray_row'].to_numpy()
+    optical_ra, optical_dec = optical['ra_deg'].to_numpy(float), optical['dec_deg'].to_numpy(float)
+    xray_ra, xray_dec = xray['ra_deg'].to_numpy(float), xray['dec_deg'].to_numpy(float)
+
+    checks = {
+        'optical': {'missing_coordinates': np.isnan(optical_ra) | np.isnan(optical_dec)},
+        'xray': {'missing_coordinates': np.isnan(xray_ra) | np.isnan(xray_dec)},
+        'crossmatch': {},
+    }
+    cm = checks['crossmatch']
+    cm['optical_row_out_of_bounds'] = (optical_row < 0) | (optical_row >= len(optical))
+    cm['xray_row_out_of_bounds'] = (xray_row < 0) | (xray_row >= len(xray))
+    cm['duplicate_optical_row'] = crossmatch['optical_row'].duplicated(keep=False).to_numpy()
+    cm['duplicate_xray_row'] = crossmatch['xray_row'].duplicated(keep=False).to_numpy()
+
+    # Coordinates of both sides of every in-bounds match, gathered in one step
+    in_bounds = ~(cm['optical_row_out_of_bounds'] | cm['xray_row_out_of_bounds'])
+    o = np.where(in_bounds, optical_row, 0)
+    x = np.where(in_bounds, xray_row, 0)
+    recomputed = np.where(in_bounds, angular_separation_arcsec(optical_ra[o], optical_dec[o], xray_ra[x], xray_dec[x]), np.nan)
+    cm['matched_missing_coordinates'] = in_bounds & np.isnan(recomputed)
+
+    if 'separation_arcsec' in crossmatch:
+        stored = crossmatch['separation_arcsec'].to_numpy(float)
+        cm['invalid_separation'] = ~(stored >= 0)
+        cm['separation_above_tolerance'] = stored > max_separation
+        cm['separation_mismatch'] = in_bounds & ~np.isnan(recomputed) & \
+            ~(np.abs(stored - recomputed) <= separation_tolerance)
+    else:
+        cm['separation_above_tolerance'] = recomputed > max_separation
+    return checks, recomputed
+
+# Compact machine-readable report: counts and a few sample row numbers per check
+def summarise_checks(checks, sample_rows=SAMPLE_ROWS):
+    report = {}
+    for table, masks in checks.items():
+        report[table] = {}
+        for name, mask in masks.items():
+            failing = np.flatnonzero(mask)
+            report[table][name] = {'count': int(len(failing)), 'sample_rows': failing[:sample_rows].tolist()}
+    return report
+
+# Write the JSON report and a small CSV of failing rows for every failing check
+def write_report(report, checks, tables, output_dir, sample_rows=SAMPLE_ROWS):
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "validation_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    for table, masks in checks.items():
+        for name, mask in masks.items():
+            failing = np.flatnonzero(mask)[:sample_rows]
+            if len(failing):
+                tables[table].iloc[failing].to_csv(os.path.join(output_dir, f"sample_{table}_{name}.csv"), index_label='row')
+
 # Validate indices are within original dataset bounds and filter invalid rows
-def validate_indices(crossmatch_df, optical_df, xray_df):
+def validate_indices(crossmatch_df, optical_df, xray_df, checks=None):
     try:
-        # Determine valid indices
-        optical_valid = (crossmatch_df['optical_row'] >= 0) & (crossmatch_df['optical_row'] < len(optical_df))
-        xray_valid = (crossmatch_df['xray_row'] >= 0) & (crossmatch_df['xray_row'] < len(xray_df))
-        
-        valid_mask = optical_valid & xray_valid
-        
-        invalid_count = len(crossmatch_df) - valid_mask.sum()
+        if checks is None:
+            checks, _ = run_checks(crossmatch_df, optical_df, xray_df)
+        optical_invalid = checks['crossmatch']['optical_row_out_of_bounds']
+        xray_invalid = checks['crossmatch']['xray_row_out_of_bounds']
+        valid_mask = ~(optical_invalid | xray_invalid)
+
+        invalid_count = int(len(crossmatch_df) - valid_mask.sum())
         if invalid_count > 0:
             logging.warning(f"Found {invalid_count} invalid crossmatch entries. Removing them.")
             crossmatch_filtered = crossmatch_df[valid_mask].copy()
         else:
             crossmatch_filtered = crossmatch_df.copy()
-        
-        # Report invalid indices if any
-        invalid_optical = crossmatch_df[~optical_valid]
-        if not invalid_optical.empty:
-            logging.warning(f"Invalid optical indices: {invalid_optical['optical_row'].tolist()}")
-            
-        invalid_xray = crossmatch_df[~xray_valid]
-        if not invalid_xray.empty:
-            logging.warning(f"Invalid X-ray indices: {invalid_xray['xray_row'].tolist()}")
-            
+
+        # Report a sample of invalid indices if any
+        if optical_invalid.any():
+            logging.warning(f"{optical_invalid.sum()} invalid optical indices, e.g. "
+                            f"{crossmatch_df['optical_row'].to_numpy()[optical_invalid][:SAMPLE_ROWS].tolist()}")
+        if xray_invalid.any():
+            logging.warning(f"{xray_invalid.sum()} invalid X-ray indices, e.g. "
+                            f"{crossmatch_df['xray_row'].to_numpy()[xray_invalid][:SAMPLE_ROWS].tolist()}")
+
         return crossmatch_filtered, (invalid_count == 0)
-    
+
     except Exception as e:
         logging.error(f"Index validation failed: {str(e)}")
         return crossmatch_df, False
 
-# Check for missing/invalid coordinates in all datasets  
-def check_missing_coordinates(optical_path, xray_path, crossmatch_path):
-    # Load datasets
-    optical = pd.read_csv(optical_path)
-    xray = pd.read_csv(xray_path)
-    crossmatch = pd.read_csv(crossmatch_path)
-
-    # Check optical coordinates
-    optical_missing_ra = optical['ra_deg'].isna()
-    optical_missing_dec = optical['dec_deg'].isna()
-    optical_invalid = optical_missing_ra | optical_missing_dec
-    
-    # Check X-ray coordinates
-    xray_missing_ra = xray['ra_deg'].isna()
-    xray_missing_dec = xray['dec_deg'].isna()
-    xray_invalid = xray_missing_ra | xray_missing_dec
-
-    # Check crossmatch validity
-    crossmatch_optical_valid = crossmatch['optical_row'].between(0, len(optical)-1)
-    crossmatch_xray_valid = crossmatch['xray_row'].between(0, len(xray)-1)
-
-    # Generate report
-    report = f"""
+# Short text summary of the coordinate and index checks
+def check_missing_coordinates(optical, xray, crossmatch, checks=None):
+    if checks is None:
+        checks, _ = run_checks(crossmatch, optical, xray)
+    cm = checks['crossmatch']
+    return f"""
     === COORDINATE VALIDATION REPORT ===
     Optical Catalog:
     - Total sources: {len(optical)}
-    - Missing RA: {optical_missing_ra.sum()}
-    - Missing Dec: {optical_missing_dec.sum()}
-    - Invalid coordinates: {optical_invalid.sum()}
-    
+    - Missing RA: {optical['ra_deg'].isna().sum()}
+    - Missing Dec: {optical['dec_deg'].isna().sum()}
+    - Invalid coordinates: {checks['optical']['missing_coordinates'].sum()}
+
     X-ray Catalog:
     - Total sources: {len(xray)}
-    - Missing RA: {xray_missing_ra.sum()}
-    - Missing Dec: {xray_missing_dec.sum()}
-    - Invalid coordinates: {xray_invalid.sum()}
-    
+    - Missing RA: {xray['ra_deg'].isna().sum()}
+    - Missing Dec: {xray['dec_deg'].isna().sum()}
+    - Invalid coordinates: {checks['xray']['missing_coordinates'].sum()}
+
     Crossmatch Validation:
-    - Valid optical indices: {crossmatch_optical_valid.sum()}/{len(crossmatch)}
-    - Valid X-ray indices: {crossmatch_xray_valid.sum()}/{len(crossmatch)}
+    - Valid optical indices: {(~cm['optical_row_out_of_bounds']).sum()}/{len(crossmatch)}
+    - Valid X-ray indices: {(~cm['xray_row_out_of_bounds']).sum()}/{len(crossmatch)}
     """
 
-    # Show problematic rows
-    if optical_invalid.any():
-        bad_optical = optical[optical_invalid]
-        report += f"\n\nInvalid Optical Rows:\n{bad_optical[['ra_deg', 'dec_deg']].to_string()}"
-    
-    if xray_invalid.any():
-        bad_xray = xray[xray_invalid]
-        report += f"\n\nInvalid X-ray Rows:\n{bad_xray[['ra_deg', 'dec_deg']].to_string()}"
-    
-    if not crossmatch_optical_valid.all():
-        bad_cross_optical = crossmatch[~crossmatch_optical_valid]
-        report += f"\n\nInvalid Crossmatch Optical Indices:\n{bad_cross_optical['optical_row'].unique()}"
-    
-    if not crossmatch_xray_valid.all():
-        bad_cross_xray = crossmatch[~crossmatch_xray_valid]
-        report += f"\n\nInvalid Crossmatch X-ray Indices:\n{bad_cross_xray['xray_row'].unique()}"
-
-    return report
-
-# Usage
-print(check_missing_coordinates(
-    PATHS['optical'],
-    PATHS['xray'],
-    PATHS['crossmatch']
-))
-
 # Generate validation plots
-def generate_plots(combined_df):
+def generate_plots(combined_df, output_dir=PATHS['output_plots']):
     try:
-        os.makedirs(PATHS['output_plots'], exist_ok=True)
+        os.makedirs(output_dir, exist_ok=True)
         
         # Separation histogram
         plt.figure(figsize=(10,6))
@@ -136,7 +161,7 @@ def generate_plots(combined_df):
         plt.ylabel("Number of Matches")
         plt.title("Crossmatch Separation Distribution")
         plt.legend()
-        plt.savefig(os.path.join(PATHS['output_plots'], "separation_distribution.png"))
+        plt.savefig(os.path.join(output_dir, "separation_distribution.png"))
         plt.close()
         
         return True
@@ -145,38 +170,47 @@ def generate_plots(combined_df):
         logging.error(f"Plot generation failed: {str(e)}")
         return False
 
-# Main validation workflow
-def main():
+# Main validation workflow, `paths` has the same keys as PATHS
+def main(paths=PATHS):
     try:
         logging.info("Starting validation process...")
 
         # Load data
         logging.info("Loading datasets...")
-        crossmatch = pd.read_csv(PATHS['crossmatch'])
-        optical = pd.read_csv(PATHS['optical'])
-        xray = pd.read_csv(PATHS['xray'])
+        crossmatch, optical, xray = load_tables(paths)
+
+        # Run all checks once, then report and filter indices
+        logging.info("Running validation checks...")
+        checks, _ = run_checks(crossmatch, optical, xray)
+        check_report = summarise_checks(checks)
+        write_report(check_report, checks, {'crossmatch': crossmatch, 'optical': optical, 'xray': xray},
+                     paths['output_plots'])
+        for table, results in check_report.items():
+            for name, result in results.items():
+                if result['count']:
+                    logging.warning(f"{table}: {result['count']} rows fail {name}")
+        logging.info(check_missing_coordinates(optical, xray, crossmatch, checks))
 
-        # Validate and filter indices
         logging.info("Validating indices...")
-        crossmatch, index_valid = validate_indices(crossmatch, optical, xray)
+        crossmatch, index_valid = validate_indices(crossmatch, optical, xray, checks)
 
         # Generate combined dataset
         optical_matched = optical.iloc[crossmatch['optical_row']].reset_index(drop=True)
         xray_matched = xray.iloc[crossmatch['xray_row']].reset_index(drop=True)
         combined = pd.concat([optical_matched, xray_matched], axis=1)
-        combined['separation_arcsec'] = crossmatch['separation_arcsec']
+        combined['separation_arcsec'] = crossmatch['separation_arcsec'].to_numpy()
 
         # **SAVE OPTICAL DATA**
-        optical_matched.to_csv(PATHS['final_optical'], index=False)
-        logging.info(f"Matched optical data saved to: {PATHS['final_optical']}")
+        optical_matched.to_csv(paths['final_optical'], index=False)
+        logging.info(f"Matched optical data saved to: {paths['final_optical']}")
 
         # **SAVE X-RAY DATA**
-        xray_matched.to_csv(PATHS['final_xray'], index=False)
-        logging.info(f"Matched X-ray data saved to: {PATHS['final_xray']}")
+        xray_matched.to_csv(paths['final_xray'], index=False)
+        logging.info(f"Matched X-ray data saved to: {paths['final_xray']}")
 
         # Create plots
         logging.info("Generating validation plots...")
-        plot_status = generate_plots(combined)
+        plot_status = generate_plots(combined, paths['output_plots'])
 
         # Generate final report
         report = f"""
@@ -194,16 +228,23 @@ def main():
         - Maximum separation: {combined['separation_arcsec'].max():.7f} arcsec
         """
 
-        with open(os.path.join(PATHS['output_plots'], "validation_report.txt"), "w") as f:
+        with open(os.path.join(paths['output_plots'], "validation_report.txt"), "w") as f:
             f.write(report)
 
         logging.info("Validation complete!")
-        logging.info(f"Report saved to: {os.path.join(PATHS['output_plots'], 'validation_report.txt')}")
-        logging.info(f"Plots saved to: {PATHS['output_plots']}")
+        logging.info(f"Report saved to: {os.path.join(paths['output_plots'], 'validation_report.txt')} "
+                     f"and validation_report.json")
+        logging.info(f"Plots saved to: {paths['output_plots']}")
 
     except Exception as e:
         logging.error(f"Validation process failed: {str(e)}")
         raise
 
 if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.FileHandler('validation.log'), logging.StreamHandler()]
+    )
     main()
\ No newline at end of file
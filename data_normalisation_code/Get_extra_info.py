@@ -1,18 +1,18 @@
+import os
+import csv
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
-from astroquery.ipac.irsa import Irsa
 from astropy.coordinates import SkyCoord
 from astropy import units as u
 from tqdm import tqdm
 
-# Initialize IRSA service
-irsa = Irsa()
-
 # Path to the CSV file
 csv_file = r"C:\Users\tosee\Downloads\123\data\master_optical_agncan.csv"
-df = pd.read_csv(csv_file)
-
-# Initialize an empty list to store results
-results = []
+output_file = r"C:\Users\tosee\Downloads\123\data\agn_data_extra.csv"
+# Results are appended here as they arrive so an interrupted run can resume
+checkpoint_file = output_file + ".checkpoint"
 
 # Define the catalog
 catalog = "ztf_objects_dr23"
@@ -20,75 +20,157 @@ catalog = "ztf_objects_dr23"
 # Columns to query
 columns = "oid, ra, dec, minmag, meanmag, maxmag, nobs, fid, lineartrend, chisq, stetsonj, stetsonk"
 
-# Iterate through each row in the CSV
-for index, row in tqdm(df.iterrows(), total=len(df), desc="Processing SN entries"):
-    sn_name = row["sn_name"]
-    ra_deg = row["ra_deg"]
-    dec_deg = row["dec_deg"]
+# Concurrency settings (keep the request rate polite for IRSA)
+MAX_WORKERS = 8
+REQUESTS_PER_SECOND = 5
+
+OUTPUT_COLUMNS = [
+    "sn_name", "RA_deg", "Dec_deg", "Matched_OID", "Matched_RA", "Matched_Dec",
+    "Separation_arcsec", "MinMag", "MeanMag", "MaxMag", "Num_Obs", "Filter_ID",
+    "LinearTrend", "ChiSq", "StetsonJ", "StetsonK"
+]
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
 
+    def acquire(self):
+        """Block until a token is available and consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# One IRSA service per worker thread, the underlying HTTP session is not shared safely
+_local = threading.local()
+
+def get_irsa(irsa_factory=None):
+    """This thread's IRSA client, astroquery's Irsa unless another `irsa_factory` is given."""
+    if not hasattr(_local, "irsa"):
+        if irsa_factory is None:
+            from astroquery.ipac.irsa import Irsa
+            irsa_factory = Irsa
+        _local.irsa = irsa_factory()
+    return _local.irsa
+
+def query_extra_info(sn_name, ra_deg, dec_deg, bucket, irsa_factory=None):
+    """Query the ZTF object catalog around one position and return the closest match as a row dict."""
     # Create a SkyCoord object for the RA/Dec
     coordinates = SkyCoord(ra_deg, dec_deg, unit=(u.deg, u.deg), frame='icrs')
 
     # Query the catalog for data around this coordinate (30 arcsec radius for the search)
-    try:
-        result = irsa.query_region(coordinates, catalog=catalog, radius="30 arcsec", columns=columns)
-        
-        if len(result) > 0:
-            # Find the closest match
-            matched_idx = coordinates.separation(SkyCoord(result['ra'], result['dec'], unit=(u.deg, u.deg))).argmin()
-            closest_oid = result['oid'][matched_idx]
-            matched_ra = result['ra'][matched_idx]
-            matched_dec = result['dec'][matched_idx]
-
-            # Compute the difference in arcseconds
-            matched_coords = SkyCoord(matched_ra, matched_dec, unit=(u.deg, u.deg), frame='icrs')
-            separation = coordinates.separation(matched_coords).arcsecond
-
-            # Store the result with additional columns
-            results.append({
-                "sn_name": sn_name,
-                "RA_deg": ra_deg,
-                "Dec_deg": dec_deg,
-                "Matched_OID": closest_oid,
-                "Matched_RA": matched_ra,
-                "Matched_Dec": matched_dec,
-                "Separation_arcsec": separation,
-                "MinMag": result['minmag'][matched_idx],
-                "MeanMag": result['meanmag'][matched_idx],
-                "MaxMag": result['maxmag'][matched_idx],
-                "Num_Obs": result['nobs'][matched_idx],
-                "Filter_ID": result['fid'][matched_idx],
-                "LinearTrend": result['lineartrend'][matched_idx],
-                "ChiSq": result['chisq'][matched_idx],
-                "StetsonJ": result['stetsonj'][matched_idx],
-                "StetsonK": result['stetsonk'][matched_idx]
-            })
-        else:
-            # No match found, append with N/A for missing values
-            results.append({
-                "sn_name": sn_name,
-                "RA_deg": ra_deg,
-                "Dec_deg": dec_deg,
-                "Matched_OID": 'N/A',
-                "Matched_RA": 'N/A',
-                "Matched_Dec": 'N/A',
-                "Separation_arcsec": 'N/A',
-                "MinMag": 'N/A',
-                "MeanMag": 'N/A',
-                "MaxMag": 'N/A',
-                "Num_Obs": 'N/A',
-                "Filter_ID": 'N/A',
-                "LinearTrend": 'N/A',
-                "ChiSq": 'N/A',
-                "StetsonJ": 'N/A',
-                "StetsonK": 'N/A'
-            })
-    except Exception as e:
-        print(f"Error querying IRSA for {sn_name}: {e}")
-
-# Convert the results to a DataFrame and save to a new CSV file
-output_file = r"C:\Users\tosee\Downloads\123\data\agn_data_extra.csv"
-df_results = pd.DataFrame(results)
-df_results.to_csv(output_file, index=False)
+    bucket.acquire()
+    result = get_irsa(irsa_factory).query_region(coordinates, catalog=catalog, radius="30 arcsec", columns=columns)
+
+    if len(result) == 0:
+        # No match found, N/A for missing values
+        row = {col: 'N/A' for col in OUTPUT_COLUMNS}
+        row.update({"sn_name": sn_name, "RA_deg": ra_deg, "Dec_deg": dec_deg})
+        return row
+
+    # Find the closest match
+    matched_idx = coordinates.separation(SkyCoord(result['ra'], result['dec'], unit=(u.deg, u.deg))).argmin()
+    matched_ra = result['ra'][matched_idx]
+    matched_dec = result['dec'][matched_idx]
+
+    # Compute the difference in arcseconds
+    matched_coords = SkyCoord(matched_ra, matched_dec, unit=(u.deg, u.deg), frame='icrs')
+    separation = coordinates.separation(matched_coords).arcsecond
+
+    return {
+        "sn_name": sn_name,
+        "RA_deg": ra_deg,
+        "Dec_deg": dec_deg,
+        "Matched_OID": result['oid'][matched_idx],
+        "Matched_RA": matched_ra,
+        "Matched_Dec": matched_dec,
+        "Separation_arcsec": separation,
+        "MinMag": result['minmag'][matched_idx],
+        "MeanMag": result['meanmag'][matched_idx],
+        "MaxMag": result['maxmag'][matched_idx],
+        "Num_Obs": result['nobs'][matched_idx],
+        "Filter_ID": result['fid'][matched_idx],
+        "LinearTrend": result['lineartrend'][matched_idx],
+        "ChiSq": result['chisq'][matched_idx],
+        "StetsonJ": result['stetsonj'][matched_idx],
+        "StetsonK": result['stetsonk'][matched_idx]
+    }
+
+def load_checkpoint(path):
+    """Return the set of sn_names already written to the checkpoint file."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return set()
+    done = pd.read_csv(path, usecols=["sn_name"], dtype=str)
+    return set(done["sn_name"])
+
+def enrich_catalog(input_path, output_path, checkpoint_path, max_workers=MAX_WORKERS, rate=REQUESTS_PER_SECOND,
+                   irsa_factory=None):
+    """
+    Query IRSA for every row of the input catalog using a pool of worker threads.
+
+    Each finished row is appended to the checkpoint file straight away, rows already in the
+    checkpoint are skipped, and failed rows are left out so a rerun retries them. The final
+    output is written in the input row order once all rows are done.
+
+    Args:
+        input_path (str): CSV with sn_name, ra_deg and dec_deg columns.
+        output_path (str): Path for the enriched CSV.
+        checkpoint_path (str): Append-only CSV used to resume interrupted runs.
+        max_workers (int): Number of concurrent IRSA queries.
+        rate (float): Maximum number of queries started per second across all workers.
+        irsa_factory (callable, optional): Builds each worker thread's IRSA client,
+            astroquery's Irsa by default (benchmarks/mock_services.py has a local one).
+    """
+    df = pd.read_csv(input_path)
+    done = load_checkpoint(checkpoint_path)
+    pending = df[~df["sn_name"].astype(str).isin(done)]
+    print(f"{len(done)} entries already in checkpoint, {len(pending)} left to query")
+
+    bucket = TokenBucket(rate)
+    failed = 0
+    write_header = not os.path.exists(checkpoint_path) or os.path.getsize(checkpoint_path) == 0
+
+    with open(checkpoint_path, "a", newline="") as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_COLUMNS)
+        if write_header:
+            writer.writeheader()
+
+        futures = {
+            executor.submit(query_extra_info, row.sn_name, row.ra_deg, row.dec_deg, bucket, irsa_factory): row.sn_name
+            for row in pending.itertuples(index=False)
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing SN entries"):
+            sn_name = futures[future]
+            try:
+                writer.writerow(future.result())
+                f.flush()
+            except Exception as e:
+                failed += 1
+                tqdm.write(f"Error querying IRSA for {sn_name}: {e}")
+
+    # Rebuild the output in the original catalog order from the checkpoint
+    df_results = pd.read_csv(checkpoint_path, dtype={"sn_name": str}, keep_default_na=False)
+    df_results = df_results.drop_duplicates(subset=["sn_name"], keep="last")
+    order = df["sn_name"].astype(str).drop_duplicates()
+    df_results = df_results.set_index("sn_name").reindex(order).dropna(how="all").reset_index()
+    df_results.to_csv(output_path, index=False)
+
+    if failed:
+        print(f"{failed} queries failed, rerun to retry them from the checkpoint")
+    return df_results
 
-print(f"Data with OID and additional columns saved to {output_file}")
+if __name__ == "__main__":
+    enrich_catalog(csv_file, output_file, checkpoint_file)
+    print(f"Data with OID and additional columns saved to {output_file}")
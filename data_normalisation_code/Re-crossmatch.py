@@ -4,6 +4,13 @@ from astropy.coordinates import SkyCoord
 import logging
 import numpy as np
 import matplotlib.pyplot as plt
+try:
+    from stage_metrics import span
+except ImportError:  # stage_metrics.py sits at the repository root, run untimed without it
+    from contextlib import nullcontext
+    from types import SimpleNamespace
+    def span(stage, **labels):
+        return nullcontext(SimpleNamespace(count=lambda items=1, **counters: None))
 
 # Configure logging
 logging.basicConfig(
@@ -118,7 +125,9 @@ def plot_separation_histogram(result_df, output_path="separation_histogram.png")
 if __name__ == "__main__":
     try:
         # Run crossmatch
-        result = optimal_crossmatch(PATHS['optical'], PATHS['xray'], 45)
+        with span("crossmatch", tolerance_arcsec=45) as metrics:
+            result = optimal_crossmatch(PATHS['optical'], PATHS['xray'], 45)
+            metrics.count(len(result))
         
         # Save results
         if not result.empty:
@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# Configuration
+CATALOG_PATHS = {
+    "optical": r"C:\Users\tosee\Downloads\123\data\master_optical_clean.csv",
+    "xmm": r"C:\Users\tosee\Downloads\123\data\normalised_xray_4xmm.csv",
+    "chandra": r"C:\Users\tosee\Downloads\123\data\normalised_xray_chandra.csv",
+}
+RELOAD_CHECK_SECONDS = 2.0   # how often a query may stat the table files for changes
+SEARCH_PORT = 9110
+
+def unit_vectors(ra_deg, dec_deg):
+    ra, dec = np.radians(np.asarray(ra_deg, dtype=float)), np.radians(np.asarray(dec_deg, dtype=float))
+    return np.column_stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)])
+
+def arcsec_to_chord(arcsec):
+    return 2 * np.sin(np.radians(np.asarray(arcsec, dtype=float) / 3600) / 2)
+
+def chord_to_arcsec(chord):
+    return np.degrees(2 * np.arcsin(np.minimum(np.asarray(chord, dtype=float) / 2, 1.0))) * 3600
+
+def result_json(result):
+    """Result rows as a JSON array, floats written with full precision (repr) and NaN as null."""
+    rows = result.astype(object).where(result.notna(), None).to_dict("records")
+    return json.dumps(rows, default=str)
+
+class CatalogIndex:
+    """
+    One master table held in memory with a KD-tree over the unit vectors of its
+    ra_deg / dec_deg, so cone and nearest-neighbour queries use exact angular distances
+    without RA wrap-around or pole special cases. Rows without coordinates are kept in the
+    table but not indexed.
+    """
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.state = None
+        self.load()
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        signature = self._file_signature()
+        table = pd.read_csv(self.path)
+        valid = np.isfinite(table["ra_deg"].to_numpy(dtype=float)) & np.isfinite(table["dec_deg"].to_numpy(dtype=float))
+        rows = np.flatnonzero(valid)
+        tree = cKDTree(unit_vectors(table["ra_deg"].to_numpy()[rows], table["dec_deg"].to_numpy()[rows]))
+        # One assignment, so queries running on other threads see the old or the new table, never a mix
+        self.state = {"table": table, "rows": rows, "tree": tree, "signature": signature, "loaded_at": time.time()}
+        logging.info(f"Indexed {len(rows)} of {len(table)} rows of {self.name} from {self.path}")
+
+    def changed(self):
+        return self._file_signature() != self.state["signature"]
+
+    def _result(self, state, query_index, rows, chords):
+        result = state["table"].iloc[state["rows"][rows]].reset_index()
+        result = result.rename(columns={"index": "row"})
+        result.insert(0, "query_index", query_index)
+        result["separation_arcsec"] = chord_to_arcsec(chords)
+        return result.sort_values(["query_index", "separation_arcsec"], kind="stable").reset_index(drop=True)
+
+    def batch_cone(self, ra_deg, dec_deg, radius_arcsec):
+        """Every row within `radius_arcsec` (scalar or per position) of each position."""
+        state = self.state
+        vectors = unit_vectors(np.atleast_1d(ra_deg), np.atleast_1d(dec_deg))
+        radius = np.broadcast_to(arcsec_to_chord(radius_arcsec), len(vectors))
+        hits = state["tree"].query_ball_point(vectors, radius, workers=-1)
+        query_index = np.repeat(np.arange(len(vectors)), [len(h) for h in hits])
+        rows = np.fromiter((r for h in hits for r in h), dtype=np.int64, count=len(query_index))
+        chords = np.linalg.norm(state["tree"].data[rows] - vectors[query_index], axis=1)
+        return self._result(state, query_index, rows, chords)
+
+    def batch_nearest(self, ra_deg, dec_deg, k=1, max_arcsec=None):
+        """The `k` nearest rows of each position, optionally only those within `max_arcsec`."""
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        state = self.state
+        vectors = unit_vectors(np.atleast_1d(ra_deg), np.atleast_1d(dec_deg))
+        bound = np.inf if max_arcsec is None else float(arcsec_to_chord(max_arcsec))
+        chords, rows = state["tree"].query(vectors, k=[*range(1, k + 1)], distance_upper_bound=bound, workers=-1)
+        found = np.isfinite(chords)
+        query_index = np.broadcast_to(np.arange(len(vectors))[:, None], chords.shape)[found]
+        return self._result(state, query_index, rows[found], chords[found])
+
+    def info(self):
+        state = self.state
+        return {"path": self.path, "rows": len(state["table"]), "indexed": len(state["rows"]),
+                "loaded_at": state["loaded_at"]}
+
+class CatalogSearch:
+    """
+    Cone, nearest-neighbour and batch position queries over the optical, XMM and Chandra
+    master tables, loaded once and kept in memory.
+
+    Each query checks at most every `reload_check` seconds whether its table file changed
+    (mtime or size) and reloads it first. A table that fails to load keeps serving the
+    previous version. Results are full table rows plus `query_index` (position in the
+    query), `row` (row in the table file) and `separation_arcsec`, nearest first.
+    """
+
+    def __init__(self, paths=CATALOG_PATHS, reload_check=RELOAD_CHECK_SECONDS):
+        self.reload_check = reload_check
+        self.lock = threading.Lock()
+        self.indexes = {}
+        self.checked = {}
+        for name, path in paths.items():
+            if not os.path.exists(path):
+                logging.warning(f"Skipping {name}: {path} not found")
+                continue
+            self.indexes[name] = CatalogIndex(name, path)
+            self.checked[name] = time.monotonic()
+        self.server = None
+
+    def index(self, catalog):
+        if catalog not in self.indexes:
+            raise KeyError(f"Unknown catalog {catalog}, expected one of {sorted(self.indexes)}")
+        index = self.indexes[catalog]
+        now = time.monotonic()
+        if now - self.checked[catalog] >= self.reload_check:
+            with self.lock:
+                if now - self.checked[catalog] >= self.reload_check:
+                    self.checked[catalog] = now
+                    try:
+                        if index.changed():
+                            index.load()
+                    except Exception as e:
+                        logging.error(f"Reloading {catalog} failed, keeping the loaded table: {e}")
+        return index
+
+    def cone(self, catalog, ra_deg, dec_deg, radius_arcsec):
+        return self.index(catalog).batch_cone([ra_deg], [dec_deg], radius_arcsec).drop(columns="query_index")
+
+    def nearest(self, catalog, ra_deg, dec_deg, k=1, max_arcsec=None):
+        return self.index(catalog).batch_nearest([ra_deg], [dec_deg], k, max_arcsec).drop(columns="query_index")
+
+    def batch(self, catalog, ra_deg, dec_deg, radius_arcsec=None, k=1, max_arcsec=None):
+        """Cone search of every position with `radius_arcsec`, or its `k` nearest rows (within `max_arcsec`) without one."""
+        index = self.index(catalog)
+        if radius_arcsec is None:
+            return index.batch_nearest(ra_deg, dec_deg, k, max_arcsec)
+        return index.batch_cone(ra_deg, dec_deg, radius_arcsec)
+
+    def info(self):
+        return {name: index.info() for name, index in self.indexes.items()}
+
+    def serve(self, port=SEARCH_PORT, host="127.0.0.1"):
+        """
+        Serve the queries as JSON on http://host:port from a daemon thread:
+
+        - GET /catalogs
+        - GET /cone?catalog=xmm&ra=..&dec=..&radius=30  (arcsec)
+        - GET /nearest?catalog=xmm&ra=..&dec=..&k=1[&max=60]
+        - POST /batch  {"catalog": "xmm", "ra": [..], "dec": [..], "radius": 30} or "k" (and "max") instead of "radius"
+        """
+        search = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, body, status=200):
+                body = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _run(self, query):
+                try:
+                    result = query()
+                except KeyError as e:
+                    self._reply({"error": f"Missing or unknown value: {e.args[0]}"}, 400)
+                    return
+                except (ValueError, TypeError) as e:
+                    self._reply({"error": str(e)}, 400)
+                    return
+                self._reply(result if isinstance(result, dict) else result_json(result))
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                q = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if url.path == "/catalogs":
+                    self._run(search.info)
+                elif url.path == "/cone":
+                    self._run(lambda: search.cone(q["catalog"], float(q["ra"]), float(q["dec"]), float(q["radius"])))
+                elif url.path == "/nearest":
+                    self._run(lambda: search.nearest(q["catalog"], float(q["ra"]), float(q["dec"]), int(q.get("k", 1)),
+                                                     float(q["max"]) if "max" in q else None))
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if urlparse(self.path).path != "/batch":
+                    self.send_error(404)
+                    return
+                try:
+                    q = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                except ValueError as e:
+                    self._reply({"error": f"Invalid JSON: {e}"}, 400)
+                    return
+                self._run(lambda: search.batch(q["catalog"], np.asarray(q["ra"], dtype=float),
+                                               np.asarray(q["dec"], dtype=float), q.get("radius"), int(q.get("k", 1)),
+                                               q.get("max")))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logging.info(f"Catalog search served on http://{host}:{self.server.server_address[1]}")
+        return self.server
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    search = CatalogSearch()
+    search.serve()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        search.server.shutdown()
@@ -1,3 +1,4 @@
+import os
 import pandas as pd
 
 # Remove duplicate coordinate pairs, keeping the row with the most non-null values
@@ -19,14 +20,27 @@ xray_path = r"C:\Users\tosee\Downloads\123\data\master_xray_data.csv"
 optical_path = r"C:\Users\tosee\Downloads\123\data\master_optical_data.csv"
 save_dir = r"C:\Users\tosee\Downloads\123\data"
 
-# Load datasets
-optical = pd.read_csv(optical_path)
-xray = pd.read_csv(xray_path)
+def clean_path(path, output_dir):
+    # master_optical_data.csv -> master_optical_clean.csv
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir, f"{stem.removesuffix('_data')}_clean.csv")
 
-# Deduplicate
-optical_clean = deduplicate_by_completeness(optical, ["ra_deg", "dec_deg"])
-xray_clean = deduplicate_by_completeness(xray, ["ra_deg", "dec_deg"])
+def deduplicate_files(paths, output_dir, coord_cols=("ra_deg", "dec_deg")):
+    """Deduplicate each CSV by coordinates and save it as <name>_clean.csv, returns the saved paths."""
+    saved = []
+    for path in paths:
+        # Load dataset
+        df = pd.read_csv(path)
 
-# Save cleaned data to the correct directory
-optical_clean.to_csv(f"{save_dir}/master_optical_clean.csv", index=False)
-xray_clean.to_csv(f"{save_dir}/master_xray_clean.csv", index=False)
\ No newline at end of file
+        # Deduplicate
+        df_clean = deduplicate_by_completeness(df, list(coord_cols))
+
+        # Save cleaned data to the correct directory
+        output_path = clean_path(path, output_dir)
+        df_clean.to_csv(output_path, index=False)
+        print(f"{os.path.basename(path)}: {len(df) - len(df_clean)} duplicates removed, saved to {output_path}")
+        saved.append(output_path)
+    return saved
+
+if __name__ == "__main__":
+    deduplicate_files([optical_path, xray_path], save_dir)
@@ -0,0 +1,299 @@
+import os
+import time
+import json
+import socket
+import sqlite3
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# Configuration
+OPTICAL_PATH = r"C:\Users\tosee\Downloads\123\data\normalised_tns_agn.csv"
+XRAY_PATH = r"C:\Users\tosee\Downloads\123\data\normalised_xray_4xmm.csv"
+JOB_DIR = r"C:\Users\tosee\Downloads\123\data\shards"
+NSIDE = 8                   # 768 pixels of ~7.3 deg, far larger than the crossmatch radius
+TOLERANCE_ARCSEC = 45
+LEASE_SECONDS = 3600        # a claimed shard is handed out again if not finished by then
+MAX_ATTEMPTS = 3
+
+def _spread_bits(v):
+    """Interleave zeros between the bits of v (for the nested xy -> pixel index)."""
+    v = v.astype(np.int64)
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
+
+def ang2pix_nested(nside, ra_deg, dec_deg):
+    """
+    HEALPix NESTED pixel index of every position (Gorski et al. 2005), vectorised in
+    NumPy so sharding does not need healpy. nside must be a power of two.
+    """
+    ra_deg, dec_deg = np.asarray(ra_deg, dtype=float), np.asarray(dec_deg, dtype=float)
+    z = np.sin(np.radians(dec_deg))
+    za = np.abs(z)
+    tt = np.mod(np.radians(ra_deg), 2 * np.pi) / (np.pi / 2)  # in [0, 4)
+    tt = np.where(tt >= 4, 0, tt)
+
+    # Equatorial region
+    temp1 = nside * (0.5 + tt)
+    temp2 = nside * z * 0.75
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ifp, ifm = jp // nside, jm // nside
+    face_eq = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix_eq = jm & (nside - 1)
+    iy_eq = nside - (jp & (nside - 1)) - 1
+
+    # Polar caps
+    ntt = np.minimum(tt.astype(np.int64), 3)
+    tp = tt - ntt
+    tmp = nside * np.sqrt(3 * (1 - za))
+    jp_p = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm_p = np.minimum(((1 - tp) * tmp).astype(np.int64), nside - 1)
+    north = z >= 0
+    face_p = np.where(north, ntt, ntt + 8)
+    ix_p = np.where(north, nside - jm_p - 1, jp_p)
+    iy_p = np.where(north, nside - jp_p - 1, jm_p)
+
+    equatorial = za <= 2 / 3
+    face = np.where(equatorial, face_eq, face_p)
+    ix = np.where(equatorial, ix_eq, ix_p)
+    iy = np.where(equatorial, iy_eq, iy_p)
+    return face * nside * nside + (_spread_bits(ix) | (_spread_bits(iy) << 1))
+
+def _unit_vectors(ra_deg, dec_deg):
+    ra, dec = np.radians(np.asarray(ra_deg, dtype=float)), np.radians(np.asarray(dec_deg, dtype=float))
+    return np.column_stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)])
+
+def halo_pixels(pixels, ra_deg, dec_deg, other_ra, other_dec, radius_deg):
+    """
+    (row, pixel) pairs assigning every `other` row to each pixel that has a position
+    (ra_deg, dec_deg, in pixel `pixels`) within `radius_deg` of it.
+
+    Found with one KD-tree ball query on unit vectors rather than by sampling the disc
+    around each row, so a pixel the disc only clips at a corner is included exactly when
+    one of its positions lies in the clipped part. Rows without coordinates join no pixel.
+    """
+    pixels = np.asarray(pixels)
+    ra, dec = np.asarray(ra_deg, dtype=float), np.asarray(dec_deg, dtype=float)
+    other_ra, other_dec = np.asarray(other_ra, dtype=float), np.asarray(other_dec, dtype=float)
+    valid = np.flatnonzero(np.isfinite(ra) & np.isfinite(dec))
+    other_valid = np.flatnonzero(np.isfinite(other_ra) & np.isfinite(other_dec))
+    if len(valid) == 0 or len(other_valid) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    chord = 2 * np.sin(np.radians(radius_deg) / 2)
+    tree = cKDTree(_unit_vectors(other_ra[other_valid], other_dec[other_valid]))
+    hits = tree.query_ball_point(_unit_vectors(ra[valid], dec[valid]), chord, workers=-1)
+    counts = np.fromiter((len(h) for h in hits), dtype=np.int64, count=len(hits))
+    rows = other_valid[np.fromiter((r for h in hits for r in h), dtype=np.int64, count=int(counts.sum()))]
+    pairs = np.unique(np.column_stack([rows, np.repeat(pixels[valid], counts)]), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+class ShardQueue:
+    """
+    SQLite table of shards that any number of local processes, or hosts sharing the job
+    folder, claim one at a time. Claims are leases: a shard whose worker died is handed
+    out again after LEASE_SECONDS, up to MAX_ATTEMPTS times.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=DELETE")  # WAL does not work on network shares
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS shards (
+                shard INTEGER PRIMARY KEY, job TEXT, inputs TEXT, output TEXT, n_rows INTEGER,
+                status TEXT DEFAULT 'pending', worker TEXT, claimed_at REAL, attempts INTEGER DEFAULT 0,
+                error TEXT)""")
+
+    def add(self, shard, job, inputs, output, n_rows):
+        self.conn.execute("INSERT OR REPLACE INTO shards (shard, job, inputs, output, n_rows) VALUES (?, ?, ?, ?, ?)",
+                          (int(shard), job, json.dumps(inputs), output, int(n_rows)))
+
+    def claim(self, worker, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        """Atomically take the next pending (or expired) shard, None when nothing is left."""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT shard, job, inputs, output FROM shards WHERE attempts < ? AND "
+                "(status = 'pending' OR status = 'failed' OR (status = 'claimed' AND claimed_at < ?)) "
+                "ORDER BY n_rows DESC, shard LIMIT 1", (max_attempts, now - lease_seconds)).fetchone()
+            if row is not None:
+                self.conn.execute("UPDATE shards SET status = 'claimed', worker = ?, claimed_at = ?, "
+                                  "attempts = attempts + 1 WHERE shard = ?", (worker, now, row[0]))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return {"shard": row[0], "job": row[1], "inputs": json.loads(row[2]), "output": row[3]}
+
+    def complete(self, shard):
+        self.conn.execute("UPDATE shards SET status = 'done', error = NULL WHERE shard = ?", (shard,))
+
+    def fail(self, shard, error):
+        self.conn.execute("UPDATE shards SET status = 'failed', error = ? WHERE shard = ?", (error, shard))
+
+    def progress(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM shards GROUP BY status").fetchall())
+
+    def outputs(self):
+        return [r[0] for r in self.conn.execute("SELECT output FROM shards WHERE status = 'done' ORDER BY shard")]
+
+    def close(self):
+        self.conn.close()
+
+def _write_shard(table, path):
+    table.to_csv(path, index=False)
+    return path
+
+def make_crossmatch_manifest(optical_path, xray_path, job_dir, nside=NSIDE, tolerance_arcsec=TOLERANCE_ARCSEC):
+    """
+    Split a crossmatch into HEALPix shards. Each shard holds the optical rows of one pixel
+    and every X-ray row within the tolerance of one of those optical rows, wherever its
+    own pixel is, so no match across a pixel edge is lost. Both inputs keep their
+    original row number in `_row`.
+    """
+    os.makedirs(job_dir, exist_ok=True)
+    optical = pd.read_csv(optical_path)
+    xray = pd.read_csv(xray_path)
+    optical["_row"] = np.arange(len(optical))
+    xray["_row"] = np.arange(len(xray))
+    optical_pix = ang2pix_nested(nside, optical["ra_deg"], optical["dec_deg"])
+    xray_rows, xray_pix = halo_pixels(optical_pix, optical["ra_deg"], optical["dec_deg"],
+                                      xray["ra_deg"], xray["dec_deg"], tolerance_arcsec / 3600)
+
+    queue = ShardQueue(os.path.join(job_dir, "queue.db"))
+    order = np.argsort(xray_pix, kind="stable")
+    xray_rows, xray_pix = xray_rows[order], xray_pix[order]
+    for pixel, group in optical.groupby(optical_pix):
+        lo, hi = np.searchsorted(xray_pix, [pixel, pixel + 1])
+        inputs = {
+            "optical": _write_shard(group, os.path.join(job_dir, f"optical_{pixel:06d}.csv")),
+            "xray": _write_shard(xray.iloc[np.sort(xray_rows[lo:hi])], os.path.join(job_dir, f"xray_{pixel:06d}.csv")),
+            "tolerance_arcsec": tolerance_arcsec,
+        }
+        queue.add(pixel, "crossmatch", inputs, os.path.join(job_dir, f"crossmatch_{pixel:06d}.csv"), len(group))
+    logging.info(f"Wrote {optical_pix.size} optical rows into {len(np.unique(optical_pix))} crossmatch shards in {job_dir}")
+    queue.close()
+
+def make_fetch_manifest(catalog_path, job_dir, nside=NSIDE):
+    """Split a catalog for Get_extra_info into HEALPix shards of nearby objects."""
+    os.makedirs(job_dir, exist_ok=True)
+    catalog = pd.read_csv(catalog_path)
+    catalog["_row"] = np.arange(len(catalog))
+    pixels = ang2pix_nested(nside, catalog["ra_deg"], catalog["dec_deg"])
+    queue = ShardQueue(os.path.join(job_dir, "queue.db"))
+    for pixel, group in catalog.groupby(pixels):
+        inputs = {"catalog": _write_shard(group, os.path.join(job_dir, f"catalog_{pixel:06d}.csv"))}
+        queue.add(pixel, "fetch_extra", inputs, os.path.join(job_dir, f"extra_{pixel:06d}.csv"), len(group))
+    logging.info(f"Wrote {len(catalog)} rows into {len(np.unique(pixels))} fetch shards in {job_dir}")
+    queue.close()
+
+def run_crossmatch_shard(inputs, output):
+    """Crossmatch one shard with Crossmatch_tns_4xmm and map the row numbers back to the full catalogs."""
+    from Crossmatch_tns_4xmm import astropy_crossmatch
+    optical_rows = pd.read_csv(inputs["optical"], usecols=["_row"])["_row"].to_numpy()
+    xray_rows = pd.read_csv(inputs["xray"], usecols=["_row"])["_row"].to_numpy()
+    if len(xray_rows) == 0:
+        result = pd.DataFrame(columns=["optical_row", "xray_row", "separation_arcsec"])
+    else:
+        result = astropy_crossmatch(inputs["optical"], inputs["xray"], inputs["tolerance_arcsec"])
+        result["optical_row"] = optical_rows[result["optical_row"].to_numpy()]
+        result["xray_row"] = xray_rows[result["xray_row"].to_numpy()]
+    result.to_csv(output, index=False)
+
+def run_fetch_shard(inputs, output):
+    """Query IRSA for one shard with Get_extra_info, resuming from the shard's own checkpoint."""
+    from Get_extra_info import enrich_catalog
+    enrich_catalog(inputs["catalog"], output, output + ".checkpoint")
+
+JOBS = {"crossmatch": run_crossmatch_shard, "fetch_extra": run_fetch_shard}
+
+def run_worker(job_dir, worker=None):
+    """Claim and process shards until the queue is empty, returns the number processed."""
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    queue = ShardQueue(os.path.join(job_dir, "queue.db"))
+    processed = 0
+    while True:
+        task = queue.claim(worker)
+        if task is None:
+            break
+        try:
+            JOBS[task["job"]](task["inputs"], task["output"])
+            queue.complete(task["shard"])
+            processed += 1
+            logging.info(f"{worker} finished shard {task['shard']} ({task['job']})")
+        except Exception as e:
+            queue.fail(task["shard"], f"{type(e).__name__}: {e}")
+            logging.error(f"{worker} failed shard {task['shard']}: {e}")
+    logging.info(f"{worker} done after {processed} shards, queue: {queue.progress()}")
+    queue.close()
+    return processed
+
+def merge_outputs(job_dir, output_path):
+    """
+    Concatenate the per-shard outputs in a fixed order: crossmatches by optical_row,
+    fetched rows by their catalog row, so the merge is the same however the shards
+    were scheduled.
+    """
+    queue = ShardQueue(os.path.join(job_dir, "queue.db"))
+    progress = queue.progress()
+    if set(progress) - {"done"}:
+        logging.warning(f"Merging an unfinished job: {progress}")
+    jobs = {r[0] for r in queue.conn.execute("SELECT DISTINCT job FROM shards")}
+    parts = [pd.read_csv(p, dtype={"sn_name": str}, keep_default_na=False) for p in queue.outputs()]
+    queue.close()
+    merged = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    if "crossmatch" in jobs and len(merged):
+        merged = merged.sort_values(["optical_row", "xray_row"], kind="stable")
+    elif len(merged):
+        catalogs = pd.concat([pd.read_csv(p, usecols=["sn_name", "_row"], dtype={"sn_name": str})
+                              for p in _inputs(job_dir, "catalog")], ignore_index=True)
+        merged = merged.merge(catalogs.drop_duplicates("sn_name"), on="sn_name", how="left")
+        merged = merged.sort_values("_row", kind="stable").drop(columns="_row")
+    merged.to_csv(output_path, index=False)
+    logging.info(f"Merged {len(parts)} shard outputs ({len(merged)} rows) into {output_path}")
+    return merged
+
+def _inputs(job_dir, name):
+    queue = ShardQueue(os.path.join(job_dir, "queue.db"))
+    paths = [json.loads(r[0])[name] for r in queue.conn.execute("SELECT inputs FROM shards ORDER BY shard")]
+    queue.close()
+    return paths
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="HEALPix-sharded crossmatch and IRSA fetch jobs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("crossmatch-manifest")
+    p.add_argument("--optical", default=OPTICAL_PATH)
+    p.add_argument("--xray", default=XRAY_PATH)
+    p.add_argument("--job-dir", default=JOB_DIR)
+    p.add_argument("--nside", type=int, default=NSIDE)
+    p = sub.add_parser("fetch-manifest")
+    p.add_argument("--catalog", required=True)
+    p.add_argument("--job-dir", default=JOB_DIR)
+    p.add_argument("--nside", type=int, default=NSIDE)
+    p = sub.add_parser("work")
+    p.add_argument("--job-dir", default=JOB_DIR)
+    p = sub.add_parser("merge")
+    p.add_argument("--job-dir", default=JOB_DIR)
+    p.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    if args.command == "crossmatch-manifest":
+        make_crossmatch_manifest(args.optical, args.xray, args.job_dir, args.nside)
+    elif args.command == "fetch-manifest":
+        make_fetch_manifest(args.catalog, args.job_dir, args.nside)
+    elif args.command == "work":
+        run_worker(args.job_dir)
+    else:
+        merge_outputs(args.job_dir, args.output)
@@ -1,41 +1,41 @@
 import os
-import numpy as np
-from astropy.io import fits
 from tqdm import tqdm
+from fits_quality_scan import scan_fits_folders, load_stats, rows_in_folder
 
 # Folder containing FITS files
 FITS_FOLDER = r"C:\Users\tosee\Downloads\123\chandra_fits"
 NULL_FITS_LOG = "deleted_null_fits.txt"
+# Optional stats table from fits_quality_scan.py, the folder is scanned when it is missing
+STATS_CSV = "fits_quality_stats.csv"
 
-# List to store deleted file names
-deleted_files = []
+def delete_null_fits(fits_folder, stats=None, extensions=(".fits",)):
+    """
+    Delete every file with one of `extensions` that the quality scan flags as null and
+    return the deleted paths. Only `.fits` files are deleted by default, as before the
+    scan was shared; pass (".fits", ".fit") to include `.fit` files.
+    """
+    # Scan the folder when no stats table was given or it does not cover this folder
+    if stats is None or not rows_in_folder(stats, fits_folder).any():
+        stats = scan_fits_folders({"chandra": fits_folder})
+    selected = rows_in_folder(stats, fits_folder) & stats["path"].str.endswith(tuple(extensions))
+    null_paths = stats.loc[selected & stats["is_null"].astype(bool), "path"]
 
-# Function to check if FITS file has null content
-def is_null_fits(fits_path):
-    try:
-        with fits.open(fits_path) as hdul:
-            data = hdul[0].data
-            # Check if data is None, all zeros, or NaN
-            if data is None or np.all(data == 0) or np.all(np.isnan(data)):
-                return True
-    except Exception as e:
-        print(f"Error reading {fits_path}: {str(e)}")
-    return False
-
-# Iterate over all FITS files in the folder
-for fits_file in tqdm(os.listdir(FITS_FOLDER), desc="Checking FITS files"):
-    if fits_file.endswith(".fits"):
-        file_path = os.path.join(FITS_FOLDER, fits_file)
-        
-        if is_null_fits(file_path):
+    deleted_files = []
+    for file_path in tqdm(null_paths, desc="Deleting null FITS files"):
+        if os.path.exists(file_path):
             os.remove(file_path)  # Delete the file
             deleted_files.append(file_path)
-            tqdm.write(f"Deleted {fits_file}: Null content detected.")
+            tqdm.write(f"Deleted {os.path.basename(file_path)}: Null content detected.")
+    return deleted_files
+
+if __name__ == "__main__":
+    stats = load_stats(STATS_CSV) if os.path.exists(STATS_CSV) else None
+    deleted_files = delete_null_fits(FITS_FOLDER, stats)
 
-# Save a log of deleted files
-with open(NULL_FITS_LOG, "w") as f:
-    for file in deleted_files:
-        f.write(file + "\n")
+    # Save a log of deleted files
+    with open(NULL_FITS_LOG, "w") as f:
+        for file in deleted_files:
+            f.write(file + "\n")
 
-print(f"\n Deletion complete! {len(deleted_files)} FITS files removed.")
-print(f"Deleted file log saved in {NULL_FITS_LOG}")
+    print(f"\n Deletion complete! {len(deleted_files)} FITS files removed.")
+    print(f"Deleted file log saved in {NULL_FITS_LOG}")
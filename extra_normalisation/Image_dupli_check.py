@@ -1,22 +1,22 @@
 import os
-from collections import Counter
+from image_index import open_index, folder_stats, IMAGE_INDEX_DB
 
-def find_duplicate_filenames(directory):
-    """Find duplicate filenames in a given directory."""
+def find_duplicate_filenames(directory, db_path=IMAGE_INDEX_DB):
+    """
+    Find object keys with more than one FITS file in a directory (e.g. name.fits and
+    name.fit), listed from the image index instead of a directory walk.
+    """
     if not os.path.exists(directory):
         print(f"Error: Directory '{directory}' does not exist.")
         return []
 
-    # Get all filenames in the directory
-    filenames = [f for f in os.listdir(directory) if f.endswith('.fits')]
-    
-    # Count occurrences of each filename
-    filename_counts = Counter(filenames)
-    
-    # Filter out filenames that appear more than once
-    duplicates = [fname for fname, count in filename_counts.items() if count > 1]
+    conn = open_index(db_path)
+    files = folder_stats(conn, directory, scan_stats=False, extensions=('.fits', '.fit'))
+    conn.close()
 
-    return duplicates
+    # Keys that appear more than once
+    counts = files["object_key"].value_counts()
+    return sorted(counts.index[counts > 1])
 
 if __name__ == '__main__':
     directory = r'C:\Users\tosee\Downloads\123\dss2_agn_red'
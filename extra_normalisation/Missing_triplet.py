@@ -1,23 +1,22 @@
-import os
 import pandas as pd
+from image_index import open_index, update_index, missing_keys, IMAGE_INDEX_DB
 
-def check_missing_triplets(csv_path, triplet_folder):
+def check_missing_triplets(csv_path, triplet_folder, db_path=IMAGE_INDEX_DB, survey="triplets"):
     # Load metadata
     meta = pd.read_csv(csv_path)
     sn_names = meta['sn_name'].astype(str).str.strip().tolist()
 
-    # List existing .npy files in folder
-    existing_files = set(os.listdir(triplet_folder))
+    # Refresh the image index for the triplet folder and look the names up there
+    conn = open_index(db_path)
+    update_index(conn, survey, triplet_folder, scan_stats=False)
+    existing_count = conn.execute("SELECT COUNT(*) FROM images WHERE survey = ?", (survey,)).fetchone()[0]
 
     # Check for missing triplets
-    missing = []
-    for sn in sn_names:
-        expected = f"{sn}_triplet.npy"
-        if expected not in existing_files:
-            missing.append(expected)
+    missing = [f"{sn}_triplet.npy" for sn in missing_keys(conn, survey, sn_names)]
+    conn.close()
 
     print(f"Total entries in CSV: {len(sn_names)}")
-    print(f"Triplet files found : {len(existing_files)}")
+    print(f"Triplet files found : {existing_count}")
     print(f"Missing triplets    : {len(missing)}")
 
     if missing:
@@ -25,8 +24,10 @@ def check_missing_triplets(csv_path, triplet_folder):
         print(missing[:24])
     else:
         print("All triplets are present!")
+    return missing
 
-check_missing_triplets(
-    r"C:\Users\tosee\Downloads\123\data\Part2_optical_data.csv",
-    r"C:\Users\tosee\Downloads\123\testing_triplets\triplets"
-)
+if __name__ == "__main__":
+    check_missing_triplets(
+        r"C:\Users\tosee\Downloads\123\data\Part2_optical_data.csv",
+        r"C:\Users\tosee\Downloads\123\testing_triplets\triplets"
+    )
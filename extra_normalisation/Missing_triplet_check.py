@@ -1,27 +1,28 @@
-import os
 import csv
 import logging
+import numpy as np
 from astropy.table import Table
+from triplet_registry import scan_registry, match_catalog
 
 def format_coord(value):
     """Format coordinate by replacing '.' with 'p' and rounding to 5 decimals."""
     return f"{value:.5f}".replace('.', 'p')
 
-def generate_filenames(ra, dec):
-    """Generate filenames for ±0.00001 uncertainty."""
-    deltas = [0, 0.00001, -0.00001]
-    filenames = []
-    for delta_ra in deltas:
-        for delta_dec in deltas:
-            ra_shifted = format_coord(ra + delta_ra)
-            dec_shifted = format_coord(dec + delta_dec)
-            filenames.append(f"{ra_shifted}_{dec_shifted}_triplet.npy")
-    return filenames
+def expected_filename(ra, dec):
+    """Filename a triplet for (ra, dec) is written under."""
+    return f"{format_coord(ra)}_{format_coord(dec)}_triplet.npy"
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
 
 def check_missing_triplets(csv_path, triplet_dir, ra_col='ra_deg', dec_col='dec_deg', name_col='sn_name', discovery_col='discovery_date'):
     """
     Compare CSV entries with existing triplet files to find missing ones.
-    Allows ±0.00001 tolerance in coordinate rounding.
+    Triplet filenames are parsed back into coordinates and joined against the catalog
+    in one pass (triplet_registry.py), allowing ±0.00001 tolerance in coordinate rounding.
     """
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     
@@ -36,31 +37,31 @@ def check_missing_triplets(csv_path, triplet_dir, ra_col='ra_deg', dec_col='dec_
             logging.info(f"Available columns: {', '.join(table.colnames)}")
             return []
 
-        existing_files = {f for f in os.listdir(triplet_dir) if f.endswith('_triplet.npy')}
-        logging.info(f"Found {len(existing_files)} existing triplet files")
-        
-        missing = []
+        registry = scan_registry(triplet_dir)
+        logging.info(f"Found {len(registry)} existing triplet files")
 
-        for idx, row in enumerate(table):
-            try:
-                ra = float(row[ra_col])
-                dec = float(row[dec_col])
-                possible_filenames = generate_filenames(ra, dec)
+        ra = np.array([_to_float(v) for v in table[ra_col]])
+        dec = np.array([_to_float(v) for v in table[dec_col]])
+        invalid = ~(np.isfinite(ra) & np.isfinite(dec))
+        for idx in np.flatnonzero(invalid):
+            logging.error(f"Error processing row {idx}: invalid coordinates {table[ra_col][idx]}, {table[dec_col][idx]}")
 
-                if not any(filename in existing_files for filename in possible_filenames):
-                    missing.append({
-                        "original_index": idx,
-                        name_col: row[name_col],
-                        ra_col: row[ra_col],
-                        dec_col: row[dec_col],
-                        discovery_col: row[discovery_col],
-                        'expected_filename': possible_filenames[0]  # primary expected
-                    })
+        match = match_catalog(registry, ra, dec)
+        missing = [
+            {
+                "original_index": int(idx),
+                name_col: table[name_col][idx],
+                ra_col: table[ra_col][idx],
+                dec_col: table[dec_col][idx],
+                discovery_col: table[discovery_col][idx],
+                'expected_filename': expected_filename(ra[idx], dec[idx])
+            }
+            for idx in np.flatnonzero((match < 0) & ~invalid)
+        ]
+        n_extra = len(registry) - len(np.unique(match[match >= 0]))
+        if n_extra:
+            logging.info(f"{n_extra} triplet files match no catalog entry")
 
-            except Exception as e:
-                logging.error(f"Error processing row {idx}: {str(e)}")
-                continue
-        
         logging.info(f"Missing {len(missing)} triplets:")
         for entry in missing[:5]:
             logging.info(
@@ -0,0 +1,151 @@
+import os
+import logging
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+from tqdm import tqdm
+
+# Configuration
+SOURCE_FOLDER = r"C:\Users\tosee\Downloads\123\ztf_r"
+TARGET_FOLDER = r"C:\Users\tosee\Downloads\123\dss2_red"
+OUTPUT_FOLDER = r"C:\Users\tosee\Downloads\123\ztf_aligned"
+BATCH_SIZE = 64
+
+# Pixel maps keyed by the centre-free geometry of a (source, target) pair
+_PIXEL_MAPS = {}
+
+def geometry_key(wcs, shape):
+    """Everything that defines a cutout's pixel grid except its sky centre (CRVAL)."""
+    return (
+        tuple(wcs.wcs.ctype),
+        tuple(np.round(wcs.wcs.crpix, 6)),
+        tuple(np.round(wcs.pixel_scale_matrix.ravel(), 12)),
+        float(wcs.wcs.lonpole),
+        tuple(shape),
+    )
+
+def same_tangent_point(source_wcs, target_wcs):
+    """
+    True when both grids are TAN projections about the same sky position. The
+    target->source pixel map then depends only on the two grid geometries, not on where
+    on the sky they are, so it can be cached and reused for every object.
+    """
+    tan = all(c.endswith("-TAN") for c in tuple(source_wcs.wcs.ctype) + tuple(target_wcs.wcs.ctype))
+    return tan and source_wcs.wcs.radesys == target_wcs.wcs.radesys and \
+        np.allclose(source_wcs.wcs.crval, target_wcs.wcs.crval, rtol=0, atol=1e-9)
+
+def compute_pixel_map(source_wcs, source_shape, target_wcs, target_shape):
+    """
+    Full WCS solve: for every target pixel, the four source pixels and bilinear weights
+    to gather from. Target pixels that fall outside the source get no valid neighbours.
+
+    Returns:
+        dict: flat source indices (4, P), weights (4, P) and a valid mask (P,).
+    """
+    ty, tx = np.mgrid[:target_shape[0], :target_shape[1]]
+    world = target_wcs.pixel_to_world_values(tx.ravel().astype(float), ty.ravel().astype(float))
+    sx, sy = source_wcs.world_to_pixel_values(*world)
+
+    valid = (sx >= 0) & (sy >= 0) & (sx <= source_shape[1] - 1) & (sy <= source_shape[0] - 1)
+    x0 = np.clip(np.floor(np.where(valid, sx, 0)), 0, max(source_shape[1] - 2, 0))
+    y0 = np.clip(np.floor(np.where(valid, sy, 0)), 0, max(source_shape[0] - 2, 0))
+    fx, fy = np.where(valid, sx - x0, 0), np.where(valid, sy - y0, 0)
+    x0, y0 = x0.astype(np.int64), y0.astype(np.int64)
+    width = source_shape[1]
+    base = y0 * width + x0
+    index = np.stack([base, base + 1, base + width, base + width + 1])
+    weights = np.stack([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy]).astype(np.float32)
+    weights[:, ~valid] = 0
+    return {"index": index, "weights": weights, "valid": valid, "shape": tuple(target_shape)}
+
+def pixel_map(source_wcs, source_shape, target_wcs, target_shape):
+    """Pixel map for a pair of grids, served from the cache when the pair shares a tangent point."""
+    if not same_tangent_point(source_wcs, target_wcs):
+        return compute_pixel_map(source_wcs, source_shape, target_wcs, target_shape)
+    key = (geometry_key(source_wcs, source_shape), geometry_key(target_wcs, target_shape))
+    if key not in _PIXEL_MAPS:
+        _PIXEL_MAPS[key] = compute_pixel_map(source_wcs, source_shape, target_wcs, target_shape)
+    return _PIXEL_MAPS[key]
+
+def apply_pixel_map(stack, pmap):
+    """
+    Reproject a stack of same-grid cutouts (N, H, W) with a vectorised gather per bilinear
+    corner, accumulated into the output so only one (N, P) temporary is alive at a time.
+    Pixels outside the source footprint become NaN.
+    """
+    stack = np.asarray(stack, dtype=np.float32)
+    flat = stack.reshape(stack.shape[0], -1)
+    index, weights = pmap["index"], pmap["weights"]
+    out = np.take(flat, index[0], axis=1)
+    out *= weights[0]
+    corner = np.empty_like(out)
+    for k in range(1, len(index)):
+        np.take(flat, index[k], axis=1, out=corner)
+        corner *= weights[k]
+        out += corner
+    out[:, ~pmap["valid"]] = np.nan
+    return out.reshape((stack.shape[0],) + pmap["shape"])
+
+def target_header(ra_deg, dec_deg, fov_deg=0.12, shape=(768, 768)):
+    """TAN grid like the hips2fits cutouts: centred on (ra, dec), `fov_deg` across the width."""
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+    wcs.wcs.crval = [ra_deg, dec_deg]
+    wcs.wcs.crpix = [shape[1] / 2 + 0.5, shape[0] / 2 + 0.5]
+    wcs.wcs.cdelt = [-fov_deg / shape[1], fov_deg / shape[1]]
+    return wcs.to_header()
+
+def _read(path):
+    with fits.open(path) as hdul:
+        return hdul[0].data, hdul[0].header
+
+def align_folder(source_folder, target_folder, output_folder, batch_size=BATCH_SIZE):
+    """
+    Reproject every cutout in `source_folder` onto the grid of the same-named cutout in
+    `target_folder` and write it to `output_folder` with the target WCS.
+
+    Files are grouped by pixel map so each batch is a single gather. Pairs that do not
+    share a tangent point get a map of their own and are written straight away.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    names = sorted(set(f for f in os.listdir(source_folder) if f.endswith('.fits')) &
+                   set(f for f in os.listdir(target_folder) if f.endswith('.fits')))
+    logging.info(f"Aligning {len(names)} cutouts from {source_folder} onto {target_folder}")
+
+    pending = {}
+    aligned = 0
+
+    def flush(map_id):
+        nonlocal aligned
+        pmap, items = pending.pop(map_id)
+        result = apply_pixel_map(np.stack([data for _, data, _ in items]), pmap)
+        for (name, _, header), image in zip(items, result):
+            fits.PrimaryHDU(image, header=header).writeto(os.path.join(output_folder, name), overwrite=True)
+        aligned += len(items)
+
+    for name in tqdm(names, desc="Aligning cutouts"):
+        try:
+            data, source_header = _read(os.path.join(source_folder, name))
+            target_data, header = _read(os.path.join(target_folder, name))
+            if data is None or target_data is None:
+                continue
+            source_wcs, target_wcs = WCS(source_header, naxis=2), WCS(header, naxis=2)
+            pmap = pixel_map(source_wcs, data.shape[-2:], target_wcs, target_data.shape[-2:])
+            cached = same_tangent_point(source_wcs, target_wcs)
+        except Exception as e:
+            logging.error(f"Error aligning {name}: {e}")
+            continue
+        out_header = target_wcs.to_header()
+        pending.setdefault(id(pmap), (pmap, []))[1].append((name, data.reshape(data.shape[-2:]), out_header))
+        # An uncached map belongs to this pair only, write it now instead of holding it until the end
+        if not cached or len(pending[id(pmap)][1]) >= batch_size:
+            flush(id(pmap))
+    for map_id in list(pending):
+        flush(map_id)
+
+    logging.info(f"Aligned {aligned} cutouts into {output_folder}, {len(_PIXEL_MAPS)} cached pixel maps")
+    return aligned
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    align_folder(SOURCE_FOLDER, TARGET_FOLDER, OUTPUT_FOLDER)
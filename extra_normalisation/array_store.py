@@ -0,0 +1,208 @@
+import os
+import csv
+import glob
+import json
+import shutil
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+# Configuration
+TRIPLET_DIR = r"C:\Users\tosee\Downloads\123\training\triplets_agn"
+STORE_DIR = r"C:\Users\tosee\Downloads\123\training\triplets_agn_store"
+SHARD_SIZE = 1024
+
+class ArrayStore:
+    """
+    Fixed-shape float32 samples packed into memory-mappable .npy shards of `shard_size`
+    samples, with an index mapping each key (sn_name, obs_id or coordinate key) to
+    (shard, offset).
+
+    The index is an append-only CSV, deletions are written as tombstones (shard -1) and
+    removed, together with the unused slots, by compact().
+    """
+
+    def __init__(self, root, sample_shape=None, shard_size=SHARD_SIZE, dtype="float32"):
+        self.root = root
+        self.meta_path = os.path.join(root, "meta.json")
+        self.index_path = os.path.join(root, "index.csv")
+        self.lock = threading.Lock()
+        self._shards = {}
+        self._recover()
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            self.sample_shape = tuple(meta["sample_shape"])
+            self.shard_size = meta["shard_size"]
+            self.dtype = np.dtype(meta["dtype"])
+        else:
+            if sample_shape is None:
+                raise ValueError(f"No store at {root}, sample_shape is needed to create one")
+            os.makedirs(root, exist_ok=True)
+            self.sample_shape = tuple(sample_shape)
+            self.shard_size = shard_size
+            self.dtype = np.dtype(dtype)
+            with open(self.meta_path, "w") as f:
+                json.dump({"sample_shape": list(self.sample_shape), "shard_size": self.shard_size,
+                           "dtype": self.dtype.str}, f)
+        self._load_index()
+
+    def _recover(self):
+        """Finish (or clean up after) a compact() that was interrupted."""
+        old_root, new_root = self.root + ".old", self.root + ".compact"
+        if not os.path.exists(self.root) and os.path.exists(old_root):
+            # The new store is complete once the old one has been moved aside
+            os.rename(new_root if os.path.exists(new_root) else old_root, self.root)
+        shutil.rmtree(new_root, ignore_errors=True)
+        shutil.rmtree(old_root, ignore_errors=True)
+
+    def _load_index(self):
+        self.index = {}
+        self.next_slot = 0
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, newline="") as f:
+            for key, shard, offset in csv.reader(f):
+                shard, offset = int(shard), int(offset)
+                if shard < 0:
+                    self.index.pop(key, None)
+                else:
+                    self.index[key] = (shard, offset)
+                    self.next_slot = max(self.next_slot, shard * self.shard_size + offset + 1)
+
+    def _shard_path(self, shard):
+        return os.path.join(self.root, f"shard_{shard:05d}.npy")
+
+    def _shard(self, shard, writable=False):
+        """Memory-map a shard, creating it (preallocated to shard_size) when writing."""
+        cached = self._shards.get(shard)
+        if cached is not None and (not writable or cached[1]):
+            return cached[0]
+        path = self._shard_path(shard)
+        if writable and not os.path.exists(path):
+            array = np.lib.format.open_memmap(path, mode="w+", dtype=self.dtype,
+                                              shape=(self.shard_size,) + self.sample_shape)
+        else:
+            array = np.load(path, mmap_mode="r+" if writable else "r")
+        self._shards[shard] = (array, writable)
+        return array
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return str(key) in self.index
+
+    def keys(self):
+        return list(self.index)
+
+    def append_batch(self, keys, arrays):
+        """Append samples (or overwrite keys already present) and record them in the index."""
+        arrays = np.asarray(arrays, dtype=self.dtype)
+        if arrays.shape[1:] != self.sample_shape:
+            raise ValueError(f"Expected samples of shape {self.sample_shape}, got {arrays.shape[1:]}")
+        with self.lock:
+            rows = []
+            for key, array in zip(keys, arrays):
+                shard, offset = divmod(self.next_slot, self.shard_size)
+                self._shard(shard, writable=True)[offset] = array
+                self.next_slot += 1
+                rows.append((str(key), shard, offset))
+            for shard in {shard for _, shard, _ in rows}:
+                self._shards[shard][0].flush()
+            with open(self.index_path, "a", newline="") as f:
+                csv.writer(f).writerows(rows)
+            self.index.update({key: (shard, offset) for key, shard, offset in rows})
+
+    def append(self, key, array):
+        self.append_batch([key], np.asarray(array)[None])
+
+    def delete(self, keys):
+        """Remove keys from the index, their slots are reclaimed by compact()."""
+        keys = [str(k) for k in keys if str(k) in self.index]
+        with self.lock:
+            with open(self.index_path, "a", newline="") as f:
+                csv.writer(f).writerows((key, -1, -1) for key in keys)
+            for key in keys:
+                del self.index[key]
+
+    def locate(self, keys=None):
+        """(key, shard, offset) table, sorted in storage order."""
+        keys = self.keys() if keys is None else [str(k) for k in keys]
+        table = pd.DataFrame([(k,) + self.index[k] for k in keys], columns=["key", "shard", "offset"])
+        return table.sort_values(["shard", "offset"], kind="stable").reset_index(drop=True)
+
+    def get(self, key):
+        shard, offset = self.index[str(key)]
+        return self._shard(shard)[offset]
+
+    def get_batch(self, keys, out=None):
+        """Read samples into one contiguous array, touching each shard once in storage order."""
+        keys = [str(k) for k in keys]
+        if out is None:
+            out = np.empty((len(keys),) + self.sample_shape, dtype=self.dtype)
+        located = np.array([self.index[k] for k in keys], dtype=np.int64).reshape(-1, 2)
+        order = np.lexsort((located[:, 1], located[:, 0]))
+        for shard in np.unique(located[:, 0]):
+            sel = order[located[order, 0] == shard]
+            out[sel] = self._shard(int(shard))[located[sel, 1]]
+        return out
+
+    def iter_shards(self):
+        """Yield (keys, samples) per shard in storage order for sequential scans."""
+        table = self.locate()
+        for shard, group in table.groupby("shard", sort=True):
+            yield group["key"].tolist(), self._shard(int(shard))[group["offset"].to_numpy()]
+
+    def compact(self):
+        """
+        Rewrite live samples into dense shards in storage order and drop tombstones.
+
+        The new shards and index are written to `<root>.compact` and swapped in with two
+        directory renames, and the old store is removed only after the swap, so the live
+        files are never touched while the copy is made. A store opened after a crash
+        between the renames is completed by _recover(). Arrays returned by get() keep
+        their old shard mapped and, on Windows, must be released before compacting.
+        """
+        with self.lock:
+            table = self.locate()
+            new_root, old_root = self.root + ".compact", self.root + ".old"
+            shutil.rmtree(new_root, ignore_errors=True)
+            compacted = ArrayStore(new_root, self.sample_shape, self.shard_size, self.dtype.str)
+            for start in range(0, len(table), self.shard_size):
+                chunk = table.iloc[start:start + self.shard_size]
+                samples = np.empty((len(chunk),) + self.sample_shape, dtype=self.dtype)
+                for shard, group in chunk.groupby("shard", sort=False):
+                    samples[np.flatnonzero(chunk["shard"].to_numpy() == shard)] = \
+                        self._shard(int(shard))[group["offset"].to_numpy()]
+                compacted.append_batch(chunk["key"].tolist(), samples)
+            # Drop the memory maps of both stores so the directories can be renamed
+            compacted._shards.clear()
+            self._shards.clear()
+            del compacted
+
+            os.rename(self.root, old_root)
+            os.rename(new_root, self.root)
+            shutil.rmtree(old_root, ignore_errors=True)  # anything left is removed by the next _recover()
+            self._load_index()
+        logging.info(f"Compacted {self.root} to {len(self)} samples in {-(-len(self) // self.shard_size)} shards")
+
+def import_npy_directory(store, folder, pattern="*_triplet.npy", batch_size=256):
+    """Pack per-file .npy samples into the store, keyed by filename without `_triplet.npy`."""
+    files = sorted(glob.glob(os.path.join(folder, pattern)))
+    todo = [(f, os.path.basename(f).replace("_triplet.npy", "").replace(".npy", "")) for f in files]
+    todo = [(f, key) for f, key in todo if key not in store]
+    for start in tqdm(range(0, len(todo), batch_size), desc="Packing arrays"):
+        batch = todo[start:start + batch_size]
+        store.append_batch([key for _, key in batch], np.stack([np.load(f) for f, _ in batch]))
+    return len(todo)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    first = sorted(glob.glob(os.path.join(TRIPLET_DIR, "*_triplet.npy")))[0]
+    store = ArrayStore(STORE_DIR, sample_shape=np.load(first, mmap_mode="r").shape)
+    added = import_npy_directory(store, TRIPLET_DIR)
+    logging.info(f"Packed {added} new triplets, store now holds {len(store)} samples")
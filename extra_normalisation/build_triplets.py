@@ -0,0 +1,150 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from tqdm import tqdm
+from check_image_quality import load_fits_image
+from image_index import open_index, update_all, IMAGE_INDEX_DB
+from resize_images import resize_batch
+from array_store import ArrayStore
+from psf_subtraction import psf_matched_difference
+try:
+    from stage_metrics import span
+except ImportError:  # stage_metrics.py sits at the repository root, run untimed without it
+    from contextlib import nullcontext
+    from types import SimpleNamespace
+    def span(stage, **labels):
+        return nullcontext(SimpleNamespace(count=lambda items=1, **counters: None))
+
+# Configuration
+SCIENCE_SURVEY = "ztf_r"
+REFERENCE_SURVEY = "dss2_red"
+IMAGE_FOLDERS = {
+    SCIENCE_SURVEY: r"C:\Users\tosee\Downloads\123\ztf_r",
+    REFERENCE_SURVEY: r"C:\Users\tosee\Downloads\123\dss2_red",
+}
+STORE_DIR = r"C:\Users\tosee\Downloads\123\training\triplets_store"
+TRAINING_SHAPE = (128, 128)
+CHUNK_SIZE = 32
+MAX_WORKERS = os.cpu_count()
+
+def matched_pairs(conn, science_survey=SCIENCE_SURVEY, reference_survey=REFERENCE_SURVEY):
+    """
+    Yield (object_key, science_path, reference_path) for every object that has a usable
+    (readable, not null) cutout in both surveys, straight from the image index.
+    """
+    rows = conn.execute(
+        "SELECT s.object_key, s.path, r.path FROM images s "
+        "JOIN images r ON r.object_key = s.object_key AND r.survey = ? "
+        "WHERE s.survey = ? "
+        "AND COALESCE(s.status, 'ok') = 'ok' AND COALESCE(r.status, 'ok') = 'ok' "
+        "AND COALESCE(s.is_null, 0) = 0 AND COALESCE(r.is_null, 0) = 0 "
+        "ORDER BY s.object_key",
+        (reference_survey, science_survey))
+    yield from rows
+
+def normalise_batch(stack):
+    """
+    Bring a stack of images (N, H, W) to a common scale: subtract each image's median and
+    divide by its robust (MAD based) standard deviation. NaNs become 0 afterwards.
+    """
+    stack = np.asarray(stack, dtype=np.float32)
+    median = np.nanmedian(stack, axis=(-2, -1), keepdims=True)
+    mad = np.nanmedian(np.abs(stack - median), axis=(-2, -1), keepdims=True)
+    scale = 1.4826 * mad
+    scale[~(scale > 0)] = 1.0
+    return np.nan_to_num((stack - median) / scale, nan=0.0, posinf=0.0, neginf=0.0)
+
+def make_triplets(science, reference, absolute=True, psf_match=False):
+    """
+    Stack normalised science, reference and difference channels into (N, 3, H, W).
+
+    The difference is |science - reference| like check_image_quality.compute_difference,
+    or the signed difference when `absolute` is False. With `psf_match` the reference is
+    PSF- and flux-matched to the science image first (psf_subtraction.py).
+    """
+    science = normalise_batch(science)
+    reference = normalise_batch(reference)
+    if psf_match:
+        difference, _ = psf_matched_difference(science, reference, workers=1)
+    else:
+        difference = science - reference
+    if absolute:
+        np.abs(difference, out=difference)
+    return np.stack([science, reference, difference], axis=1)
+
+def build_triplet_chunk(pairs, training_shape=TRAINING_SHAPE, absolute=True, psf_match=False):
+    """
+    Worker: load one chunk of pairs and return (keys, triplets) at the training shape.
+
+    Pairs whose cutouts share a shape are differenced at native resolution in one batch,
+    mismatched pairs are resized to the training shape before differencing.
+    """
+    by_shape = {}
+    for key, science_path, reference_path in pairs:
+        science = load_fits_image(science_path)
+        reference = load_fits_image(reference_path)
+        if science is None or reference is None or science.ndim != 2 or reference.ndim != 2:
+            continue
+        if science.shape != reference.shape:
+            science = resize_batch(science[None], training_shape)[0]
+            reference = resize_batch(reference[None], training_shape)[0]
+        by_shape.setdefault(science.shape, []).append((key, science, reference))
+
+    keys, triplets = [], []
+    for group in by_shape.values():
+        batch = make_triplets(np.stack([g[1] for g in group]), np.stack([g[2] for g in group]), absolute, psf_match)
+        keys.extend(g[0] for g in group)
+        triplets.append(resize_batch(batch, training_shape))
+    if not keys:
+        return [], None
+    return keys, np.concatenate(triplets)
+
+def build_triplets(conn, store, chunk_size=CHUNK_SIZE, max_workers=MAX_WORKERS, absolute=True, psf_match=False):
+    """
+    Build (3, H, W) triplets for every matched pair not already in the store.
+
+    Chunks of pairs are processed on a process pool with at most two chunks per worker in
+    flight, so memory stays bounded, and results are appended to the store as they finish.
+    Rerunning resumes from whatever the store already holds.
+    """
+    pairs = [p for p in matched_pairs(conn) if p[0] not in store]
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    logging.info(f"{len(pairs)} pairs to build in {len(chunks)} chunks, {len(store)} already stored")
+
+    built = 0
+    training_shape = store.sample_shape[-2:]
+    with span("build_triplets", psf_match=psf_match) as metrics, ProcessPoolExecutor(max_workers=max_workers) as executor, \
+            tqdm(total=len(pairs), desc="Building triplets") as bar:
+        pending, sizes = set(), {}
+        for chunk in chunks:
+            if len(pending) >= 2 * max_workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                built += sum(_store_result(f, store, bar, sizes.pop(f)) for f in finished)
+            future = executor.submit(build_triplet_chunk, chunk, training_shape, absolute, psf_match)
+            pending.add(future)
+            sizes[future] = len(chunk)
+        built += sum(_store_result(f, store, bar, sizes.pop(f)) for f in wait(pending)[0])
+        metrics.count(built)
+    return built
+
+def _store_result(future, store, bar, n_pairs):
+    """Append a finished chunk to the store; the bar advances by every pair processed, built or not."""
+    bar.update(n_pairs)
+    try:
+        keys, triplets = future.result()
+    except Exception as e:
+        logging.error(f"Triplet chunk failed: {e}")
+        return 0
+    if keys:
+        store.append_batch(keys, triplets)
+    return len(keys)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    conn = open_index(IMAGE_INDEX_DB)
+    update_all(conn, IMAGE_FOLDERS)
+    store = ArrayStore(STORE_DIR, sample_shape=(3,) + TRAINING_SHAPE)
+    built = build_triplets(conn, store)
+    conn.close()
+    logging.info(f"Built {built} triplets, store now holds {len(store)}")
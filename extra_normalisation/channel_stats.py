@@ -0,0 +1,200 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from triplet_loader import close_source, open_source, source_keys
+
+# Configuration
+DATA_SOURCE = r"C:\Users\tosee\Downloads\123\training\triplets_agn_store"
+STATS_FILE = r"C:\Users\tosee\Downloads\123\training\channel_stats.npz"
+CHANNEL_NAMES = ("science", "reference", "difference")
+RELATIVE_ACCURACY = 0.01   # quantile sketch error, relative to the value
+SKETCH_RANGE = 1e30        # |values| above this (or below 1/this) fall into the edge buckets
+CLIP_QUANTILES = (0.005, 0.995)
+BATCH_SIZE = 256
+MAX_WORKERS = os.cpu_count()
+
+class QuantileSketch:
+    """
+    DDSketch-style quantile sketch per channel: values are counted in logarithmic
+    buckets (gamma = (1 + a) / (1 - a)) separately for positive and negative values, so
+    any quantile is returned within relative error `a`. Buckets are fixed-size arrays, so
+    two sketches merge by adding counts, which makes it safe to build in parallel.
+    """
+
+    def __init__(self, n_channels, relative_accuracy=RELATIVE_ACCURACY, value_range=SKETCH_RANGE):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.offset = int(np.ceil(np.log(value_range) / self.log_gamma))
+        n_buckets = 2 * self.offset + 1
+        self.positive = np.zeros((n_channels, n_buckets), dtype=np.int64)
+        self.negative = np.zeros((n_channels, n_buckets), dtype=np.int64)
+        self.zero = np.zeros(n_channels, dtype=np.int64)
+
+    def _buckets(self, magnitudes):
+        keys = np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64) + self.offset
+        return np.clip(keys, 0, self.positive.shape[1] - 1)
+
+    def update(self, channel, values):
+        """Add the finite values of one channel."""
+        values = values[np.isfinite(values)]
+        n = self.positive.shape[1]
+        self.zero[channel] += np.count_nonzero(values == 0)
+        self.positive[channel] += np.bincount(self._buckets(values[values > 0]), minlength=n)
+        self.negative[channel] += np.bincount(self._buckets(-values[values < 0]), minlength=n)
+
+    def merge(self, other):
+        self.positive += other.positive
+        self.negative += other.negative
+        self.zero += other.zero
+        return self
+
+    def _value(self, bucket):
+        return 2 * self.gamma ** (bucket - self.offset) / (self.gamma + 1)
+
+    def quantile(self, channel, q):
+        """Value at quantile q (0..1) of one channel, NaN when the channel is empty."""
+        negative = self.negative[channel][::-1]
+        counts = np.concatenate([negative, [self.zero[channel]], self.positive[channel]])
+        total = counts.sum()
+        if total == 0:
+            return np.nan
+        index = int(np.searchsorted(np.cumsum(counts), q * (total - 1), side="right"))
+        n = len(negative)
+        if index < n:
+            return -self._value(n - 1 - index)
+        if index == n:
+            return 0.0
+        return self._value(index - n - 1)
+
+class ChannelStats:
+    """
+    Dataset-wide per-channel count, mean, variance (Welford / Chan et al. parallel
+    update), min, max and a quantile sketch, accumulated batch by batch in bounded
+    memory. Stats built on separate workers or on separate days merge exactly, apart
+    from the sketch's bounded quantile error.
+    """
+
+    def __init__(self, n_channels, relative_accuracy=RELATIVE_ACCURACY):
+        self.n_channels = n_channels
+        self.count = np.zeros(n_channels, dtype=np.int64)
+        self.mean = np.zeros(n_channels)
+        self.m2 = np.zeros(n_channels)
+        self.min = np.full(n_channels, np.inf)
+        self.max = np.full(n_channels, -np.inf)
+        self.sketch = QuantileSketch(n_channels, relative_accuracy)
+        self.keys = set()
+
+    def _combine(self, count, mean, m2):
+        """Chan et al. merge of (count, mean, M2) into the running totals."""
+        total = self.count + count
+        safe = np.maximum(total, 1)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / safe
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / safe
+        self.count = total
+
+    def update(self, batch, keys=()):
+        """Add a (N, C, H, W) batch, ignoring non-finite pixels."""
+        batch = np.asarray(batch)
+        values = np.moveaxis(batch, 1, 0).reshape(self.n_channels, -1).astype(np.float64)
+        finite = np.isfinite(values)
+        count = finite.sum(axis=1)
+        safe = np.maximum(count, 1)
+        mean = np.where(finite, values, 0).sum(axis=1) / safe
+        m2 = np.where(finite, (values - mean[:, None]) ** 2, 0).sum(axis=1)
+        self._combine(count, mean, m2)
+        self.min = np.minimum(self.min, np.where(finite, values, np.inf).min(axis=1))
+        self.max = np.maximum(self.max, np.where(finite, values, -np.inf).max(axis=1))
+        for channel in range(self.n_channels):
+            self.sketch.update(channel, values[channel])
+        self.keys.update(str(k) for k in keys)
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other.m2)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.sketch.merge(other.sketch)
+        self.keys |= other.keys
+        return self
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / np.maximum(self.count - 1, 1))
+
+    def quantiles(self, q):
+        return np.array([self.sketch.quantile(c, q) for c in range(self.n_channels)])
+
+    def summary(self, channel_names=CHANNEL_NAMES, clip_quantiles=CLIP_QUANTILES):
+        """Per-channel table of the values CNN input normalisation needs."""
+        names = list(channel_names) if len(channel_names) == self.n_channels else list(range(self.n_channels))
+        table = pd.DataFrame({"channel": names, "count": self.count, "mean": self.mean, "std": self.std,
+                              "min": self.min, "max": self.max})
+        for q in clip_quantiles:
+            table[f"q{q * 100:g}"] = self.quantiles(q)
+        return table
+
+    def save(self, path):
+        np.savez(path, count=self.count, mean=self.mean, m2=self.m2, min=self.min, max=self.max,
+                 positive=self.sketch.positive, negative=self.sketch.negative, zero=self.sketch.zero,
+                 relative_accuracy=self.sketch.relative_accuracy, keys=np.array(sorted(self.keys), dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            stats = cls(len(data["count"]), float(data["relative_accuracy"]))
+            stats.count, stats.mean, stats.m2 = data["count"], data["mean"], data["m2"]
+            stats.min, stats.max = data["min"], data["max"]
+            stats.sketch.positive, stats.sketch.negative = data["positive"], data["negative"]
+            stats.sketch.zero = data["zero"]
+            stats.keys = set(data["keys"].tolist())
+        return stats
+
+def stats_for_keys(path, keys, batch_size=BATCH_SIZE):
+    """Worker: accumulate stats over a list of keys of one data source."""
+    source = open_source(path)
+    try:
+        stats = ChannelStats(source.sample_shape[0])
+        for start in range(0, len(keys), batch_size):
+            batch_keys = keys[start:start + batch_size]
+            stats.update(source.get_batch(batch_keys), batch_keys)
+    finally:
+        close_source(source)
+    return stats
+
+def compute_stats(path, previous=None, max_workers=MAX_WORKERS, batch_size=BATCH_SIZE):
+    """
+    One pass over a triplet folder, ArrayStore or compressed array file. Keys already
+    counted in `previous` are skipped, so rerunning after new triplets arrive only reads
+    the new ones. Key ranges are processed in parallel and merged.
+    """
+    source = open_source(path)
+    try:
+        keys = source_keys(source)
+    finally:
+        close_source(source)
+    if previous is not None:
+        keys = [k for k in keys if k not in previous.keys]
+    logging.info(f"Accumulating stats over {len(keys)} new samples")
+    parts = max(1, min(max_workers * 4, -(-len(keys) // batch_size)))
+    step = -(-len(keys) // parts) if keys else 1
+    chunks = [keys[i:i + step] for i in range(0, len(keys), step)]
+
+    stats = previous
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(stats_for_keys, path, chunk, batch_size) for chunk in chunks]
+        for future in tqdm(futures, desc="Channel stats"):
+            part = future.result()
+            stats = part if stats is None else stats.merge(part)
+    return stats
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    previous = ChannelStats.load(STATS_FILE) if os.path.exists(STATS_FILE) else None
+    stats = compute_stats(DATA_SOURCE, previous)
+    if stats is not None:
+        stats.save(STATS_FILE)
+        logging.info(f"Per-channel statistics over {len(stats.keys)} samples:\n{stats.summary().to_string(index=False)}")
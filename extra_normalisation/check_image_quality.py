@@ -1,7 +1,18 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from astropy.io import fits
+from fits_quality_scan import rows_in_folder
+from image_index import open_index, folder_stats, IMAGE_INDEX_DB
+try:
+    from stage_metrics import span
+except ImportError:  # stage_metrics.py sits at the repository root, run untimed without it
+    from contextlib import nullcontext
+    from types import SimpleNamespace
+    def span(stage, **labels):
+        return nullcontext(SimpleNamespace(count=lambda items=1, **counters: None))
 
 def load_fits_image(filepath):
     """Load a FITS image as a NumPy array."""
@@ -68,44 +79,140 @@ def evaluate_triplet(science_image, reference_image, diff_image, filename, super
     print(result)
     return filename, sci_mean, sci_std, ref_mean, ref_std, diff_mean, diff_std, snr_diff, result
 
+RESULT_COLUMNS = ["Filename", "Science_Mean", "Science_Std", "Reference_Mean", "Reference_Std",
+                  "Diff_Mean", "Diff_Std", "SNR", "Result"]
+
+def evaluate_triplet_stack(triplets, filenames, regions=None, snr_threshold=5.0):
+    """
+    Batch version of evaluate_triplet for a stack of (science, reference, difference)
+    triplets of shape (N, 3, H, W).
+
+    All means and standard deviations come from one nanmean/nanstd call over the stack,
+    and the Good/Moderate/Poor rule of evaluate_triplet is applied as array masks.
+
+    Args:
+        triplets (numpy.ndarray): Stack of triplets.
+        filenames (list): Name per triplet.
+        regions (dict, optional): Name -> (x1, y1, x2, y2) regions of the difference image to
+            compute SNR in. The first region drives the result, with none the whole image does.
+        snr_threshold (float): SNR above which a triplet can be "Good".
+
+    Returns:
+        pandas.DataFrame: The triplet_evaluation_results.csv columns, plus SNR_<name> for
+        each extra region.
+    """
+    triplets = np.asarray(triplets, dtype=np.float32)
+    means = np.nanmean(triplets, axis=(-2, -1))
+    stds = np.nanstd(triplets, axis=(-2, -1))
+
+    snrs = {}
+    for name, (x1, y1, x2, y2) in (regions or {"image": (None, None, None, None)}).items():
+        region = triplets[:, 2, y1:y2, x1:x2]
+        signal = np.nanmean(region, axis=(-2, -1))
+        noise = np.nanstd(region, axis=(-2, -1))
+        snrs[name] = np.where(noise > 0, signal / np.where(noise > 0, noise, 1), 0)
+    snr = next(iter(snrs.values()))
+
+    sci_mean = means[:, 0]
+    result = np.select(
+        [(sci_mean > snr) & (snr > snr_threshold), (sci_mean > snr) & (snr < snr_threshold)],
+        [" Good triplet", " Moderate triplet"], default=" Poor triplet")
+
+    table = pd.DataFrame({
+        "Filename": list(filenames),
+        "Science_Mean": sci_mean, "Science_Std": stds[:, 0],
+        "Reference_Mean": means[:, 1], "Reference_Std": stds[:, 1],
+        "Diff_Mean": means[:, 2], "Diff_Std": stds[:, 2],
+        "SNR": snr, "Result": result,
+    })
+    for name, values in list(snrs.items())[1:]:
+        table[f"SNR_{name}"] = values
+    return table
+
+def _load_pair(science_folder, reference_folder, filename):
+    return (load_fits_image(os.path.join(science_folder, filename)),
+            load_fits_image(os.path.join(reference_folder, filename)))
+
+def run_batch_qa(science_folder, reference_folder, filenames, log_file, regions=None,
+                 snr_threshold=5.0, batch_size=32, max_workers=8, flagged=None):
+    """
+    Evaluate matched science/reference FITS pairs in batches and write the results table
+    in a single write. FITS files are loaded on a thread pool, each batch is stacked into
+    (N, 3, H, W) with the |science - reference| difference and evaluated at once.
+
+    Pairs in `flagged` (filename -> reason, e.g. from unusable_reasons) are not loaded but
+    reported as Poor with the reason in a Reason column.
+    """
+    filenames = sorted(filenames)
+    tables = []
+    with span("batch_qa", batch_size=batch_size) as metrics, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for start in range(0, len(filenames), batch_size):
+            names = filenames[start:start + batch_size]
+            pairs = list(executor.map(lambda f: _load_pair(science_folder, reference_folder, f), names))
+            by_shape = {}
+            for name, (science_image, reference_image) in zip(names, pairs):
+                if science_image is None or reference_image is None or science_image.shape != reference_image.shape:
+                    print(f" Skipping {name}: Could not load images.")
+                    continue
+                by_shape.setdefault(science_image.shape, []).append((name, science_image, reference_image))
+            for group in by_shape.values():
+                science = np.stack([g[1] for g in group])
+                reference = np.stack([g[2] for g in group])
+                triplets = np.stack([science, reference, np.abs(science - reference)], axis=1)
+                tables.append(evaluate_triplet_stack(triplets, [g[0] for g in group], regions, snr_threshold))
+                metrics.count(len(group))
+
+    if flagged:
+        tables.append(pd.DataFrame({"Filename": sorted(flagged), "SNR": 0.0, "Result": " Poor triplet",
+                                    "Reason": [flagged[f] for f in sorted(flagged)]}))
+    results = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=RESULT_COLUMNS)
+    results.to_csv(log_file, index=False)
+    print(results["Result"].value_counts().to_string())
+    return results
+
+def run_store_qa(store, log_file, regions=None, snr_threshold=5.0):
+    """Evaluate every triplet in an array_store.ArrayStore shard by shard and write the table once."""
+    tables = [evaluate_triplet_stack(triplets, keys, regions, snr_threshold) for keys, triplets in store.iter_shards()]
+    results = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=RESULT_COLUMNS)
+    results.to_csv(log_file, index=False)
+    return results
+
 # Folder paths
 science_folder = r'C:\Users\tosee\Downloads\123\ztf_r'
 reference_folder = r'C:\Users\tosee\Downloads\123\dss2_red'
 
-# Get list of FITS files
-science_files = {f for f in os.listdir(science_folder) if f.endswith('.fits')}
-reference_files = {f for f in os.listdir(reference_folder) if f.endswith('.fits')}
-
-# Find matching files
-matched_files = science_files.intersection(reference_files)
-
 supernova_region = (50, 50, 100, 100)
 
-# Log results
-log_file = "triplet_evaluation_results.csv"
-with open(log_file, "w") as log:
-    log.write("Filename,Science_Mean,Science_Std,Reference_Mean,Reference_Std,Diff_Mean,Diff_Std,SNR,Result\n")
-
-    for filename in matched_files:
-        sci_path = os.path.join(science_folder, filename)
-        ref_path = os.path.join(reference_folder, filename)
-
-        # Load the images
-        science_image = load_fits_image(sci_path)
-        reference_image = load_fits_image(ref_path)
-
-        # Check if images loaded successfully
-        if science_image is None or reference_image is None:
-            print(f" Skipping {filename}: Could not load images.")
-            continue
-
-        # Compute the difference image
-        diff_image = compute_difference(science_image, reference_image)
-
-        # Evaluate triplet quality
-        result = evaluate_triplet(science_image, reference_image, diff_image, filename, supernova_region)
-
-        # Save results to log file
-        log.write(",".join(map(str, result)) + "\n")
-
-print(f"\n Processing complete. Results saved in {log_file}.")
+def unusable_reasons(stats, folder):
+    """{filename: reason} for files in a folder that the quality scan found unreadable or null."""
+    rows = stats[rows_in_folder(stats, folder)]
+    unreadable = rows["status"].ne("ok")
+    null = ~unreadable & rows["is_null"].astype(bool)
+    reasons = dict(zip(rows.loc[unreadable, "filename"], "unreadable: " + rows.loc[unreadable, "status"].astype(str)))
+    reasons.update(dict.fromkeys(rows.loc[null, "filename"], "null image"))
+    return reasons
+
+if __name__ == "__main__":
+    # List the FITS files from the image index, its cached quality stats flag null images
+    conn = open_index(IMAGE_INDEX_DB)
+    science = folder_stats(conn, science_folder, "ztf_r", extensions=('.fits',))
+    reference = folder_stats(conn, reference_folder, "dss2_red", extensions=('.fits',))
+    conn.close()
+
+    # Find matching files
+    matched_files = set(science["filename"]) & set(reference["filename"])
+
+    # Pairs the index flags null or unreadable are reported as Poor without being loaded
+    flagged = {}
+    for label, stats, folder in (("science", science, science_folder), ("reference", reference, reference_folder)):
+        for filename, reason in unusable_reasons(stats, folder).items():
+            if filename in matched_files:
+                flagged[filename] = f"{flagged[filename]}; {label} {reason}" if filename in flagged else f"{label} {reason}"
+    print(f" {len(flagged)} pairs flagged null or unreadable in the image index are reported as Poor")
+
+    # Evaluate all pairs in batches and write the results table once
+    log_file = "triplet_evaluation_results.csv"
+    run_batch_qa(science_folder, reference_folder, matched_files - flagged.keys(), log_file,
+                 regions={"supernova": supernova_region}, flagged=flagged)
+
+    print(f"\n Processing complete. Results saved in {log_file}.")
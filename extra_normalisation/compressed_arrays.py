@@ -0,0 +1,264 @@
+import os
+import glob
+import json
+import zlib
+import time
+import struct
+import logging
+import numpy as np
+from tqdm import tqdm
+
+# Configuration
+TRIPLET_DIR = r"C:\Users\tosee\Downloads\123\training\triplets_agn"
+OUTPUT_FILE = r"C:\Users\tosee\Downloads\123\training\triplets_agn.carr"
+CHUNK_SIZE = 32          # samples per independently compressed chunk
+COMPRESSION_LEVEL = 6
+MODES = ("lossless", "float16", "uint16")
+
+MAGIC = b"CARR1\0"
+_FOOTER = struct.Struct("<Q")
+_UINT16_NAN = 65535      # uint16 code reserved for NaN, data uses 0..65534
+
+def shuffle_bytes(array):
+    """Group byte k of every element together (HDF5/blosc shuffle), zlib then sees long runs of similar bytes."""
+    raw = np.ascontiguousarray(array).view(np.uint8).reshape(-1, array.dtype.itemsize)
+    return raw.T.tobytes()
+
+def unshuffle_bytes(buffer, dtype, shape):
+    dtype = np.dtype(dtype)
+    raw = np.frombuffer(buffer, dtype=np.uint8).reshape(dtype.itemsize, -1)
+    return np.ascontiguousarray(raw.T).view(dtype).reshape(shape)
+
+def _scale_axes(chunk):
+    """Axes reduced for one zero-point / scale: everything but the sample and, for (C, H, W) samples, the channel axis."""
+    return tuple(range(2 if chunk.ndim >= 4 else 1, chunk.ndim))
+
+def quantise(chunk, mode):
+    """
+    Convert a chunk to its stored representation.
+
+    Returns:
+        (numpy.ndarray, float or list, float or list): Stored array, zero-point and scale.
+        Lossless and float16 chunks use zero-point 0 and scale 1 (float16 refuses values
+        outside its range), uint16 chunks map [min, max] of every sample and channel onto
+        0..65534 and keep NaN as 65535, with one zero-point and scale per sample and channel
+        as nested lists.
+    """
+    if mode == "lossless":
+        return chunk, 0.0, 1.0
+    if mode == "float16":
+        peak = np.abs(chunk[np.isfinite(chunk)]).max(initial=0)
+        if peak > np.finfo(np.float16).max:
+            raise ValueError(f"Values up to {peak:g} overflow float16 (max {np.finfo(np.float16).max:g}), "
+                             f"use uint16 or lossless")
+        return chunk.astype(np.float16), 0.0, 1.0
+    if mode != "uint16":
+        raise ValueError(f"Unknown mode {mode}, expected one of {MODES}")
+    values = chunk.astype(np.float64)
+    finite = np.isfinite(values)
+    axes = _scale_axes(values)
+    zero = np.where(finite, values, np.inf).min(axis=axes, keepdims=True)
+    span = np.where(finite, values, -np.inf).max(axis=axes, keepdims=True) - zero
+    empty = ~np.isfinite(zero)      # samples / channels without a finite value
+    zero[empty], span[empty] = 0.0, 0.0
+    scale = np.where(span > 0, span / (_UINT16_NAN - 1), 1.0)
+    codes = np.rint((np.where(finite, values, zero) - zero) / scale)
+    codes = np.clip(codes, 0, _UINT16_NAN - 1).astype(np.uint16)
+    codes[~finite] = _UINT16_NAN
+    return codes, np.squeeze(zero, axis=axes).tolist(), np.squeeze(scale, axis=axes).tolist()
+
+def dequantise(stored, mode, zero, scale, dtype):
+    if mode == "uint16":
+        # zero / scale are scalars in files written before they were stored per sample and channel
+        zero, scale = np.asarray(zero, dtype=np.float64), np.asarray(scale, dtype=np.float64)
+        zero, scale = (a.reshape(a.shape + (1,) * (stored.ndim - a.ndim)) for a in (zero, scale))
+        out = (stored * scale + zero).astype(dtype)
+        out[stored == _UINT16_NAN] = np.nan
+        return out
+    return stored.astype(dtype, copy=False)
+
+class CompressedArrayWriter:
+    """
+    Write samples of one shape to a chunked, compressed array file.
+
+    Layout: magic, then one zlib-compressed, byte-shuffled blob per chunk of
+    `chunk_size` samples, then a JSON footer (shape, dtype, mode, keys and the offset,
+    size, zero-points and scales of every chunk) and its length. Samples can be written in
+    any batch size, they are buffered until a chunk is full.
+    """
+
+    def __init__(self, path, sample_shape, dtype="float32", mode="lossless", chunk_size=CHUNK_SIZE,
+                 level=COMPRESSION_LEVEL):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode}, expected one of {MODES}")
+        self.path = path
+        self.sample_shape = tuple(sample_shape)
+        self.dtype = np.dtype(dtype)
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.level = level
+        self.keys = []
+        self.chunks = []
+        self._pending = []
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+
+    def write(self, keys, samples):
+        samples = np.asarray(samples, dtype=self.dtype)
+        if samples.shape[1:] != self.sample_shape:
+            raise ValueError(f"Expected samples of shape {self.sample_shape}, got {samples.shape[1:]}")
+        self.keys.extend(str(k) for k in keys)
+        self._pending.extend(samples)
+        while len(self._pending) >= self.chunk_size:
+            self._write_chunk(np.stack(self._pending[:self.chunk_size]))
+            del self._pending[:self.chunk_size]
+
+    def _write_chunk(self, chunk):
+        stored, zero, scale = quantise(chunk, self.mode)
+        blob = zlib.compress(shuffle_bytes(stored), self.level)
+        self.chunks.append({"offset": self._file.tell(), "nbytes": len(blob), "count": len(chunk),
+                            "zero": zero, "scale": scale})
+        self._file.write(blob)
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._pending:
+            self._write_chunk(np.stack(self._pending))
+            self._pending = []
+        footer = json.dumps({
+            "sample_shape": list(self.sample_shape), "dtype": self.dtype.str, "mode": self.mode,
+            "chunk_size": self.chunk_size, "keys": self.keys, "chunks": self.chunks,
+        }).encode()
+        self._file.write(footer)
+        self._file.write(_FOOTER.pack(len(footer)))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CompressedArrayReader:
+    """
+    Random-access reader for files written by CompressedArrayWriter. Only the chunks
+    holding the requested samples are read and decoded, the last decoded chunk is kept.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a compressed array file")
+        self._file.seek(-_FOOTER.size, os.SEEK_END)
+        (footer_size,) = _FOOTER.unpack(self._file.read(_FOOTER.size))
+        self._file.seek(-_FOOTER.size - footer_size, os.SEEK_END)
+        meta = json.loads(self._file.read(footer_size))
+        self.sample_shape = tuple(meta["sample_shape"])
+        self.dtype = np.dtype(meta["dtype"])
+        self.mode = meta["mode"]
+        self.chunk_size = meta["chunk_size"]
+        self.chunks = meta["chunks"]
+        self.keys = meta["keys"]
+        self.key_index = {key: i for i, key in enumerate(self.keys)}
+        self._cached = (None, None)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return str(key) in self.key_index
+
+    @property
+    def stored_dtype(self):
+        return {"lossless": self.dtype, "float16": np.dtype(np.float16), "uint16": np.dtype(np.uint16)}[self.mode]
+
+    def read_chunk(self, i):
+        """Decode chunk `i` into a (count,) + sample_shape array."""
+        if self._cached[0] == i:
+            return self._cached[1]
+        info = self.chunks[i]
+        self._file.seek(info["offset"])
+        buffer = zlib.decompress(self._file.read(info["nbytes"]))
+        stored = unshuffle_bytes(buffer, self.stored_dtype, (info["count"],) + self.sample_shape)
+        chunk = dequantise(stored, self.mode, info["zero"], info["scale"], self.dtype)
+        self._cached = (i, chunk)
+        return chunk
+
+    def read(self, indices, out=None):
+        """Read samples by position into one contiguous array, decoding each needed chunk once."""
+        indices = np.asarray(indices, dtype=np.int64)
+        if out is None:
+            out = np.empty((len(indices),) + self.sample_shape, dtype=self.dtype)
+        chunk_ids = indices // self.chunk_size
+        for chunk_id in np.unique(chunk_ids):
+            sel = np.flatnonzero(chunk_ids == chunk_id)
+            out[sel] = self.read_chunk(int(chunk_id))[indices[sel] % self.chunk_size]
+        return out
+
+    def get_batch(self, keys, out=None):
+        return self.read([self.key_index[str(k)] for k in keys], out)
+
+    def get(self, key):
+        return self.get_batch([key])[0]
+
+    def iter_chunks(self):
+        """Yield (keys, samples) per chunk for sequential scans."""
+        for i in range(len(self.chunks)):
+            start = i * self.chunk_size
+            chunk = self.read_chunk(i)
+            yield self.keys[start:start + len(chunk)], chunk
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def pack_store(store, path, mode="lossless", chunk_size=CHUNK_SIZE):
+    """Write every sample of an ArrayStore to a compressed array file in storage order."""
+    with CompressedArrayWriter(path, store.sample_shape, store.dtype, mode, chunk_size) as writer:
+        for keys, samples in tqdm(store.iter_shards(), desc="Compressing shards"):
+            writer.write(keys, samples)
+    return len(writer.keys)
+
+def pack_npy_directory(folder, path, pattern="*_triplet.npy", mode="lossless", chunk_size=CHUNK_SIZE,
+                       dtype="float32"):
+    """
+    Pack per-file .npy samples into a compressed array file, keyed by filename without
+    `_triplet.npy`. Triplets written as float64 are stored as float32 by default.
+    """
+    files = sorted(glob.glob(os.path.join(folder, pattern)))
+    if not files:
+        return 0
+    sample_shape = np.load(files[0], mmap_mode="r").shape
+    with CompressedArrayWriter(path, sample_shape, dtype, mode, chunk_size) as writer:
+        for start in tqdm(range(0, len(files), chunk_size), desc="Compressing arrays"):
+            batch = files[start:start + chunk_size]
+            keys = [os.path.basename(f).replace("_triplet.npy", "").replace(".npy", "") for f in batch]
+            writer.write(keys, np.stack([np.load(f) for f in batch]))
+    return len(files)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    files = sorted(glob.glob(os.path.join(TRIPLET_DIR, "*_triplet.npy")))
+    raw_bytes = sum(os.path.getsize(f) for f in files)
+    start = time.perf_counter()
+    for f in files:
+        np.load(f)
+    npy_seconds = time.perf_counter() - start
+
+    for mode in MODES:
+        path = OUTPUT_FILE.replace(".carr", f"_{mode}.carr")
+        pack_npy_directory(TRIPLET_DIR, path, mode=mode)
+        start = time.perf_counter()
+        with CompressedArrayReader(path) as reader:
+            for _ in reader.iter_chunks():
+                pass
+        seconds = time.perf_counter() - start
+        logging.info(f"{mode}: {raw_bytes / os.path.getsize(path):.2f}x smaller, full read {seconds:.2f}s "
+                     f"(per-file .npy {npy_seconds:.2f}s)")
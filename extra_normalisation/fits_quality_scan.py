@@ -0,0 +1,170 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from astropy.io import fits
+from tqdm import tqdm
+try:
+    from stage_metrics import span
+except ImportError:  # stage_metrics.py sits at the repository root, run untimed without it
+    from contextlib import nullcontext
+    from types import SimpleNamespace
+    def span(stage, **labels):
+        return nullcontext(SimpleNamespace(count=lambda items=1, **counters: None))
+
+# Configuration
+FITS_FOLDERS = {
+    "ztf_r": r"C:\Users\tosee\Downloads\123\ztf_r",
+    "dss2_red": r"C:\Users\tosee\Downloads\123\dss2_red",
+}
+STATS_CSV = "fits_quality_stats.csv"
+MAX_WORKERS = os.cpu_count()
+
+STATS_COLUMNS = [
+    "survey", "filename", "path", "status", "height", "width", "dtype",
+    "n_pixels", "n_nan", "n_null", "null_fraction", "nan_fraction",
+    "all_zero", "all_nan", "is_null", "mean", "std", "min", "max", "snr"
+]
+
+def _empty_stats(fits_path, status):
+    """Stats row for a file without usable data, treated as fully null like the old per-stage checks."""
+    return {
+        "filename": os.path.basename(fits_path), "path": fits_path, "status": status,
+        "height": 0, "width": 0, "dtype": "", "n_pixels": 0, "n_nan": 0, "n_null": 0,
+        "null_fraction": 1.0, "nan_fraction": 1.0, "all_zero": False, "all_nan": False,
+        "is_null": status == "no_data", "mean": np.nan, "std": np.nan,
+        "min": np.nan, "max": np.nan, "snr": 0.0,
+    }
+
+def compute_array_stats(data, null_value=0):
+    """
+    Compute every per-image quality statistic used by the cleanup, best-pick and QA
+    stages in one pass over the array.
+
+    NaN handling matches the previous stages: mean/std/min/max ignore NaNs (nanmean,
+    nanstd), null_fraction counts pixels equal to `null_value`, and an image is null
+    when it is all zeros or all NaN.
+    """
+    flat = np.asarray(data).ravel()
+    n_pixels = flat.size
+    finite = np.isfinite(flat)
+    n_finite = int(np.count_nonzero(finite))
+    n_nan = int(np.count_nonzero(np.isnan(flat))) if flat.dtype.kind == "f" else 0
+
+    if null_value is None or (isinstance(null_value, float) and np.isnan(null_value)):
+        n_null = n_nan
+    else:
+        n_null = int(np.count_nonzero(flat == null_value))
+    n_zero = n_null if null_value == 0 else int(np.count_nonzero(flat == 0))
+
+    if n_finite:
+        values = flat if n_finite == n_pixels else flat[finite]
+        total = values.sum(dtype=np.float64)
+        mean = total / n_finite
+        # Shifted sum of squares keeps float32 cutouts numerically stable
+        std = float(np.sqrt(np.square(values - mean, dtype=np.float64).sum() / n_finite))
+        vmin, vmax = float(values.min()), float(values.max())
+    else:
+        mean = std = vmin = vmax = np.nan
+
+    all_zero = n_pixels > 0 and n_zero == n_pixels
+    all_nan = n_pixels > 0 and n_nan == n_pixels
+    return {
+        "n_pixels": n_pixels,
+        "n_nan": n_nan,
+        "n_null": n_null,
+        "null_fraction": n_null / n_pixels if n_pixels > 0 else 1.0,
+        "nan_fraction": n_nan / n_pixels if n_pixels > 0 else 1.0,
+        "all_zero": all_zero,
+        "all_nan": all_nan,
+        "is_null": all_zero or all_nan,
+        "mean": float(mean),
+        "std": std,
+        "min": vmin,
+        "max": vmax,
+        "snr": float(mean / std) if n_finite and std > 0 else 0.0,
+    }
+
+def scan_fits_file(fits_path, null_value=0):
+    """Open a FITS file once (memory-mapped where possible) and return its stats row."""
+    try:
+        with fits.open(fits_path, memmap=True) as hdul:
+            data = hdul[0].data
+            if data is None:
+                return _empty_stats(fits_path, "no_data")
+            row = {
+                "filename": os.path.basename(fits_path), "path": fits_path, "status": "ok",
+                "height": data.shape[-2] if data.ndim >= 2 else 1, "width": data.shape[-1],
+                "dtype": str(data.dtype),
+            }
+            row.update(compute_array_stats(data, null_value))
+            del data
+            return row
+    except Exception as e:
+        logging.error(f"Error reading {fits_path}: {e}")
+        return _empty_stats(fits_path, f"error: {e}")
+
+def _scan_one(args):
+    return scan_fits_file(*args)
+
+def scan_fits_files(fits_paths, null_value=0, max_workers=MAX_WORKERS, chunksize=64):
+    """Scan many FITS files across a process pool and return the stats table as a DataFrame."""
+    fits_paths = list(fits_paths)
+    jobs = [(path, null_value) for path in fits_paths]
+    with span("scan_fits_files", workers=max_workers) as metrics:
+        if max_workers == 1 or len(jobs) < 2:
+            rows = [_scan_one(job) for job in tqdm(jobs, desc="Scanning FITS files")]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                rows = list(tqdm(executor.map(_scan_one, jobs, chunksize=chunksize),
+                                 total=len(jobs), desc="Scanning FITS files"))
+        metrics.count(len(rows))
+    return stats_table(rows)
+
+def stats_table(rows):
+    """Stats rows from scan_fits_file as a DataFrame in STATS_COLUMNS order (without survey)."""
+    return pd.DataFrame(rows, columns=[c for c in STATS_COLUMNS if c != "survey"])
+
+def list_fits_files(folder):
+    """Return the FITS paths in a folder using a single directory scan."""
+    with os.scandir(folder) as entries:
+        return sorted(e.path for e in entries if e.is_file() and e.name.endswith(('.fits', '.fit')))
+
+def scan_fits_folders(folders, null_value=0, max_workers=MAX_WORKERS):
+    """
+    Scan every FITS file in a set of survey folders in one pooled pass.
+
+    Args:
+        folders (dict): Survey name -> folder path.
+        null_value (int or float): The pixel value considered "null".
+        max_workers (int): Number of worker processes.
+
+    Returns:
+        pandas.DataFrame: One row per file with the columns in STATS_COLUMNS.
+    """
+    paths, surveys = [], []
+    for survey, folder in folders.items():
+        files = list_fits_files(folder)
+        paths.extend(files)
+        surveys.extend([survey] * len(files))
+    stats = scan_fits_files(paths, null_value, max_workers)
+    stats.insert(0, "survey", surveys)
+    return stats
+
+def rows_in_folder(stats, folder):
+    """Boolean mask of the stats rows for files directly in `folder` (paths compared absolute and case-normalised)."""
+    folder = os.path.normcase(os.path.abspath(folder))
+    return stats["path"].map(lambda p: os.path.normcase(os.path.dirname(os.path.abspath(p))) == folder)
+
+def load_stats(stats_csv):
+    """Load a stats table written by this scanner."""
+    return pd.read_csv(stats_csv, dtype={"survey": str, "filename": str, "path": str})
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    stats = scan_fits_folders(FITS_FOLDERS)
+    stats.to_csv(STATS_CSV, index=False)
+    print(f"Scanned {len(stats)} FITS files, {int(stats['is_null'].sum())} null, "
+          f"{int(stats['status'].ne('ok').sum())} unreadable")
+    print(f"Stats table saved to {STATS_CSV}")
@@ -2,23 +2,53 @@ import os
 import numpy as np
 from astropy.io import fits
 import logging
+from intensity_stretch import stretch_stack
 
 # Configuration
 FITS_INPUT_DIR = r"C:\Users\tosee\Downloads\123\testing_triplets\xray_data"  
 NPY_OUTPUT_DIR = r"C:\Users\tosee\Downloads\123\testing_triplets\xray_agn_data" 
 LOG_FILE = "fits_to_npy.log"
+STRETCH = None      # None keeps raw values, or "asinh", "zscale", "linear" (intensity_stretch.py)
+BATCH_SIZE = 64
 
-# Configure logging
-logging.basicConfig(filename=LOG_FILE, level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+def _stretch_batch(items, stretch):
+    """Stretch a batch together, falling back to one file at a time so a bad file only loses itself."""
+    try:
+        return list(stretch_stack(np.stack([data for _, _, data in items]), stretch))
+    except Exception as e:
+        logging.warning(f"Batch stretch failed ({e}), stretching {len(items)} files one by one")
+    arrays = []
+    for filename, _, data in items:
+        try:
+            arrays.append(stretch_stack(data[None], stretch)[0])
+        except Exception as e:
+            logging.error(f"Error processing {filename}: {e}")
+            arrays.append(None)
+    return arrays
 
-def fits_to_npy(fits_dir, npy_dir):
+def _save_batch(items, stretch):
+    """Stretch a batch of same-shape images together and save each one."""
+    for (filename, npy_filepath, _), data in zip(items, _stretch_batch(items, stretch)):
+        if data is None:
+            continue
+        try:
+            np.save(npy_filepath, data)
+            logging.info(f"Converted {filename} to {os.path.basename(npy_filepath)}")
+        except Exception as e:
+            logging.error(f"Error processing {filename}: {e}")
+
+def fits_to_npy(fits_dir, npy_dir, stretch=STRETCH, batch_size=BATCH_SIZE):
     """
     Converts all FITS files in the specified directory to NumPy .npy files,
     saving them in the output directory with the same base filename.
+
+    With `stretch` set, images of the same shape are background-subtracted and stretched
+    in batches of `batch_size` before saving, in the same pass over the files. Without
+    it every file is saved as soon as it is read.
     """
     os.makedirs(npy_dir, exist_ok=True)  # Create output directory if it doesn't exist
     logging.info(f"Starting FITS to NumPy conversion from {fits_dir} to {npy_dir}")
+    pending = {}
 
     for filename in os.listdir(fits_dir):
         if filename.endswith(('.fits', '.fit')):
@@ -30,18 +60,34 @@ def fits_to_npy(fits_dir, npy_dir):
                 with fits.open(fits_filepath) as hdul:
                     if len(hdul) > 0 and hdul[0].data is not None:
                         data = hdul[0].data
-                        np.save(npy_filepath, data)
-                        logging.info(f"Converted {filename} to {npy_filename}")
+                        if stretch is None:
+                            np.save(npy_filepath, data)
+                            logging.info(f"Converted {filename} to {npy_filename}")
+                            continue
+                        data = np.array(data)
                     else:
                         logging.warning(f"FITS file {filename} has no data in the primary HDU.")
+                        continue
             except FileNotFoundError:
                 logging.error(f"FITS file not found: {fits_filepath}")
+                continue
             except Exception as e:
                 logging.error(f"Error processing {filename}: {e}")
+                continue
+
+            batch = pending.setdefault(data.shape, [])
+            batch.append((filename, npy_filepath, data))
+            if len(batch) >= batch_size:
+                _save_batch(pending.pop(data.shape), stretch)
 
+    for items in pending.values():
+        _save_batch(items, stretch)
     logging.info("FITS to NumPy conversion complete.")
 
 if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(filename=LOG_FILE, level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
     fits_to_npy(FITS_INPUT_DIR, NPY_OUTPUT_DIR)
     print(f"Conversion process started. Check {LOG_FILE} for details.")
     print(f"NumPy files will be saved in: {NPY_OUTPUT_DIR}")
\ No newline at end of file
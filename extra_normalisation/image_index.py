@@ -0,0 +1,244 @@
+import os
+import sqlite3
+import logging
+import numpy as np
+import pandas as pd
+from fits_quality_scan import scan_fits_files
+
+# Configuration
+IMAGE_INDEX_DB = r"C:\Users\tosee\Downloads\123\image_index.sqlite"
+IMAGE_FOLDERS = {
+    "ztf_r": r"C:\Users\tosee\Downloads\123\ztf_r",
+    "dss2_red": r"C:\Users\tosee\Downloads\123\dss2_red",
+    "triplets": r"C:\Users\tosee\Downloads\123\testing_triplets\triplets",
+}
+IMAGE_EXTENSIONS = ('.fits', '.fit', '.npy')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    survey TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    object_key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    height INTEGER,
+    width INTEGER,
+    dtype TEXT,
+    status TEXT,
+    null_fraction REAL,
+    nan_fraction REAL,
+    is_null INTEGER,
+    mean REAL,
+    std REAL,
+    snr REAL,
+    null_value TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_images_survey_key ON images (survey, object_key);
+CREATE INDEX IF NOT EXISTS idx_images_key ON images (object_key);
+CREATE INDEX IF NOT EXISTS idx_images_folder ON images (folder);
+"""
+
+COLUMNS = ["path", "survey", "folder", "filename", "object_key", "size", "mtime", "height", "width",
+           "dtype", "status", "null_fraction", "nan_fraction", "is_null", "mean", "std", "snr", "null_value"]
+STAT_COLUMNS = ["height", "width", "dtype", "status", "null_fraction", "nan_fraction", "is_null", "mean", "std", "snr"]
+
+def object_key(filename):
+    """Catalog key of an image file: sn_name / obs_id / coordinate key without extension (or `_triplet.npy`)."""
+    if filename.endswith("_triplet.npy"):
+        return filename[:-len("_triplet.npy")]
+    return os.path.splitext(filename)[0]
+
+def open_index(db_path=IMAGE_INDEX_DB):
+    """Open (and create if needed) the image index database."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    # Indexes created before null_value was recorded get the column, their rows are rescanned
+    if "null_value" not in {row[1] for row in conn.execute("PRAGMA table_info(images)")}:
+        conn.execute("ALTER TABLE images ADD COLUMN null_value TEXT")
+    return conn
+
+def _npy_header(path):
+    """Shape and dtype of a .npy file read from its header only."""
+    try:
+        with open(path, "rb") as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+        return {"height": shape[-2] if len(shape) >= 2 else 1, "width": shape[-1] if shape else 1,
+                "dtype": str(dtype), "status": "ok"}
+    except Exception as e:
+        logging.error(f"Error reading header of {path}: {e}")
+        return {"status": f"error: {e}"}
+
+def update_index(conn, survey, folder, scan_stats=True, null_value=0):
+    """
+    Bring the index rows for one folder up to date with a single os.scandir pass.
+
+    Files whose size and mtime match the index are left alone, new or changed files are
+    (re)described, FITS quality statistics are computed for them with fits_quality_scan
+    when `scan_stats` is set (also for unchanged FITS indexed earlier without stats or with
+    another `null_value`, which is stored with the stats), and rows for files that
+    disappeared are dropped.
+
+    A survey is one folder: rows the survey still has from another folder are removed and
+    the folder's rows are labelled with `survey`, so queries by survey always describe
+    `folder`. A missing folder leaves the survey with no rows.
+
+    Returns:
+        dict: Counts of added, updated, removed and unchanged files.
+    """
+    folder = os.path.normpath(os.path.abspath(folder))
+    null_key = repr(float(null_value))
+    known = {path: (size, mtime, status is not None and stored_null == null_key)
+             for path, size, mtime, status, stored_null in
+             conn.execute("SELECT path, size, mtime, status, null_value FROM images WHERE folder = ?", (folder,))}
+
+    seen, changed = set(), []
+    if os.path.isdir(folder):
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith(IMAGE_EXTENSIONS):
+                    continue
+                st = entry.stat()
+                path = os.path.normpath(entry.path)
+                seen.add(path)
+                size, mtime, has_stats = known.get(path, (None, None, False))
+                needs_stats = scan_stats and not has_stats and not entry.name.endswith(".npy")
+                if (size, mtime) != (st.st_size, st.st_mtime) or needs_stats:
+                    changed.append({"path": path, "survey": survey, "folder": folder, "filename": entry.name,
+                                    "object_key": object_key(entry.name), "size": st.st_size, "mtime": st.st_mtime})
+    else:
+        logging.warning(f"Image folder {folder} not found, {survey} is indexed as empty")
+
+    fits_rows = [r for r in changed if not r["filename"].endswith(".npy")]
+    if scan_stats and fits_rows:
+        stats = scan_fits_files([r["path"] for r in fits_rows], null_value).set_index("path")
+        for r in fits_rows:
+            r.update(stats.loc[r["path"], STAT_COLUMNS].to_dict(), null_value=null_key)
+    for r in changed:
+        if r["filename"].endswith(".npy"):
+            r.update(_npy_header(r["path"]))
+
+    removed = [(path,) for path in known.keys() - seen]
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO images ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+            [tuple(_sql_value(r.get(c)) for c in COLUMNS) for r in changed]
+        )
+        conn.executemany("DELETE FROM images WHERE path = ?", removed)
+        moved = conn.execute("DELETE FROM images WHERE survey = ? AND folder != ?", (survey, folder)).rowcount
+        conn.execute("UPDATE images SET survey = ? WHERE folder = ? AND survey != ?", (survey, folder, survey))
+
+    counts = {"added": sum(r["path"] not in known for r in changed),
+              "updated": sum(r["path"] in known for r in changed),
+              "removed": len(removed) + moved, "unchanged": len(seen) - len(changed)}
+    logging.info(f"Indexed {survey} ({folder}): {counts}")
+    return counts
+
+def _sql_value(value):
+    if isinstance(value, (np.bool_, bool)):
+        return int(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+def update_all(conn, folders, scan_stats=True):
+    """Refresh the index for every survey folder in `folders` (survey name -> folder)."""
+    return {survey: update_index(conn, survey, folder, scan_stats) for survey, folder in folders.items()}
+
+def has_image(conn, survey, key):
+    """True when the survey has a file for this object key."""
+    return conn.execute("SELECT 1 FROM images WHERE survey = ? AND object_key = ? LIMIT 1",
+                        (survey, key)).fetchone() is not None
+
+def object_keys(conn, survey):
+    """All object keys indexed for a survey."""
+    return {key for (key,) in conn.execute("SELECT object_key FROM images WHERE survey = ?", (survey,))}
+
+def _with_wanted_keys(conn, keys):
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (object_key TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM wanted")
+    conn.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((str(k),) for k in keys))
+
+def _extension_filter(extensions):
+    """SQL condition (and parameters) limiting images i to filenames ending in `extensions`."""
+    if not extensions:
+        return "", []
+    return f" AND ({' OR '.join(['i.filename LIKE ?'] * len(extensions))})", [f"%{ext}" for ext in extensions]
+
+def missing_keys(conn, survey, keys, extensions=None):
+    """Keys from `keys` with no file (with one of `extensions`) in the survey, answered by an indexed anti-join."""
+    _with_wanted_keys(conn, keys)
+    condition, params = _extension_filter(extensions)
+    rows = conn.execute(
+        "SELECT w.object_key FROM wanted w WHERE NOT EXISTS "
+        f"(SELECT 1 FROM images i WHERE i.survey = ? AND i.object_key = w.object_key{condition})", [survey] + params)
+    return sorted(key for (key,) in rows)
+
+def extra_keys(conn, survey, keys, extensions=None):
+    """Keys indexed for the survey (files with one of `extensions`) that are not in `keys`."""
+    _with_wanted_keys(conn, keys)
+    condition, params = _extension_filter(extensions)
+    rows = conn.execute(
+        f"SELECT DISTINCT i.object_key FROM images i WHERE i.survey = ?{condition} AND NOT EXISTS "
+        "(SELECT 1 FROM wanted w WHERE w.object_key = i.object_key)", [survey] + params)
+    return sorted(key for (key,) in rows)
+
+def coverage(conn, surveys, keys=None):
+    """
+    Boolean table of which object keys have a file in which survey.
+
+    Args:
+        surveys (list): Surveys to report as columns.
+        keys (iterable, optional): Restrict rows to these keys (keys with no files are kept).
+
+    Returns:
+        pandas.DataFrame: Indexed by object_key, one bool column per survey.
+    """
+    placeholders = ", ".join("?" * len(surveys))
+    df = pd.read_sql_query(
+        f"SELECT DISTINCT object_key, survey FROM images WHERE survey IN ({placeholders})", conn, params=list(surveys))
+    table = pd.crosstab(df["object_key"], df["survey"]).reindex(columns=list(surveys), fill_value=0) > 0
+    if keys is not None:
+        table = table.reindex(pd.Index([str(k) for k in keys], name="object_key"), fill_value=False)
+    return table
+
+def folder_stats(conn, folder, survey=None, scan_stats=True, null_value=0, extensions=IMAGE_EXTENSIONS):
+    """
+    Refresh one folder and return its rows with `extensions`, in the quality_stats layout.
+
+    `survey` defaults to the folder path, pass the IMAGE_FOLDERS name for folders listed there.
+    """
+    update_index(conn, survey or os.path.normpath(os.path.abspath(folder)), folder, scan_stats, null_value)
+    stats = pd.read_sql_query(f"SELECT {', '.join(COLUMNS)} FROM images WHERE folder = ?", conn,
+                              params=[os.path.normpath(os.path.abspath(folder))])
+    stats["is_null"] = stats["is_null"].fillna(0).astype(bool)
+    return stats[stats["filename"].str.endswith(tuple(extensions))].reset_index(drop=True)
+
+def quality_stats(conn, surveys=None):
+    """Cached per-file stats as a DataFrame, in the same layout fits_quality_scan produces."""
+    query = f"SELECT {', '.join(COLUMNS)} FROM images"
+    params = []
+    if surveys:
+        query += f" WHERE survey IN ({', '.join('?' * len(surveys))})"
+        params = list(surveys)
+    stats = pd.read_sql_query(query, conn, params=params)
+    stats["is_null"] = stats["is_null"].fillna(0).astype(bool)
+    return stats
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    conn = open_index(IMAGE_INDEX_DB)
+    update_all(conn, IMAGE_FOLDERS)
+    table = coverage(conn, list(IMAGE_FOLDERS))
+    print(f"Indexed {len(table)} objects across {len(IMAGE_FOLDERS)} folders")
+    print(table.sum().to_string())
+    conn.close()
@@ -0,0 +1,121 @@
+import logging
+import numpy as np
+
+# Configuration
+CLIP_SIGMA = 3.0
+CLIP_MAXITERS = 5
+ASINH_SOFTENING = 3.0     # in units of the clipped background sigma
+ZSCALE_SAMPLES = 1000
+ZSCALE_CONTRAST = 0.25
+STRETCHES = ("asinh", "zscale", "linear")
+
+def sigma_clip_background(stack, sigma=CLIP_SIGMA, maxiters=CLIP_MAXITERS):
+    """
+    Iteratively sigma-clipped background level and noise for every image of a stack
+    (..., H, W) at once. Each iteration recomputes the median and standard deviation of
+    the unmasked pixels of all images with one masked (NaN-aware) reduction and masks
+    pixels further than `sigma` standard deviations from the median.
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): Background and sigma per image, shaped (..., 1, 1).
+    """
+    values = np.array(stack, dtype=np.float32)
+    values[~np.isfinite(values)] = np.nan
+    median = np.nanmedian(values, axis=(-2, -1), keepdims=True)
+    std = np.nanstd(values, axis=(-2, -1), keepdims=True)
+    for _ in range(maxiters):
+        outliers = np.abs(values - median) > sigma * std
+        if not outliers.any():
+            break
+        values[outliers] = np.nan
+        median = np.nanmedian(values, axis=(-2, -1), keepdims=True)
+        std = np.nanstd(values, axis=(-2, -1), keepdims=True)
+    median = np.nan_to_num(median)
+    std = np.where(np.isfinite(std) & (std > 0), std, 1.0).astype(np.float32)
+    return median, std
+
+def asinh_stretch(stack, background, noise, softening=ASINH_SOFTENING):
+    """
+    asinh((x - background) / (softening * noise)): linear within a few noise sigma of the
+    background and logarithmic for bright sources, which brings surveys with very
+    different dynamic ranges onto comparable scales.
+    """
+    return np.arcsinh((np.asarray(stack, dtype=np.float32) - background) / (softening * noise))
+
+def zscale_limits(stack, n_samples=ZSCALE_SAMPLES, contrast=ZSCALE_CONTRAST, sigma=2.5, maxiters=5):
+    """
+    IRAF zscale display limits for every image of a stack (N, H, W) at once.
+
+    A regular sample of each image is sorted and a straight line is fitted to the sorted
+    values with iterative sigma rejection, all images in one batched least-squares fit.
+    The limits are the median -/+ the slope, divided by `contrast`, over the sample range,
+    bounded by the sample minimum and maximum.
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): Lower and upper limits, shaped (N, 1, 1).
+    """
+    stack = np.asarray(stack, dtype=np.float32)
+    flat = stack.reshape(len(stack), -1)
+    stride = max(1, flat.shape[1] // n_samples)
+    samples = np.sort(np.where(np.isfinite(flat[:, ::stride]), flat[:, ::stride], np.nan), axis=1)
+    n_valid = np.isfinite(samples).sum(axis=1)
+    x = np.arange(samples.shape[1], dtype=np.float64)[None, :]
+    keep = np.isfinite(samples)
+    y = np.nan_to_num(samples).astype(np.float64)
+    for _ in range(maxiters):
+        w = keep.astype(np.float64)
+        sw = np.maximum(w.sum(axis=1, keepdims=True), 1)
+        mx = (w * x).sum(axis=1, keepdims=True) / sw
+        my = (w * y).sum(axis=1, keepdims=True) / sw
+        var_x = (w * (x - mx) ** 2).sum(axis=1, keepdims=True)
+        slope = np.divide((w * (x - mx) * (y - my)).sum(axis=1, keepdims=True), var_x,
+                          out=np.zeros_like(var_x), where=var_x > 0)
+        residual = y - (my + slope * (x - mx))
+        scatter = np.sqrt((w * residual ** 2).sum(axis=1, keepdims=True) / sw)
+        new_keep = np.isfinite(samples) & (np.abs(residual) <= sigma * np.maximum(scatter, 1e-12))
+        if np.array_equal(new_keep, keep):
+            break
+        keep = new_keep
+
+    median = np.nanmedian(samples, axis=1, keepdims=True)
+    centre = (n_valid[:, None] - 1) / 2
+    slope = slope / contrast
+    z1 = np.maximum(median - centre * slope, np.nanmin(samples, axis=1, keepdims=True))
+    z2 = np.minimum(median + (n_valid[:, None] - 1 - centre) * slope, np.nanmax(samples, axis=1, keepdims=True))
+    return np.nan_to_num(z1)[:, :, None], np.nan_to_num(z2)[:, :, None]
+
+def stretch_stack(stack, method="asinh", clip_sigma=CLIP_SIGMA, softening=ASINH_SOFTENING):
+    """
+    Background-subtract and stretch a stack of same-shape cutouts (N, H, W).
+
+    Args:
+        method (str): "asinh" (sigma-clipped background, asinh stretch), "zscale" (zscale
+            limits mapped onto 0..1) or "linear" (sigma-clipped background subtracted and
+            divided by the clipped sigma).
+
+    Returns:
+        numpy.ndarray: float32 stack with NaNs replaced by 0.
+    """
+    stack = np.asarray(stack, dtype=np.float32)
+    if method == "zscale":
+        z1, z2 = zscale_limits(stack.reshape((-1,) + stack.shape[-2:]))
+        span = np.where(z2 > z1, z2 - z1, 1.0)
+        out = np.clip((stack.reshape(z1.shape[:1] + stack.shape[-2:]) - z1) / span, 0, 1).reshape(stack.shape)
+    elif method in ("asinh", "linear"):
+        background, noise = sigma_clip_background(stack, clip_sigma)
+        if method == "asinh":
+            out = asinh_stretch(stack, background, noise, softening)
+        else:
+            out = (stack - background) / noise
+    else:
+        raise ValueError(f"Unknown stretch {method}, expected one of {STRETCHES}")
+    return np.nan_to_num(out.astype(np.float32), nan=0.0, posinf=0.0, neginf=0.0)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    rng = np.random.default_rng(0)
+    stack = rng.normal(100, 5, (32, 256, 256)).astype(np.float32)
+    stack[:, 100:110, 100:110] += 5000
+    for method in STRETCHES:
+        out = stretch_stack(stack, method)
+        logging.info(f"{method}: background {np.median(out):.3f}, peak {out.max():.3f}")
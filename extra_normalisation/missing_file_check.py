@@ -1,26 +1,29 @@
 import pandas as pd
-import os
+from image_index import open_index, update_index, missing_keys, extra_keys, IMAGE_INDEX_DB
 
 # Configuration
 CSV_PATH = r"C:\Users\tosee\Downloads\123\data\master_xray_data_agncan.csv"
 ZTF_DIR = r"C:\Users\tosee\Downloads\123\best_fits_agn"
 OUTPUT_FILE = "missing_files.txt"
+SURVEY = "best_fits_agn"
+EXTENSIONS = (".fits",)   # other indexed files (.fit, .npy) do not count as a cutout
 
 def check_missing_files():
     # Read CSV file
     df = pd.read_csv(CSV_PATH)
     csv_sn_names = set(df['obs_id'].astype(str).unique())
     
-    # Get existing FITS files
-    existing_files = set()
-    if os.path.exists(ZTF_DIR):
-        for f in os.listdir(ZTF_DIR):
-            if f.endswith('.fits'):
-                existing_files.add(f[:-5])
+    # Refresh the image index (only new or changed files are looked at, a missing folder
+    # clears the survey) and query it
+    conn = open_index(IMAGE_INDEX_DB)
+    update_index(conn, SURVEY, ZTF_DIR, scan_stats=False)
+    existing_count = conn.execute("SELECT COUNT(*) FROM images WHERE survey = ? AND filename LIKE '%.fits'",
+                                  (SURVEY,)).fetchone()[0]
     
     # Find missing and extra files
-    missing_in_ztf = csv_sn_names - existing_files
-    extra_in_ztf = existing_files - csv_sn_names
+    missing_in_ztf = set(missing_keys(conn, SURVEY, csv_sn_names, EXTENSIONS))
+    extra_in_ztf = set(extra_keys(conn, SURVEY, csv_sn_names, EXTENSIONS))
+    conn.close()
     
     # Save missing files list
     with open(OUTPUT_FILE, 'w') as f:
@@ -29,7 +32,7 @@ def check_missing_files():
     
     # Print summary
     print(f"Total SN names in CSV: {len(csv_sn_names)}")
-    print(f"Files in folder: {len(existing_files)}")
+    print(f"Files in folder: {existing_count}")
     print(f"Missing files: {len(missing_in_ztf)} (saved to {OUTPUT_FILE})")
     print(f"Extra files (not in CSV): {len(extra_in_ztf)}")
     
@@ -0,0 +1,212 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from astropy.io import fits
+from astropy.wcs import WCS
+from scipy.spatial import cKDTree
+from tqdm import tqdm
+from resize_images import resize_batch
+from image_index import open_index, update_all, IMAGE_INDEX_DB
+
+# Configuration
+IMAGE_FOLDERS = {
+    "ztf_r": r"C:\Users\tosee\Downloads\123\ztf_r",
+    "ztf_aligned": r"C:\Users\tosee\Downloads\123\ztf_aligned",
+    "dss2_red": r"C:\Users\tosee\Downloads\123\dss2_red",
+}
+HASH_CSV = "image_hashes.csv"
+DUPLICATES_CSV = "near_duplicates.csv"
+MAX_HAMMING = 3           # bits out of 64
+CENTRE_TOLERANCE_ARCSEC = 2.0
+HASH_BANDS = 4            # a pair within MAX_HAMMING < HASH_BANDS bits shares at least one band
+MAX_BUCKET = 256          # larger band buckets (blank or saturated cutouts) are linked, not expanded into all pairs
+MAX_WORKERS = os.cpu_count()
+
+# Number of set bits for every byte value, used to popcount uint64 arrays
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def hamming(a, b):
+    """Bitwise Hamming distance between two uint64 arrays."""
+    x = np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64))
+    return _POPCOUNT[x.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+def dhash_batch(stack):
+    """
+    64-bit difference hash for a stack of images (N, H, W): each image is shrunk to 8x9
+    with the anti-aliased resize operator and every bit records whether a pixel is brighter
+    than its right-hand neighbour. The hash ignores brightness scale and offset, so the
+    same field from two surveys or two downloads hashes alike.
+    """
+    small = resize_batch(stack, (8, 9))
+    bits = (small[:, :, 1:] > small[:, :, :-1]).reshape(len(small), 64)
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+def _describe(path):
+    """Load one cutout and return (image, ra, dec) with the sky position of its centre pixel."""
+    with fits.open(path, memmap=True) as hdul:
+        data = hdul[0].data
+        header = hdul[0].header
+        if data is None:
+            return None, np.nan, np.nan
+        image = np.nan_to_num(np.asarray(data, dtype=np.float32).reshape(data.shape[-2:]))
+    ra = dec = np.nan
+    try:
+        wcs = WCS(header, naxis=2)
+        if wcs.has_celestial:
+            ra, dec = wcs.pixel_to_world_values((image.shape[1] - 1) / 2, (image.shape[0] - 1) / 2)
+    except Exception as e:
+        logging.warning(f"No usable WCS in {path}: {e}")
+    return image, float(ra), float(dec)
+
+def hash_files(paths):
+    """Worker: hash a chunk of FITS files, batching same-shape images together."""
+    rows, by_shape = [], {}
+    for path in paths:
+        try:
+            image, ra, dec = _describe(path)
+        except Exception as e:
+            logging.error(f"Error hashing {path}: {e}")
+            continue
+        if image is not None:
+            by_shape.setdefault(image.shape, []).append((path, image, ra, dec))
+    for group in by_shape.values():
+        hashes = dhash_batch(np.stack([g[1] for g in group]))
+        rows.extend({"path": g[0], "hash": int(h), "ra_deg": g[2], "dec_deg": g[3]} for g, h in zip(group, hashes))
+    return rows
+
+def build_hash_table(files, previous=None, max_workers=MAX_WORKERS, chunk_size=64):
+    """
+    Hash every file in `files` (DataFrame with path, survey, object_key, mtime), reusing
+    rows from a previous hash table for files whose mtime has not changed.
+    """
+    files = files[["path", "survey", "object_key", "mtime"]]
+    if previous is not None and len(previous):
+        reuse = files.merge(previous[["path", "mtime", "hash", "ra_deg", "dec_deg"]], on=["path", "mtime"])
+        todo = files[~files["path"].isin(reuse["path"])]
+    else:
+        reuse, todo = None, files
+
+    paths = todo["path"].tolist()
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    rows = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for result in tqdm(executor.map(hash_files, chunks), total=len(chunks), desc="Hashing images"):
+            rows.extend(result)
+    fresh = todo.merge(pd.DataFrame(rows, columns=["path", "hash", "ra_deg", "dec_deg"]), on="path")
+    table = pd.concat([reuse, fresh], ignore_index=True) if reuse is not None else fresh
+    table["hash"] = table["hash"].astype(np.uint64)
+    return table.sort_values("path").reset_index(drop=True)
+
+def _large_bucket_pairs(hashes, members, max_bucket):
+    """
+    Pairs for a band bucket too large to expand: every member is linked to the first member
+    with the same full hash, and the distinct hashes are compared once each (unless there are
+    more than `max_bucket` of them), so the pairs grow with the bucket size, not its square.
+    """
+    unique, first, inverse = np.unique(hashes[members], return_index=True, return_inverse=True)
+    representatives = members[first]
+    linked = np.column_stack([representatives[inverse.ravel()], members])
+    linked = linked[linked[:, 0] != linked[:, 1]]
+    if len(unique) > max_bucket:
+        logging.warning(f"{len(members)} images with {len(unique)} distinct hashes share one hash band, "
+                        f"only identical hashes among them are paired")
+        return linked
+    ii, jj = np.triu_indices(len(representatives), k=1)
+    return np.vstack([linked, np.sort(np.column_stack([representatives[ii], representatives[jj]]), axis=1)])
+
+def hash_candidate_pairs(hashes, max_hamming=MAX_HAMMING, bands=HASH_BANDS, max_bucket=MAX_BUCKET):
+    """
+    Index pairs (i, j) whose hashes differ in at most `max_hamming` bits. Hashes are bucketed
+    by each of `bands` 16-bit bands, only pairs sharing a bucket are compared, which finds
+    every pair as long as max_hamming < bands.
+
+    All-0 and all-1 hashes are never paired: every flat (blank, zero-variance) cutout
+    hashes to 0 whatever object it shows, so equal hashes there say nothing.
+
+    Buckets with more than `max_bucket` members, typically near-flat or saturated cutouts
+    that hash alike, are not expanded into every pair: images with identical hashes there are
+    paired with the first of them only (see _large_bucket_pairs), which still links every
+    duplicate to one kept copy.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    informative = np.flatnonzero((hashes != 0) & (hashes != np.uint64(2 ** 64 - 1)))
+    width = 64 // bands
+    candidates = []
+    for band in range(bands):
+        keys = (hashes[informative] >> np.uint64(band * width)) & np.uint64((1 << width) - 1)
+        local = np.argsort(keys, kind="stable")
+        order, sorted_keys = informative[local], keys[local]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for s, e in zip(starts, ends):
+            if e - s > max_bucket:
+                candidates.append(_large_bucket_pairs(hashes, np.sort(order[s:e]), max_bucket))
+            elif e - s > 1:
+                members = np.sort(order[s:e])
+                ii, jj = np.triu_indices(len(members), k=1)
+                candidates.append(np.column_stack([members[ii], members[jj]]))
+    if not candidates:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64)
+    pairs = np.unique(np.concatenate(candidates).astype(np.int64), axis=0)
+    distance = hamming(hashes[pairs[:, 0]], hashes[pairs[:, 1]])
+    keep = distance <= max_hamming
+    return pairs[keep], distance[keep]
+
+def centre_pairs(ra_deg, dec_deg, tolerance_arcsec=CENTRE_TOLERANCE_ARCSEC):
+    """Index pairs whose WCS centres lie within the tolerance, from a KD-tree on unit vectors."""
+    ra, dec = np.radians(ra_deg), np.radians(dec_deg)
+    ok = np.flatnonzero(np.isfinite(ra) & np.isfinite(dec))
+    xyz = np.column_stack([np.cos(dec[ok]) * np.cos(ra[ok]), np.cos(dec[ok]) * np.sin(ra[ok]), np.sin(dec[ok])])
+    chord = 2 * np.sin(np.radians(tolerance_arcsec / 3600) / 2)
+    pairs = cKDTree(xyz).query_pairs(chord, output_type="ndarray")
+    return np.sort(ok[pairs], axis=1) if len(pairs) else np.empty((0, 2), dtype=np.int64)
+
+def find_near_duplicates(table, max_hamming=MAX_HAMMING, tolerance_arcsec=CENTRE_TOLERANCE_ARCSEC):
+    """
+    Near-duplicate pairs across names and surveys: same-looking images (hash within
+    max_hamming bits) and/or images centred on the same sky position.
+    """
+    hash_pairs, distance = hash_candidate_pairs(table["hash"].to_numpy(), max_hamming)
+    by_hash = pd.DataFrame({"i": hash_pairs[:, 0], "j": hash_pairs[:, 1], "hamming": distance})
+    pos = centre_pairs(table["ra_deg"].to_numpy(float), table["dec_deg"].to_numpy(float), tolerance_arcsec)
+    by_centre = pd.DataFrame({"i": pos[:, 0], "j": pos[:, 1], "same_centre": True})
+
+    pairs = by_hash.merge(by_centre, on=["i", "j"], how="outer")
+    pairs["same_centre"] = pairs["same_centre"].fillna(False).astype(bool)
+    pairs["similar_image"] = pairs["hamming"].notna()
+    a, b = table.iloc[pairs["i"]].reset_index(drop=True), table.iloc[pairs["j"]].reset_index(drop=True)
+    result = pd.DataFrame({
+        "path_a": a["path"], "survey_a": a["survey"], "key_a": a["object_key"],
+        "path_b": b["path"], "survey_b": b["survey"], "key_b": b["object_key"],
+        "hamming": pairs["hamming"], "similar_image": pairs["similar_image"], "same_centre": pairs["same_centre"],
+    })
+    # Same object in different surveys is expected, flag only pairs under different names or in one survey
+    result["suspect"] = (result["key_a"] != result["key_b"]) | (result["survey_a"] == result["survey_b"])
+    return result
+
+def leakage(duplicates, train_keys, test_keys):
+    """Near-duplicate pairs that put one image in the training set and the other in the test set."""
+    train, test = set(map(str, train_keys)), set(map(str, test_keys))
+    a, b = duplicates["key_a"].astype(str), duplicates["key_b"].astype(str)
+    crosses = (a.isin(train) & b.isin(test)) | (a.isin(test) & b.isin(train))
+    return duplicates[crosses & (a != b)]
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    conn = open_index(IMAGE_INDEX_DB)
+    update_all(conn, IMAGE_FOLDERS, scan_stats=False)
+    files = pd.read_sql_query(
+        f"SELECT path, survey, object_key, mtime FROM images WHERE survey IN ({', '.join('?' * len(IMAGE_FOLDERS))}) "
+        "AND filename NOT LIKE '%.npy'", conn, params=list(IMAGE_FOLDERS))
+    conn.close()
+
+    previous = pd.read_csv(HASH_CSV, dtype={"hash": np.uint64}) if os.path.exists(HASH_CSV) else None
+    table = build_hash_table(files, previous)
+    table.to_csv(HASH_CSV, index=False)
+
+    duplicates = find_near_duplicates(table)
+    duplicates.to_csv(DUPLICATES_CSV, index=False)
+    logging.info(f"{len(duplicates)} near-duplicate pairs over {len(table)} images, "
+                 f"{int(duplicates['suspect'].sum())} suspect, saved to {DUPLICATES_CSV}")
@@ -0,0 +1,150 @@
+import os
+import time
+import logging
+from functools import lru_cache
+import numpy as np
+from scipy import fft
+
+# Configuration
+FIT_MIN_FREQ = 0.01   # cycles/pixel, below this the background dominates the power
+FIT_MAX_FREQ = 0.12   # cycles/pixel, above this the noise dominates the power
+FIT_BINS = 16
+MAX_KERNEL_SIGMA = 8.0  # pixels
+FFT_WORKERS = os.cpu_count()
+
+@lru_cache(maxsize=8)
+def frequency_grid(shape):
+    """
+    Squared spatial frequency |f|^2 of the rfft2 grid for one image shape and the radial
+    bins used to fit kernels. Cached so batches of same-shape cutouts (768x768 today)
+    build it once, scipy.fft keeps its own plan cache for the transforms themselves.
+    """
+    fy = fft.fftfreq(shape[0])[:, None]
+    fx = fft.rfftfreq(shape[1])[None, :]
+    f2 = (fy ** 2 + fx ** 2).astype(np.float32)
+    edges = np.linspace(FIT_MIN_FREQ ** 2, FIT_MAX_FREQ ** 2, FIT_BINS + 1)
+    bins = [np.flatnonzero((f2.ravel() >= lo) & (f2.ravel() < hi)) for lo, hi in zip(edges[:-1], edges[1:])]
+    centres = np.array([f2.ravel()[b].mean() if b.size else np.nan for b in bins])
+    return f2, bins, centres
+
+def _prepare(stack):
+    """Background-subtract (median) and zero NaNs so the FFT sees only source flux and noise."""
+    stack = np.asarray(stack, dtype=np.float32)
+    stack = stack - np.nanmedian(stack, axis=(-2, -1), keepdims=True)
+    return np.nan_to_num(stack, nan=0.0, posinf=0.0, neginf=0.0)
+
+def fit_gaussian_kernels(science_ft, reference_ft, shape):
+    """
+    Fit a Gaussian matching kernel and flux scale for every pair in the batch.
+
+    For Gaussian PSFs ln(|S(f)| / |R(f)|) = ln(a) - 2 pi^2 (sigma_s^2 - sigma_r^2) |f|^2,
+    so a weighted straight line through the radially binned log amplitude ratio gives
+    the flux scale `a` and the PSF variance difference for all pairs at once.
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): Variance difference (pixels^2) and flux scale per pair.
+    """
+    f2, bins, centres = frequency_grid(shape)
+    n = science_ft.shape[0]
+    s_flat = science_ft.reshape(n, -1)
+    r_flat = reference_ft.reshape(n, -1)
+    ratio = np.full((n, len(bins)), np.nan)
+    weight = np.zeros((n, len(bins)))
+    for i, b in enumerate(bins):
+        if b.size == 0:
+            continue
+        ps = np.mean(np.abs(s_flat[:, b]) ** 2, axis=1)
+        pr = np.mean(np.abs(r_flat[:, b]) ** 2, axis=1)
+        ok = (ps > 0) & (pr > 0)
+        ratio[ok, i] = 0.5 * np.log(ps[ok] / pr[ok])
+        weight[ok, i] = b.size
+
+    # Batched weighted least squares of ratio against |f|^2
+    x = np.where(np.isfinite(centres), centres, 0.0)[None, :]
+    w = np.where(np.isfinite(ratio), weight, 0.0)
+    y = np.nan_to_num(ratio)
+    sw = w.sum(axis=1)
+    sw[sw == 0] = 1.0
+    mx = (w * x).sum(axis=1) / sw
+    my = (w * y).sum(axis=1) / sw
+    var_x = (w * (x - mx[:, None]) ** 2).sum(axis=1)
+    cov_xy = (w * (x - mx[:, None]) * (y - my[:, None])).sum(axis=1)
+    slope = np.divide(cov_xy, var_x, out=np.zeros_like(cov_xy), where=var_x > 0)
+    intercept = my - slope * mx
+
+    delta_var = np.clip(-slope / (2 * np.pi ** 2), -MAX_KERNEL_SIGMA ** 2, MAX_KERNEL_SIGMA ** 2)
+    flux_scale = np.clip(np.exp(intercept), 1e-3, 1e3)
+    return delta_var, flux_scale
+
+def psf_matched_difference(science, reference, workers=FFT_WORKERS):
+    """
+    PSF-matched difference images for a batch of aligned science/reference pairs.
+
+    The sharper image of each pair is convolved with the fitted Gaussian kernel and the
+    reference is flux-scaled before subtracting, all with one batched rfft2/irfft2.
+
+    Args:
+        science (numpy.ndarray): (N, H, W) science cutouts.
+        reference (numpy.ndarray): (N, H, W) reference cutouts on the same pixel grid.
+        workers (int): Threads used by scipy.fft.
+
+    Returns:
+        (numpy.ndarray, dict): float32 (N, H, W) differences and the per-pair kernel
+        parameters (kernel_sigma, convolved, flux_scale).
+    """
+    science = _prepare(science)
+    reference = _prepare(reference)
+    if science.shape != reference.shape:
+        raise ValueError(f"Science {science.shape} and reference {reference.shape} stacks must match")
+    shape = science.shape[-2:]
+
+    science_ft = fft.rfft2(science, workers=workers)
+    reference_ft = fft.rfft2(reference, workers=workers)
+    delta_var, flux_scale = fit_gaussian_kernels(science_ft, reference_ft, shape)
+
+    # Convolve whichever image is sharper by a Gaussian with the variance difference
+    f2, _, _ = frequency_grid(shape)
+    two_pi2 = 2 * np.pi ** 2
+    blur_reference = np.exp(-two_pi2 * np.maximum(delta_var, 0)[:, None, None] * f2).astype(np.float32)
+    blur_science = np.exp(-two_pi2 * np.maximum(-delta_var, 0)[:, None, None] * f2).astype(np.float32)
+    difference_ft = science_ft * blur_science - flux_scale[:, None, None].astype(np.float32) * reference_ft * blur_reference
+    difference = fft.irfft2(difference_ft, s=shape, workers=workers).astype(np.float32)
+
+    params = {
+        "kernel_sigma": np.sqrt(np.abs(delta_var)),
+        "convolved": np.where(delta_var >= 0, "reference", "science"),
+        "flux_scale": flux_scale,
+    }
+    return difference, params
+
+def psf_matched_difference_batches(science, reference, batch_size=32, workers=FFT_WORKERS):
+    """Run psf_matched_difference over a large stack in fixed-size batches to bound memory."""
+    out = np.empty(np.shape(science), dtype=np.float32)
+    for start in range(0, len(science), batch_size):
+        stop = start + batch_size
+        out[start:stop], _ = psf_matched_difference(science[start:stop], reference[start:stop], workers)
+    return out
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Synthetic check: reference PSF sigma 1.5 px, science sigma 3.0 px and twice the flux
+    rng = np.random.default_rng(0)
+    size, n = 768, 16
+    yy, xx = np.mgrid[:size, :size]
+    reference = np.zeros((size, size), np.float32)
+    science = np.zeros((size, size), np.float32)
+    for x0, y0, flux in rng.uniform([0, 0, 50], [size, size, 500], (200, 3)):
+        r2 = (xx - x0) ** 2 + (yy - y0) ** 2
+        reference += flux * np.exp(-r2 / (2 * 1.5 ** 2)) / (2 * np.pi * 1.5 ** 2)
+        science += 2.0 * flux * np.exp(-r2 / (2 * 3.0 ** 2)) / (2 * np.pi * 3.0 ** 2)
+    science = science + rng.normal(0, 0.01, (n, size, size)).astype(np.float32)
+    reference = reference + rng.normal(0, 0.01, (n, size, size)).astype(np.float32)
+
+    start = time.perf_counter()
+    difference, params = psf_matched_difference(science, reference)
+    elapsed = time.perf_counter() - start
+    naive = np.abs(science - reference)
+    logging.info(f"{n} pairs of {size}x{size} in {elapsed:.2f}s ({n / elapsed:.1f} pairs/s)")
+    logging.info(f"Kernel sigma {params['kernel_sigma'][0]:.2f} (expected {np.sqrt(3.0 ** 2 - 1.5 ** 2):.2f}), "
+                 f"flux scale {params['flux_scale'][0]:.2f} (expected 2.00)")
+    logging.info(f"Residual rms: naive {naive.std():.4f}, PSF-matched {difference.std():.4f}")
@@ -1,7 +1,10 @@
 import os
+import pandas as pd
 
 # Configuration
 ZTF_DIR = "ztf_aligned"
+# Report written by near_duplicate_index.py, the hand-made list below is used when it is missing
+DUPLICATES_CSV = "near_duplicates.csv"
 FILES_TO_REMOVE = [
     "ESSENCEm027.fits",
     "PTF09hpl.fits",
@@ -25,8 +28,26 @@ FILES_TO_REMOVE = [
     "SNLS-06D2iz.fits"
 ]
 
-def remove_ztf_duplicates():
-    print(f"Starting removal of {len(FILES_TO_REMOVE)} duplicate files from ZTF directory...")
+def files_from_report(report_csv, survey="ztf_aligned"):
+    """
+    Second file of every suspect near-duplicate pair inside one survey folder, so one
+    copy of each duplicated image is kept. Only pairs whose images look alike
+    (similar_image) and that show the same object (same key or same centre) are used,
+    pairs with only one of the two are left for review.
+    """
+    report = pd.read_csv(report_csv, dtype={"key_a": str, "key_b": str})
+    same_folder = (report["survey_a"] == survey) & (report["survey_b"] == survey)
+    alike = report["suspect"].astype(bool) & report["similar_image"].astype(bool)
+    same_object = (report["key_a"] == report["key_b"]) | report["same_centre"].astype(bool)
+    dupes = report[same_folder & alike & same_object].sort_values(["path_a", "path_b"])
+    remove = set()
+    for a, b in zip(dupes["path_a"].map(os.path.basename), dupes["path_b"].map(os.path.basename)):
+        if a not in remove:
+            remove.add(b)
+    return sorted(remove)
+
+def remove_ztf_duplicates(files_to_remove=FILES_TO_REMOVE):
+    print(f"Starting removal of {len(files_to_remove)} duplicate files from ZTF directory...")
     
     # Verify directory exists first
     if not os.path.exists(ZTF_DIR):
@@ -38,7 +59,7 @@ def remove_ztf_duplicates():
     errors = 0
     not_found = 0
 
-    for file_name in FILES_TO_REMOVE:
+    for file_name in files_to_remove:
         file_path = os.path.join(ZTF_DIR, file_name)
         
         if not os.path.exists(file_path):
@@ -56,10 +77,13 @@ def remove_ztf_duplicates():
 
     # Print summary
     print(f"\nOperation completed:")
-    print(f"- Total files processed: {len(FILES_TO_REMOVE)}")
+    print(f"- Total files processed: {len(files_to_remove)}")
     print(f"- Successfully removed: {removed}")
     print(f"- Not found: {not_found}")
     print(f"- Errors: {errors}")
 
 if __name__ == "__main__":
-    remove_ztf_duplicates()
\ No newline at end of file
+    if os.path.exists(DUPLICATES_CSV):
+        remove_ztf_duplicates(files_from_report(DUPLICATES_CSV))
+    else:
+        remove_ztf_duplicates()
\ No newline at end of file
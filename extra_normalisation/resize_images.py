@@ -2,6 +2,9 @@ import numpy as np
 from skimage.transform import resize
 import os
 import glob
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 def resize_npy_array(input_file, output_file, desired_shape):
     """
@@ -62,6 +65,91 @@ def resize_npy_directory(input_dir, output_dir, desired_shape, pattern="*.npy"):
         except Exception as e:
             print(f"Error processing file {input_file}: {e}")
 
+@lru_cache(maxsize=None)
+def resize_operator(input_size, output_size):
+    """
+    Matrix (output_size, input_size) that resizes one axis exactly like
+    `resize(..., anti_aliasing=True)`.
+
+    The Gaussian anti-aliasing filter and the linear interpolation are both linear
+    and separable, so resizing the identity along one axis gives the full 1-D operator.
+    """
+    operator = resize(np.eye(input_size), (output_size, input_size), anti_aliasing=True)
+    return np.ascontiguousarray(operator, dtype=np.float32)
+
+def resize_batch(stack, desired_shape):
+    """
+    Resize a stack of images (N, ..., H, W) over the last two axes in two matrix products.
+
+    Args:
+        stack (numpy.ndarray): Images sharing one input shape.
+        desired_shape (tuple): Output (height, width).
+
+    Returns:
+        numpy.ndarray: float32 stack with the last two axes resized.
+    """
+    height, width = desired_shape[-2:]
+    rows = resize_operator(stack.shape[-2], height)
+    cols = resize_operator(stack.shape[-1], width)
+    stack = np.nan_to_num(np.asarray(stack, dtype=np.float32), nan=0.0, copy=False)
+    return np.matmul(rows, np.matmul(stack, cols.T))
+
+def _resize_file_batch(input_files, output_dir, desired_shape, input_shape, store=None):
+    """Load one batch of same-shape files, resize them together and save float32 results."""
+    stack = np.empty((len(input_files),) + input_shape, dtype=np.float32)
+    loaded = []
+    for input_file in input_files:
+        try:
+            stack[len(loaded)] = np.load(input_file)
+            loaded.append(input_file)
+        except Exception as e:
+            print(f"Error processing file {input_file}: {e}")
+    resized = resize_batch(stack[:len(loaded)], desired_shape)
+    if store is not None:
+        keys = [os.path.basename(f).replace("_triplet.npy", "").replace(".npy", "") for f in loaded]
+        store.append_batch(keys, resized)
+        return len(loaded)
+    for input_file, image in zip(loaded, resized):
+        np.save(os.path.join(output_dir, os.path.basename(input_file)), image)
+    return len(loaded)
+
+def resize_npy_directory_batched(input_dir, output_dir, desired_shape=(128, 128), pattern="*.npy",
+                                 batch_size=64, max_workers=os.cpu_count(), store=None):
+    """
+    Batched version of resize_npy_directory: files are grouped by input shape, resized
+    in batches with precomputed operators on a thread pool, and saved as float32.
+
+    Args:
+        input_dir (str): Path to the input directory containing .npy files.
+        output_dir (str): Path to the output directory to save resized files.
+        desired_shape (tuple): Output (height, width) of the last two axes.
+        pattern (str, optional): The glob pattern to match .npy files. Defaults to "*.npy".
+        batch_size (int): Number of files resized per matrix product.
+        max_workers (int): Number of batches processed concurrently.
+        store (array_store.ArrayStore, optional): Append the resized arrays to this sharded
+            store instead of writing one .npy per file (output_dir is then unused).
+    """
+    if store is None:
+        os.makedirs(output_dir, exist_ok=True)
+    input_files = sorted(glob.glob(os.path.join(input_dir, pattern)))
+    print(f"Found {len(input_files)} .npy files in: {input_dir}")
+
+    # Group by input shape using only the .npy headers
+    by_shape = defaultdict(list)
+    for input_file in input_files:
+        try:
+            by_shape[np.load(input_file, mmap_mode="r").shape].append(input_file)
+        except Exception as e:
+            print(f"Error processing file {input_file}: {e}")
+
+    batches = [(files[i:i + batch_size], shape)
+               for shape, files in by_shape.items() if len(shape) >= 2
+               for i in range(0, len(files), batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        done = sum(executor.map(lambda b: _resize_file_batch(b[0], output_dir, desired_shape, b[1], store), batches))
+    print(f"Resized {done} arrays to {tuple(desired_shape)} in: {output_dir if store is None else store.root}")
+    return done
+
 if __name__ == "__main__":
     # Resize all .npy files in a directory:
     input_directory = r"C:\Users\tosee\Downloads\123\testing_triplets\xray_agn_data"
@@ -69,6 +157,6 @@ if __name__ == "__main__":
     target_directory_shape = (128, 128)
 
     if os.path.exists(input_directory) and os.path.isdir(input_directory):
-        resize_npy_directory(input_directory, output_directory, target_directory_shape)
+        resize_npy_directory_batched(input_directory, output_directory, target_directory_shape)
     else:
         print(f"Example input directory '{input_directory}' not found or is not a directory.")
\ No newline at end of file
@@ -0,0 +1,79 @@
+import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from triplet_loader import TripletLoader
+
+# Configuration
+DATA_SOURCE = r"C:\Users\tosee\Downloads\123\training\triplets_agn_store"
+MODEL_PATH = r"C:\Users\tosee\Downloads\123\models\triplet_classifier.keras"
+OUTPUT_FILE = r"C:\Users\tosee\Downloads\123\training\triplet_scores.parquet"
+BATCH_SIZE = 256
+IO_WORKERS = 2
+PREFETCH = 4
+NUM_THREADS = os.cpu_count()
+
+def keras_predictor(model_path, num_threads=NUM_THREADS, channels_last=True):
+    """
+    Load a saved Keras classifier and return predict(batch) -> scores.
+
+    TensorFlow is imported here, not at module import, and pinned to `num_threads`
+    intra-op threads (one inter-op thread) before the model is built, so scoring uses a
+    fixed share of the machine. Triplets are stored channels-first (N, 3, H, W) and are
+    transposed for channels-last models.
+    """
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    model = tf.keras.models.load_model(model_path, compile=False)
+    logging.info(f"Loaded {model_path} with {num_threads} threads")
+
+    def predict(batch):
+        if channels_last:
+            batch = np.ascontiguousarray(batch.transpose(0, 2, 3, 1))
+        return np.asarray(model.predict_on_batch(batch))
+    return predict
+
+def write_scores(keys, scores, output_path):
+    """Write scores keyed by sn_name / obs_id, as parquet or csv depending on the extension."""
+    scores = np.asarray(scores).reshape(len(keys), -1)
+    columns = ["score"] if scores.shape[1] == 1 else [f"score_{i}" for i in range(scores.shape[1])]
+    table = pd.DataFrame(scores, columns=columns)
+    table.insert(0, "key", keys)
+    if output_path.endswith(".parquet"):
+        table.to_parquet(output_path, index=False)
+    else:
+        table.to_csv(output_path, index=False)
+    return table
+
+def score_triplets(source, predict, output_path, batch_size=BATCH_SIZE, io_workers=IO_WORKERS, prefetch=PREFETCH):
+    """
+    Score every triplet of a folder, ArrayStore or compressed array file.
+
+    Batches are read in storage order by TripletLoader worker processes while the model
+    runs on the current batch, so disk reads overlap with compute.
+
+    Returns:
+        (pandas.DataFrame, float): Scores keyed by triplet key and triplets per second.
+    """
+    loader = TripletLoader(source, batch_size=batch_size, num_workers=io_workers, prefetch=prefetch,
+                           shuffle_buffer=0)
+    keys, scores = [], []
+    start = time.perf_counter()
+    for batch_keys, batch in tqdm(loader, total=len(loader), desc="Scoring triplets"):
+        scores.append(predict(batch))
+        keys.extend(batch_keys)
+    elapsed = time.perf_counter() - start
+    rate = len(keys) / elapsed if elapsed > 0 else float("inf")
+    logging.info(f"Scored {len(keys)} triplets in {elapsed:.1f}s ({rate:.0f} triplets/s)")
+    if not keys:
+        return pd.DataFrame(columns=["key", "score"]), rate
+    return write_scores(keys, np.concatenate(scores), output_path), rate
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    predict = keras_predictor(MODEL_PATH)
+    table, rate = score_triplets(DATA_SOURCE, predict, OUTPUT_FILE)
+    logging.info(f"Saved {len(table)} scores to {OUTPUT_FILE}")
@@ -0,0 +1,118 @@
+import os
+import shutil
+import logging
+import numpy as np
+from image_index import open_index, update_all, quality_stats, IMAGE_INDEX_DB
+
+# Configuration, earlier surveys win ties
+SURVEY_FOLDERS = {
+    "xmm": r"C:\Users\tosee\Downloads\123\testing_triplets\xray_agn_data",
+    "chandra": r"C:\Users\tosee\Downloads\123\testing_triplets\xray_agn_fits",
+    "ztf": r"C:\Users\tosee\Downloads\123\ztf_agn_r",
+    "ps1": r"C:\Users\tosee\Downloads\123\pan-star_agn_r",
+    "sdss": r"C:\Users\tosee\Downloads\123\sdss_agn_r",
+}
+MANIFEST_CSV = r"C:\Users\tosee\Downloads\123\best_cutouts.csv"
+OUTPUT_DIR = r"C:\Users\tosee\Downloads\123\best_fits_agn"
+FITS_EXTENSIONS = ('.fits', '.fit')   # the index also lists .npy files (fits_to_npy output), which have no stats
+
+# Scores take the stats table and return one value per row, higher is better
+def null_fraction_score(stats):
+    """Fewer pixels equal to the null value is better (the old copy_better_fits rule)."""
+    return 1.0 - stats["null_fraction"]
+
+def coverage_score(stats):
+    """Fraction of pixels that are neither null nor NaN."""
+    return (1.0 - stats["null_fraction"] - stats["nan_fraction"]).clip(lower=0.0)
+
+def snr_score(stats):
+    """Whole-image mean over standard deviation."""
+    return stats["snr"].fillna(0.0)
+
+SCORES = {
+    "null_fraction": null_fraction_score,
+    "coverage": coverage_score,
+    "snr": snr_score,
+}
+
+def weighted_score(weights):
+    """Build a score that is a weighted sum of named SCORES, e.g. {"coverage": 1.0, "snr": 0.05}."""
+    def score(stats):
+        return sum(w * SCORES[name](stats) for name, w in weights.items())
+    return score
+
+def select_best(stats, score=null_fraction_score, survey_order=None):
+    """
+    Pick the best FITS file per object key across any number of surveys, other files in
+    the stats (.npy) are not candidates.
+
+    Args:
+        stats (pandas.DataFrame): Per-file stats (image_index.quality_stats or fits_quality_scan).
+        score (callable or str): Vectorised score function or a name from SCORES.
+        survey_order (list, optional): Tie-break order, earlier surveys win.
+
+    Returns:
+        pandas.DataFrame: Manifest with one row per object_key.
+    """
+    if isinstance(score, str):
+        score = SCORES[score]
+    stats = stats[stats["filename"].str.endswith(FITS_EXTENSIONS)].copy()
+    if "object_key" not in stats:
+        stats["object_key"] = stats["filename"].map(lambda f: os.path.splitext(f)[0])
+
+    usable = stats["status"].eq("ok") & ~stats["is_null"].astype(bool)
+    stats["score"] = np.where(usable, score(stats).astype(float), -np.inf)
+    order = survey_order or list(dict.fromkeys(stats["survey"]))
+    stats["priority"] = stats["survey"].map({s: i for i, s in enumerate(order)}).fillna(len(order))
+    stats["n_candidates"] = stats.groupby("object_key")["path"].transform("size")
+    stats["n_usable"] = usable.groupby(stats["object_key"]).transform("sum")
+
+    best = (stats.sort_values(["object_key", "score", "priority"], ascending=[True, False, True])
+                 .drop_duplicates("object_key", keep="first"))
+    return best[["object_key", "survey", "filename", "path", "score", "n_candidates", "n_usable"]].reset_index(drop=True)
+
+def materialise(manifest, output_folder, mode="hardlink"):
+    """
+    Expose the selected files in one folder without copying bytes where possible.
+
+    Args:
+        manifest (pandas.DataFrame): Output of select_best.
+        output_folder (str): Folder to populate.
+        mode (str): "hardlink", "symlink" or "copy". Hardlinks fall back to a copy when the
+            output folder is on a different filesystem.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    linked = copied = 0
+    for row in manifest.itertuples(index=False):
+        if not np.isfinite(row.score):
+            continue
+        target = os.path.join(output_folder, row.filename)
+        if os.path.lexists(target):
+            os.remove(target)
+        try:
+            if mode == "hardlink":
+                os.link(row.path, target)
+            elif mode == "symlink":
+                os.symlink(row.path, target)
+            else:
+                raise OSError("copy requested")
+            linked += 1
+        except OSError:
+            shutil.copy2(row.path, target)
+            copied += 1
+    logging.info(f"Linked {linked} and copied {copied} files into {output_folder}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    conn = open_index(IMAGE_INDEX_DB)
+    update_all(conn, SURVEY_FOLDERS)
+    stats = quality_stats(conn, list(SURVEY_FOLDERS))
+    conn.close()
+
+    manifest = select_best(stats, "null_fraction", list(SURVEY_FOLDERS))
+    manifest.to_csv(MANIFEST_CSV, index=False)
+    logging.info(f"Selected {len(manifest)} cutouts, manifest saved to {MANIFEST_CSV}")
+    logging.info(f"Winners per survey:\n{manifest['survey'].value_counts().to_string()}")
+
+    materialise(manifest, OUTPUT_DIR, mode="hardlink")
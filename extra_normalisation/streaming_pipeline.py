@@ -0,0 +1,280 @@
+import io
+import os
+import glob
+import queue
+import logging
+import urllib.request
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from astropy.io import fits
+from array_store import ArrayStore
+from fits_quality_scan import compute_array_stats
+from intensity_stretch import stretch_stack
+from resize_images import resize_batch
+try:
+    from stage_metrics import span
+except ImportError:  # stage_metrics.py sits at the repository root, run untimed without it
+    from contextlib import nullcontext
+    from types import SimpleNamespace
+    def span(stage, **labels):
+        return nullcontext(SimpleNamespace(count=lambda items=1, **counters: None))
+
+# Configuration
+CSV_PATH = r"C:\Users\tosee\Downloads\123\data\master_optical_agncan.csv"
+STORE_DIR = r"C:\Users\tosee\Downloads\123\training\dss2_red_store"
+HIPS2FITS_URL = "https://alasky.cds.unistra.fr/hips-image-services/hips2fits"
+HIPS = "CDS/P/DSS2/red"
+FOV_DEG = 0.12
+INPUT_SHAPE = (768, 768)     # size of the downloaded / decoded cutouts
+OUTPUT_SHAPE = (128, 128)
+STRETCH = None               # None keeps raw values, or "asinh", "zscale", "linear" (intensity_stretch.py)
+FETCH_THREADS = 8
+PROCESS_WORKERS = 4
+RING_SLOTS = 16              # images buffered between two stages before the upstream stage waits
+WRITE_BATCH = 64
+STATS_CSV = "streaming_stats.csv"
+
+class SharedRing:
+    """
+    A fixed number of same-shape array slots in one shared-memory block, handed from one
+    stage to the next by slot index.
+
+    A producer acquire()s a free slot, fills it and publish()es it with its metadata, the
+    consumer get()s it and release()s it when done. acquire() blocks while every slot is
+    in use, so a slow stage holds back the stages before it instead of memory growing.
+    Messages without an image (dropped items, end of stream) are sent with send().
+    """
+
+    def __init__(self, n_slots, slot_shape, dtype="float32", ctx=None):
+        ctx = ctx or mp.get_context("spawn")
+        self.n_slots = n_slots
+        self.slot_shape = tuple(slot_shape)
+        self.dtype = np.dtype(dtype)
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=max(n_slots * int(np.prod(self.slot_shape)) * self.dtype.itemsize, 1))
+        self.name = self.shm.name
+        self.free, self.ready = ctx.Queue(), ctx.Queue()
+        for slot in range(n_slots):
+            self.free.put(slot)
+        self._slots = None
+
+    def __getstate__(self):
+        # Sent to worker processes by name, each process maps the block itself
+        state = self.__dict__.copy()
+        state["shm"] = state["_slots"] = None
+        return state
+
+    @property
+    def slots(self):
+        if self._slots is None:
+            if self.shm is None:
+                self.shm = shared_memory.SharedMemory(name=self.name)
+            self._slots = np.ndarray((self.n_slots,) + self.slot_shape, dtype=self.dtype, buffer=self.shm.buf)
+        return self._slots
+
+    def acquire(self):
+        slot = self.free.get()
+        return slot, self.slots[slot]
+
+    def publish(self, slot, meta):
+        self.ready.put((slot, meta))
+
+    def send(self, meta):
+        self.ready.put((None, meta))
+
+    def get(self, timeout=None):
+        """Next (slot, meta, view) in arrival order, slot and view are None for messages."""
+        slot, meta = self.ready.get(timeout=timeout)
+        return slot, meta, None if slot is None else self.slots[slot]
+
+    def release(self, slot):
+        self.free.put(slot)
+
+    def close(self):
+        self._slots = None
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:
+                pass  # a caller still holds a view, the mapping goes when it does
+
+    def unlink(self):
+        self.close()
+        shared_memory.SharedMemory(name=self.name).unlink()
+
+def hips2fits_url(ra, dec, hips=HIPS, shape=INPUT_SHAPE, fov_deg=FOV_DEG, base_url=HIPS2FITS_URL):
+    """hips2fits request for one cutout, the same query Image_code/Image_dss2red.py makes."""
+    query = {"hips": hips, "ra": ra, "dec": dec, "width": shape[1], "height": shape[0],
+             "fov": fov_deg, "projection": "TAN", "coordsys": "icrs", "format": "fits"}
+    return f"{base_url}?{urlencode(query)}"
+
+def catalog_tasks(csv_path=CSV_PATH, key_column="sn_name", **url_options):
+    """(key, url) download tasks for every row of a catalog with ra_deg / dec_deg."""
+    df = pd.read_csv(csv_path)
+    return [(str(key), hips2fits_url(ra, dec, **url_options))
+            for key, ra, dec in zip(df[key_column], df["ra_deg"], df["dec_deg"])]
+
+def folder_tasks(fits_folder, pattern="*.fits"):
+    """(key, path) tasks for FITS files already on disk."""
+    return [(os.path.splitext(os.path.basename(path))[0], path)
+            for path in sorted(glob.glob(os.path.join(fits_folder, pattern)))]
+
+def read_cutout(source, timeout=60):
+    """Primary HDU data of a FITS file or URL, decoded in memory, None when it has no data."""
+    if source.startswith(("http://", "https://")):
+        with urllib.request.urlopen(source, timeout=timeout) as response:
+            source = io.BytesIO(response.read())
+    with fits.open(source) as hdul:
+        data = hdul[0].data
+        return None if data is None else np.asarray(data, dtype=np.float32)
+
+def _fetch_stage(tasks, decoded, n_consumers, threads):
+    """Download / read every task into the decoded ring, then tell each consumer the stream ended."""
+
+    def fetch(task):
+        key, source = task
+        try:
+            data = read_cutout(source)
+            if data is None:
+                decoded.send({"key": key, "status": "no_data"})
+                return
+            if data.shape != decoded.slot_shape:
+                decoded.send({"key": key, "status": f"shape {data.shape}"})
+                return
+            slot, view = decoded.acquire()
+            view[...] = data
+            decoded.publish(slot, {"key": key, "status": "ok"})
+        except Exception as e:
+            decoded.send({"key": key, "status": f"error: {type(e).__name__}: {e}"})
+
+    try:
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(fetch, tasks))
+    finally:
+        for _ in range(n_consumers):
+            decoded.send(None)
+        decoded.close()
+
+def _process_stage(decoded, processed, stretch, null_value):
+    """Null check, stretch and resize each decoded image into the processed ring."""
+    try:
+        while True:
+            slot, meta, image = decoded.get()
+            if meta is None:
+                break
+            if slot is None:
+                processed.send(meta)
+                continue
+            try:
+                stats = compute_array_stats(image, null_value)
+                meta.update(stats)
+                if stats["is_null"]:
+                    meta["status"] = "null"
+                    processed.send(meta)
+                    continue
+                stack = image[None]
+                if stretch is not None:
+                    stack = stretch_stack(stack, stretch)
+                out_slot, out = processed.acquire()
+                out[...] = resize_batch(stack, processed.slot_shape)[0]
+                processed.publish(out_slot, meta)
+            except Exception as e:
+                meta["status"] = f"error: {type(e).__name__}: {e}"
+                processed.send(meta)
+            finally:
+                decoded.release(slot)
+    finally:
+        processed.send(None)
+        decoded.close()
+        processed.close()
+
+def _get(ring, workers):
+    """ring.get() that raises instead of waiting forever when a stage process died."""
+    while True:
+        try:
+            return ring.get(timeout=1)
+        except queue.Empty:
+            dead = [w.name for w in workers if w.exitcode not in (None, 0)]
+            if dead:
+                raise RuntimeError(f"Pipeline stage {', '.join(dead)} exited unexpectedly")
+
+def run_streaming_pipeline(tasks, store, input_shape=INPUT_SHAPE, stretch=STRETCH, fetch_threads=FETCH_THREADS,
+                           process_workers=PROCESS_WORKERS, ring_slots=RING_SLOTS, write_batch=WRITE_BATCH,
+                           null_value=0, stats_csv=STATS_CSV):
+    """
+    Download (or read), null-check, stretch and resize cutouts with the images kept in
+    shared memory between stages, writing only the resized arrays to `store`.
+
+    The fetch stage (one process with `fetch_threads` threads) decodes each FITS in memory
+    into a ring of `ring_slots` input-size slots, `process_workers` processes take the
+    quality stats, drop null images and stretch / resize into a second ring, and this
+    process appends the results to the ArrayStore in batches of `write_batch`. No FITS or
+    intermediate .npy is written, the per-image stats go to `stats_csv`.
+
+    Args:
+        tasks (list): (key, url or FITS path) pairs, see catalog_tasks() and folder_tasks().
+        store (array_store.ArrayStore): Output store, its sample_shape is the resize target.
+
+    Returns:
+        pandas.DataFrame: One row per task with its status ("ok", "null", "no_data",
+        a shape mismatch or an error) and quality stats.
+    """
+    ctx = mp.get_context("spawn")
+    decoded = SharedRing(ring_slots, input_shape, ctx=ctx)
+    processed = SharedRing(ring_slots, store.sample_shape, dtype=store.dtype, ctx=ctx)
+    workers = [ctx.Process(target=_fetch_stage, name="fetch", daemon=True,
+                           args=(tasks, decoded, process_workers, fetch_threads))]
+    workers += [ctx.Process(target=_process_stage, name=f"process-{i}", daemon=True,
+                            args=(decoded, processed, stretch, null_value))
+                for i in range(process_workers)]
+    rows = []
+    pending_keys, pending = [], np.empty((write_batch,) + tuple(store.sample_shape), dtype=store.dtype)
+
+    def flush():
+        store.append_batch(pending_keys, pending[:len(pending_keys)])
+        pending_keys.clear()
+
+    with span("streaming_pipeline", stretch=str(stretch)) as metrics:
+        for w in workers:
+            w.start()
+        try:
+            finished = 0
+            while finished < process_workers:
+                slot, meta, image = _get(processed, workers)
+                if meta is None:
+                    finished += 1
+                    continue
+                rows.append(meta)
+                if slot is None:
+                    metrics.count(0, **{"dropped" if meta["status"] in ("null", "no_data") else "failed": 1})
+                    continue
+                pending[len(pending_keys)] = image
+                pending_keys.append(meta["key"])
+                processed.release(slot)
+                metrics.count(1)
+                if len(pending_keys) == write_batch:
+                    flush()
+            if pending_keys:
+                flush()
+        finally:
+            for w in workers:
+                w.join(timeout=5)
+                if w.is_alive():
+                    w.terminate()
+            decoded.unlink()
+            processed.unlink()
+
+    stats = pd.DataFrame(rows)
+    if stats_csv:
+        stats.to_csv(stats_csv, index=False)
+    logging.info(f"Stored {int((stats['status'] == 'ok').sum()) if len(stats) else 0} of {len(tasks)} cutouts "
+                 f"in {store.root}")
+    return stats
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    run_streaming_pipeline(catalog_tasks(CSV_PATH), ArrayStore(STORE_DIR, sample_shape=OUTPUT_SHAPE))
@@ -0,0 +1,235 @@
+import os
+import glob
+import time
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from array_store import ArrayStore
+from compressed_arrays import CompressedArrayReader
+
+# Configuration
+DATA_SOURCE = r"C:\Users\tosee\Downloads\123\training\triplets_agn"
+BATCH_SIZE = 64
+NUM_WORKERS = 4
+PREFETCH = 8           # batches decoded ahead of the consumer
+SHUFFLE_BUFFER = 4096  # samples, 0 keeps storage order
+SEED = 42
+
+class NpyDirectorySource:
+    """Per-file `*_triplet.npy` samples exposed with the same get_batch interface as ArrayStore."""
+
+    def __init__(self, folder, pattern="*_triplet.npy", dtype="float32"):
+        self.folder = folder
+        self.files = sorted(glob.glob(os.path.join(folder, pattern)))
+        if not self.files:
+            raise ValueError(f"No files matching {pattern} in {folder}")
+        self.key_files = {os.path.basename(f).replace("_triplet.npy", "").replace(".npy", ""): f for f in self.files}
+        self.sample_shape = np.load(self.files[0], mmap_mode="r").shape
+        self.dtype = np.dtype(dtype)
+
+    def keys(self):
+        return list(self.key_files)
+
+    def get_batch(self, keys, out=None):
+        if out is None:
+            out = np.empty((len(keys),) + self.sample_shape, dtype=self.dtype)
+        for i, key in enumerate(keys):
+            out[i] = np.load(self.key_files[str(key)])
+        return out
+
+def open_source(path):
+    """Open an ArrayStore directory, a compressed array file or a folder of .npy triplets."""
+    if os.path.isfile(path):
+        return CompressedArrayReader(path)
+    if os.path.exists(os.path.join(path, "meta.json")):
+        return ArrayStore(path)
+    return NpyDirectorySource(path)
+
+def close_source(source):
+    """Release a source's open file (compressed array files keep one), if it has one."""
+    close = getattr(source, "close", None)
+    if close is not None:
+        close()
+
+def source_keys(source):
+    """Keys in storage order, so sequential reads stay sequential before shuffling."""
+    if isinstance(source, ArrayStore):
+        return source.locate()["key"].tolist()
+    keys = source.keys
+    return list(keys() if callable(keys) else keys)
+
+def epoch_order(n, seed, epoch, shuffle_buffer=SHUFFLE_BUFFER):
+    """
+    Deterministic sample order for one epoch.
+
+    With a shuffle buffer the storage order is streamed through a buffer of that many
+    samples and a random one is emitted each step, so reads stay close to sequential.
+    shuffle_buffer=None gives a full permutation, 0 keeps storage order.
+    """
+    if shuffle_buffer == 0:
+        return np.arange(n)
+    rng = np.random.default_rng([seed, epoch])
+    if shuffle_buffer is None or shuffle_buffer >= n:
+        return rng.permutation(n)
+    buffer = list(range(min(shuffle_buffer, n)))
+    order = np.empty(n, dtype=np.int64)
+    picks = rng.random(n)
+    for i in range(n):
+        j = int(picks[i] * len(buffer))
+        order[i] = buffer[j]
+        nxt = i + shuffle_buffer
+        if nxt < n:
+            buffer[j] = nxt
+        else:
+            buffer[j] = buffer[-1]
+            buffer.pop()
+    return order
+
+def _worker(path, shm_name, slot_shape, dtype, transform, seed, tasks, results):
+    """Worker loop: read the keys of one batch straight into its shared-memory slot."""
+    source = open_source(path)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray(slot_shape, dtype=dtype, buffer=shm.buf)
+    try:
+        for task in iter(tasks.get, None):
+            batch_id, slot, epoch, keys = task
+            try:
+                batch = slots[slot, :len(keys)]
+                source.get_batch(keys, out=batch)
+                if transform is not None:
+                    transform(batch, np.random.default_rng([seed, epoch, batch_id]))
+                results.put((batch_id, slot, None))
+            except Exception as e:
+                results.put((batch_id, slot, f"{type(e).__name__}: {e}"))
+    finally:
+        del slots
+        shm.close()
+        close_source(source)
+
+class TripletLoader:
+    """
+    Batches of (3, H, W) triplets from a triplet folder, ArrayStore or compressed array
+    file, read by a pool of worker processes into preallocated shared-memory batches.
+
+    Up to `prefetch` batches are in flight ahead of the consumer. Batches are yielded in
+    a deterministic order for a given seed and epoch whatever the number of workers.
+    The yielded array is a view of a reused buffer and is valid until the next batch is
+    requested, copy it to keep it.
+
+    `transform(batch, rng)` is applied in place inside the workers, it must be a
+    module-level function so it can be sent to spawned processes.
+    """
+
+    def __init__(self, path, batch_size=BATCH_SIZE, num_workers=NUM_WORKERS, prefetch=PREFETCH,
+                 shuffle_buffer=SHUFFLE_BUFFER, seed=SEED, transform=None, drop_last=False):
+        self.path = path
+        source = open_source(path)
+        self.keys = source_keys(source)
+        self.sample_shape = tuple(source.sample_shape)
+        self.dtype = np.dtype(source.dtype)
+        if num_workers == 0:
+            self.source = source
+        else:
+            # Workers open their own copy, this one was only needed for the keys and shape
+            close_source(source)
+            self.source = None
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.prefetch = max(prefetch, 1)
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.transform = transform
+        self.drop_last = drop_last
+        self.epoch = 0
+
+    def __len__(self):
+        n = len(self.keys)
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def batches(self, epoch):
+        """Key lists of every batch of an epoch."""
+        order = epoch_order(len(self.keys), self.seed, epoch, self.shuffle_buffer)
+        keys = [self.keys[i] for i in order]
+        return [keys[i * self.batch_size:(i + 1) * self.batch_size] for i in range(len(self))]
+
+    def __iter__(self):
+        epoch = self.epoch
+        self.epoch += 1
+        batches = self.batches(epoch)
+        if self.num_workers == 0:
+            yield from self._iter_inline(batches, epoch)
+        else:
+            yield from self._iter_workers(batches, epoch)
+
+    def _iter_inline(self, batches, epoch):
+        out = np.empty((self.batch_size,) + self.sample_shape, dtype=self.dtype)
+        for batch_id, keys in enumerate(batches):
+            batch = self.source.get_batch(keys, out=out[:len(keys)])
+            if self.transform is not None:
+                self.transform(batch, np.random.default_rng([self.seed, epoch, batch_id]))
+            yield keys, batch
+
+    def _iter_workers(self, batches, epoch):
+        slot_shape = (self.prefetch, self.batch_size) + self.sample_shape
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(slot_shape)) * self.dtype.itemsize)
+        slots = np.ndarray(slot_shape, dtype=self.dtype, buffer=shm.buf)
+        ctx = mp.get_context("spawn")
+        tasks, results = ctx.Queue(), ctx.Queue()
+        workers = [ctx.Process(target=_worker, daemon=True,
+                               args=(self.path, shm.name, slot_shape, self.dtype, self.transform, self.seed,
+                                     tasks, results))
+                   for _ in range(self.num_workers)]
+        for w in workers:
+            w.start()
+        try:
+            free = list(range(self.prefetch))
+            ready = {}
+            submitted = 0
+            for batch_id, keys in enumerate(batches):
+                # Keep every free slot busy, slots are released in yield order so this never stalls
+                while free and submitted < len(batches):
+                    tasks.put((submitted, free.pop(), epoch, batches[submitted]))
+                    submitted += 1
+                while batch_id not in ready:
+                    done_id, slot, error = results.get()
+                    if error is not None:
+                        raise RuntimeError(f"Loader worker failed on batch {done_id}: {error}")
+                    ready[done_id] = slot
+                slot = ready.pop(batch_id)
+                yield keys, slots[slot, :len(keys)]
+                free.append(slot)
+        finally:
+            for _ in workers:
+                tasks.put(None)
+            for w in workers:
+                w.join(timeout=5)
+                if w.is_alive():
+                    w.terminate()
+            del slots
+            try:
+                shm.close()
+            except BufferError:
+                pass  # the consumer still holds the last batch, the mapping goes when it does
+            shm.unlink()
+
+def benchmark(loader, epochs=1):
+    """Iterate `epochs` epochs and return samples per second."""
+    samples = 0
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for keys, batch in loader:
+            samples += len(keys)
+    elapsed = time.perf_counter() - start
+    rate = samples / elapsed if elapsed > 0 else float("inf")
+    logging.info(f"{samples} samples in {elapsed:.2f}s: {rate:.0f} samples/s "
+                 f"({loader.num_workers} workers, batch {loader.batch_size}, prefetch {loader.prefetch})")
+    return rate
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for workers in (0, NUM_WORKERS):
+        benchmark(TripletLoader(DATA_SOURCE, num_workers=workers))
@@ -0,0 +1,88 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# Configuration
+TRIPLET_DIR = r"C:\Users\tosee\Downloads\123\training\triplets_agn"
+CSV_PATH = r"C:\Users\tosee\Downloads\123\data\Part2_optical_agn_data.csv"
+DECIMALS = 5          # coordinates in triplet filenames are written with 5 decimals
+TOLERANCE_STEPS = 1   # accept files whose rounded coordinates differ by one last digit
+
+def parse_triplet_filename(filename):
+    """Turn `3p52473_15p24314_triplet.npy` back into (3.52473, 15.24314), None if it is not a coordinate name."""
+    stem = os.path.basename(filename)
+    if not stem.endswith("_triplet.npy"):
+        return None
+    parts = stem[:-len("_triplet.npy")].split("_")
+    if len(parts) != 2:
+        return None
+    try:
+        return float(parts[0].replace("p", ".")), float(parts[1].replace("p", "."))
+    except ValueError:
+        return None
+
+def build_registry(filenames):
+    """
+    Registry of coordinate-named triplets: filename, parsed ra/dec and the integer grid
+    keys (coordinate * 10**DECIMALS) used for matching. Names that do not parse are dropped.
+    """
+    rows = []
+    for name in filenames:
+        coords = parse_triplet_filename(name)
+        if coords is not None:
+            rows.append((os.path.basename(name),) + coords)
+    registry = pd.DataFrame(rows, columns=["filename", "ra_deg", "dec_deg"])
+    scale = 10 ** DECIMALS
+    registry["ra_key"] = np.rint(registry["ra_deg"].to_numpy() * scale).astype(np.int64)
+    registry["dec_key"] = np.rint(registry["dec_deg"].to_numpy() * scale).astype(np.int64)
+    return registry
+
+def scan_registry(triplet_dir):
+    """Build the registry from one os.scandir pass over a triplet folder."""
+    with os.scandir(triplet_dir) as entries:
+        return build_registry([e.name for e in entries if e.name.endswith("_triplet.npy")])
+
+def match_catalog(registry, ra_deg, dec_deg, tolerance_steps=TOLERANCE_STEPS):
+    """
+    Registry row matched to every catalog position, or -1 where none is within
+    `tolerance_steps` units of the last filename digit on both axes.
+
+    Catalog coordinates are put on the same integer grid as the filenames and matched
+    with a Chebyshev-distance KD-tree query, so the result does not depend on which way
+    the filename coordinates were rounded.
+    """
+    scale = 10 ** DECIMALS
+    points = np.column_stack([np.asarray(ra_deg, dtype=float) * scale, np.asarray(dec_deg, dtype=float) * scale])
+    match = np.full(len(points), -1, dtype=np.int64)
+    finite = np.isfinite(points).all(axis=1)
+    if len(registry) == 0 or not finite.any():
+        return match
+    tree = cKDTree(registry[["ra_key", "dec_key"]].to_numpy(dtype=float))
+    # +0.5 covers the rounding of the catalog value itself
+    distance, index = tree.query(points[finite], k=1, p=np.inf, distance_upper_bound=tolerance_steps + 0.5)
+    match[finite] = np.where(np.isfinite(distance), index, -1)
+    return match
+
+def missing_and_extra(registry, catalog, ra_col="ra_deg", dec_col="dec_deg"):
+    """
+    Catalog rows with no triplet file and triplet files matched by no catalog row.
+
+    Returns:
+        (pandas.DataFrame, pandas.DataFrame): Missing catalog rows (with original_index) and
+        the unmatched registry rows.
+    """
+    match = match_catalog(registry, catalog[ra_col], catalog[dec_col])
+    missing = catalog[match < 0].copy()
+    missing.insert(0, "original_index", np.flatnonzero(match < 0))
+    extra = registry.drop(index=registry.index[np.unique(match[match >= 0])])
+    return missing, extra
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    registry = scan_registry(TRIPLET_DIR)
+    catalog = pd.read_csv(CSV_PATH)
+    missing, extra = missing_and_extra(registry, catalog)
+    logging.info(f"{len(registry)} triplets, {len(catalog)} catalog rows: "
+                 f"{len(missing)} missing, {len(extra)} triplets not in the catalog")
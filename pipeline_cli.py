@@ -0,0 +1,235 @@
+import os
+import sys
+import logging
+import runpy
+import argparse
+import importlib.util
+
+# Heavy dependencies (pandas, astropy, astroquery, matplotlib, scikit-image) are only
+# imported by the pipeline scripts, and each subcommand loads just the scripts it runs.
+# Scripts import their siblings by name and still run directly from their folder; the
+# root-level stage_metrics module is optional for them (stages run untimed without it).
+# This file puts a script's folder and the repository root on sys.path, so scripts run
+# through it, or with `python pipeline_cli.py run <script> [args]`, record stage metrics.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FOLDERS = {
+    "image": os.path.join(ROOT, "Image_code"),
+    "data": os.path.join(ROOT, "data_normalisation_code"),
+    "extra": os.path.join(ROOT, "extra_normalisation"),
+}
+SURVEYS = {
+    # survey: (script, HiPS id for --store, key column)
+    "dss2_red": ("Image_dss2red.py", "CDS/P/DSS2/red", "sn_name"),
+    "ztf": ("image_ztf.py", "CDS/P/ZTF/DR7/r", "sn_name"),
+    "sdss": ("image_sdss.py", "CDS/P/SDSS9/r", "sn_name"),
+    "panstarrs": ("image_pan-starss.py", "CDS/P/PanSTARRS/DR1/r", "sn_name"),
+    "xmm": ("images_xmm.py", "xcatdb/P/XMM/PN/eb3", "obs_id"),
+    "chandra": ("image_Chandra.py", None, "obs_id"),
+}
+
+def add_script_paths(script_folder):
+    """Make a script's siblings and the repository root (stage_metrics) importable."""
+    for entry in (script_folder, ROOT):
+        if entry not in sys.path:
+            sys.path.insert(0, entry)
+
+def load_script(folder, filename):
+    """Import a pipeline script by file name (several, like Re-crossmatch.py, are not valid module names)."""
+    name = os.path.splitext(filename)[0].replace("-", "_")
+    if name in sys.modules:
+        return sys.modules[name]
+    path = os.path.join(FOLDERS[folder], filename)
+    add_script_paths(FOLDERS[folder])
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def cmd_fetch(args):
+    script, hips, key_column = SURVEYS[args.survey]
+    if args.store:
+        if hips is None:
+            raise SystemExit(f"--store needs a FITS survey, {args.survey} cutouts are PNG")
+        pipeline = load_script("extra", "streaming_pipeline.py")
+        store = load_script("extra", "array_store.py").ArrayStore(args.store, sample_shape=tuple(args.output_shape))
+        tasks = pipeline.catalog_tasks(args.csv or pipeline.CSV_PATH, args.key_column or key_column, hips=hips)
+        stats = pipeline.run_streaming_pipeline(tasks, store, stretch=args.stretch, stats_csv=args.stats_csv)
+        print(stats["status"].value_counts().to_string())
+        return
+    module = load_script("image", script)
+    module.fetch_images(args.csv or module.CSV_PATH, args.output_dir or module.OUTPUT_DIR)
+
+def cmd_crossmatch(args):
+    module = load_script("data", "Re-crossmatch.py")
+    optical, xray = args.optical or module.PATHS["optical"], args.xray or module.PATHS["xray"]
+    output = args.output or module.PATHS["output"]
+    with module.span("crossmatch", tolerance_arcsec=args.tolerance) as metrics:
+        result = module.optimal_crossmatch(optical, xray, args.tolerance)
+        metrics.count(len(result))
+    result.to_csv(output, index=False, float_format="%.7f")
+    logging.info(f"Saved {len(result)} matches to {output}")
+    if args.histogram and not result.empty:
+        module.plot_separation_histogram(result, args.histogram)
+
+def cmd_dedup(args):
+    module = load_script("data", "master_file_deduplicate.py")
+    paths = args.inputs or [module.optical_path, module.xray_path]
+    output_dir = args.output_dir or module.save_dir
+    os.makedirs(output_dir, exist_ok=True)
+    module.deduplicate_files(paths, output_dir, args.columns)
+
+def cmd_qa(args):
+    if args.science or args.reference:
+        if not (args.science and args.reference):
+            raise SystemExit("--science and --reference are needed together")
+        module = load_script("extra", "check_image_quality.py")
+        science = {f for f in os.listdir(args.science) if f.endswith(".fits")}
+        reference = {f for f in os.listdir(args.reference) if f.endswith(".fits")}
+        module.run_batch_qa(args.science, args.reference, science & reference, args.output or "triplet_evaluation_results.csv")
+        return
+    if not args.paths:
+        raise SystemExit("Give FITS files or folders to scan, or --science and --reference folders")
+    module = load_script("extra", "fits_quality_scan.py")
+    files = [p for p in args.paths if os.path.isfile(p)]
+    for folder in (p for p in args.paths if os.path.isdir(p)):
+        files.extend(module.list_fits_files(folder))
+    if len(files) == 1:
+        row = module.scan_fits_file(files[0], args.null_value)
+        print("\n".join(f"{k:>14}: {v}" for k, v in row.items()))
+        stats = module.stats_table([row])
+    else:
+        stats = module.scan_fits_files(files, args.null_value, args.workers or module.MAX_WORKERS)
+        print(f"Scanned {len(stats)} FITS files, {int(stats['is_null'].sum())} null, "
+              f"{int(stats['status'].ne('ok').sum())} unreadable")
+    if args.output:
+        stats.to_csv(args.output, index=False)
+
+def cmd_convert(args):
+    module = load_script("extra", "fits_to_npy.py")
+    module.fits_to_npy(args.fits_dir or module.FITS_INPUT_DIR, args.npy_dir or module.NPY_OUTPUT_DIR,
+                       args.stretch, args.batch_size)
+
+def cmd_validate(args):
+    module = load_script("data", "FInal_validation.py")
+    paths = dict(module.PATHS)
+    for key in paths:
+        if getattr(args, key) is not None:
+            paths[key] = getattr(args, key)
+    module.main(paths)
+
+def cmd_search(args):
+    module = load_script("data", "catalog_search.py")
+    paths = dict(module.CATALOG_PATHS)
+    for name in paths:
+        if getattr(args, name) is not None:
+            paths[name] = getattr(args, name)
+    search = module.CatalogSearch(paths)
+    if args.serve is not None:
+        search.serve(args.serve)
+        input("Press Enter to stop\n")
+        search.server.shutdown()
+        return
+    if args.ra is None or args.dec is None:
+        raise SystemExit("--ra and --dec are needed unless --serve is given")
+    if args.radius is not None:
+        result = search.cone(args.catalog, args.ra, args.dec, args.radius)
+    else:
+        result = search.nearest(args.catalog, args.ra, args.dec, args.nearest, args.max)
+    print(result.to_string(index=False))
+
+def cmd_run(args):
+    path = os.path.abspath(args.script)
+    add_script_paths(os.path.dirname(path))
+    sys.argv = [path] + args.script_args
+    runpy.run_path(path, run_name="__main__")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Transient / X-ray crossmatch and cutout pipeline")
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--metrics-file", help="append stage metrics to this JSONL (default: PIPELINE_METRICS_FILE, none otherwise)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    stretches = ["asinh", "zscale", "linear"]
+
+    p = sub.add_parser("fetch", help="download cutouts for a catalog")
+    p.add_argument("--survey", choices=list(SURVEYS), default="dss2_red")
+    p.add_argument("--csv", help="catalog with ra_deg / dec_deg")
+    p.add_argument("--output-dir", help="folder for the FITS / PNG cutouts")
+    p.add_argument("--store", help="stream into this ArrayStore instead (no FITS written), see streaming_pipeline.py")
+    p.add_argument("--output-shape", type=int, nargs=2, default=[128, 128], help="with --store")
+    p.add_argument("--stretch", choices=stretches, help="with --store")
+    p.add_argument("--key-column", help="with --store, defaults to sn_name or obs_id")
+    p.add_argument("--stats-csv", default="streaming_stats.csv", help="with --store")
+    p.set_defaults(func=cmd_fetch)
+
+    p = sub.add_parser("crossmatch", help="1:1 optical / X-ray crossmatch (Re-crossmatch.py)")
+    p.add_argument("--optical")
+    p.add_argument("--xray")
+    p.add_argument("--output")
+    p.add_argument("--tolerance", type=float, default=45.0, help="arcsec")
+    p.add_argument("--histogram", help="also save the separation histogram here")
+    p.set_defaults(func=cmd_crossmatch)
+
+    p = sub.add_parser("dedup", help="drop duplicate coordinates, keeping the most complete row")
+    p.add_argument("inputs", nargs="*", help="CSV files (default: the master optical and X-ray tables)")
+    p.add_argument("--output-dir")
+    p.add_argument("--columns", nargs="+", default=["ra_deg", "dec_deg"])
+    p.set_defaults(func=cmd_dedup)
+
+    p = sub.add_parser("qa", help="FITS quality stats, or science / reference triplet QA")
+    p.add_argument("paths", nargs="*", help="FITS files or folders to scan")
+    p.add_argument("--science", help="science FITS folder for triplet QA")
+    p.add_argument("--reference", help="reference FITS folder for triplet QA")
+    p.add_argument("--output", help="CSV for the stats / QA table")
+    p.add_argument("--null-value", type=float, default=0)
+    p.add_argument("--workers", type=int)
+    p.set_defaults(func=cmd_qa)
+
+    p = sub.add_parser("convert", help="FITS to .npy, optionally stretched")
+    p.add_argument("fits_dir", nargs="?")
+    p.add_argument("npy_dir", nargs="?")
+    p.add_argument("--stretch", choices=stretches)
+    p.add_argument("--batch-size", type=int, default=64)
+    p.set_defaults(func=cmd_convert)
+
+    p = sub.add_parser("validate", help="check the crossmatch against the master tables (FInal_validation.py)")
+    p.add_argument("--crossmatch")
+    p.add_argument("--optical")
+    p.add_argument("--xray")
+    p.add_argument("--final-optical", dest="final_optical")
+    p.add_argument("--final-xray", dest="final_xray")
+    p.add_argument("--output-dir", dest="output_plots")
+    p.set_defaults(func=cmd_validate)
+
+    p = sub.add_parser("search", help="cone / nearest search of the master catalogs (catalog_search.py)")
+    p.add_argument("--catalog", choices=["optical", "xmm", "chandra"], default="xmm")
+    p.add_argument("--ra", type=float, help="deg")
+    p.add_argument("--dec", type=float, help="deg")
+    p.add_argument("--radius", type=float, help="cone radius in arcsec, otherwise the nearest rows are returned")
+    p.add_argument("--nearest", type=int, default=1, help="number of nearest rows without --radius")
+    p.add_argument("--max", type=float, help="only nearest rows within this many arcsec")
+    p.add_argument("--serve", type=int, nargs="?", const=9110, help="run the HTTP service on this port instead")
+    p.add_argument("--optical")
+    p.add_argument("--xmm")
+    p.add_argument("--chandra")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("run", help="run any pipeline script as __main__ with its imports set up")
+    p.add_argument("script")
+    p.add_argument("script_args", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_run)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.metrics_file:
+        # Read by stage_metrics when the first script imports it
+        os.environ["PIPELINE_METRICS_FILE"] = args.metrics_file
+        if "stage_metrics" in sys.modules:
+            sys.modules["stage_metrics"].METRICS.path = args.metrics_file
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
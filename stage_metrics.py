@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import psutil
+except ImportError:  # optional, needed for peak memory on Windows and for network bytes
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Configuration
+METRICS_FILE = os.environ.get("PIPELINE_METRICS_FILE")   # spans are only written to a file when this is set
+METRICS_PORT = 9108
+RUN_ID = f"{socket.gethostname()}-{os.getpid()}-{int(time.time())}"
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, None when it cannot be read."""
+    if resource is not None:
+        # ru_maxrss is in bytes on macOS and in KB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+    if psutil is not None and sys.platform == "win32":
+        return psutil.Process().memory_info().peak_wset / 2 ** 20
+    return None
+
+def network_bytes():
+    """(sent, received) bytes of the machine so far, None without psutil."""
+    if psutil is None:
+        return None
+    counters = psutil.net_io_counters()
+    return counters.bytes_sent, counters.bytes_recv
+
+class Span:
+    """One timed stage. count() adds processed items (rows, images, triplets) for throughput."""
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.items = 0
+        self.counters = {}
+
+    def count(self, items=1, **counters):
+        self.items += items
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+class MetricsRecorder:
+    """
+    Collects finished spans, appends each as one JSON line to `path` (when one is set) and
+    keeps running per-stage totals for the HTTP endpoint.
+    """
+
+    def __init__(self, path=METRICS_FILE, run_id=RUN_ID):
+        self.path = path
+        self.run_id = run_id
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.server = None
+
+    @contextmanager
+    def span(self, stage, **labels):
+        span = Span(stage, labels)
+        net_start = network_bytes()
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            record = {
+                "run_id": self.run_id, "stage": stage, "labels": labels, "start": time.time() - seconds,
+                "seconds": seconds, "cpu_seconds": time.process_time() - cpu_start,
+                "items": span.items, "items_per_second": span.items / seconds if seconds > 0 else None,
+                "peak_rss_mb": peak_rss_mb(), "error": error, **span.counters,
+            }
+            net_end = network_bytes()
+            if net_start is not None and net_end is not None:
+                record["net_bytes_sent"] = net_end[0] - net_start[0]
+                record["net_bytes_recv"] = net_end[1] - net_start[1]
+            self.record(record)
+
+    def record(self, record):
+        with self.lock:
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+            totals = self.totals.setdefault(record["stage"], {"runs": 0, "seconds": 0.0, "items": 0, "errors": 0})
+            totals["runs"] += 1
+            totals["seconds"] += record["seconds"]
+            totals["items"] += record["items"]
+            totals["errors"] += record["error"] is not None
+            totals["last"] = record
+
+    def timed(self, stage=None, **labels):
+        """Decorator form of span(), the stage defaults to the function name."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage or func.__name__, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self.lock:
+            return {"run_id": self.run_id, "peak_rss_mb": peak_rss_mb(),
+                    "stages": json.loads(json.dumps(self.totals))}
+
+    def serve(self, port=METRICS_PORT, host="127.0.0.1"):
+        """Serve snapshot() as JSON on http://host:port/metrics from a daemon thread."""
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = json.dumps(recorder.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logging.info(f"Metrics served on http://{host}:{self.server.server_address[1]}/metrics")
+        return self.server
+
+# Shared recorder used by the pipeline scripts
+METRICS = MetricsRecorder()
+span = METRICS.span
+timed = METRICS.timed
+
+def load_metrics(path=METRICS_FILE):
+    """Read a metrics file into a DataFrame, one row per span."""
+    import pandas as pd
+    with open(path) as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+def stage_summary(records):
+    """
+    Per-stage comparison of the latest run with all earlier runs: median seconds and
+    items/s, latest values and the slowdown ratio, slowest stages first.
+    """
+    import pandas as pd
+    latest_run = records.sort_values("start")["run_id"].iloc[-1]
+    latest = records[records["run_id"] == latest_run].groupby("stage")[["seconds", "items_per_second", "peak_rss_mb"]].median()
+    history = records[records["run_id"] != latest_run].groupby("stage")[["seconds", "items_per_second"]].median()
+    summary = latest.join(history, rsuffix="_median", how="left")
+    summary["slowdown"] = summary["seconds"] / summary["seconds_median"]
+    return summary.sort_values("seconds", ascending=False)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    path = sys.argv[1] if len(sys.argv) > 1 else METRICS_FILE
+    if not path:
+        raise SystemExit("Give a metrics file or set PIPELINE_METRICS_FILE")
+    print(stage_summary(load_metrics(path)).to_string())